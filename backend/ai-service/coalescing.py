@@ -0,0 +1,123 @@
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def prompt_fingerprint(messages: List[Dict[str, str]], **params) -> str:
+    """Identity of an upstream call: identical messages and sampling params share one completion."""
+    payload = json.dumps({"messages": messages, "params": params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class _StreamBroadcast:
+    """
+    Fan-out buffer for one upstream stream. A pump task reads the source once and appends
+    chunks to a buffer; each subscriber replays the buffer from the start and then follows
+    new chunks, so late joiners still receive the whole response.
+    """
+
+    def __init__(self, source: AsyncIterator[str], on_close: Callable[["_StreamBroadcast"], None]):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._on_close = on_close
+        self._changed = asyncio.Event()
+        self._task = asyncio.create_task(self._pump(source))
+
+    def _notify(self) -> None:
+        # Wake everyone waiting on the current event and hand out a fresh one
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _pump(self, source: AsyncIterator[str]) -> None:
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            await source.aclose()
+            self.done = True
+            self._on_close(self)
+            self._notify()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        self.subscribers += 1
+        position = 0
+        try:
+            while True:
+                if position < len(self.chunks):
+                    position += 1
+                    yield self.chunks[position - 1]
+                    continue
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                # Everyone disconnected: stop paying for tokens nobody will read
+                self._on_close(self)
+                self._task.cancel()
+
+
+class RequestCoalescer:
+    """
+    Single-flight deduplication for upstream model calls. Concurrent requests with the same
+    key share one completion (run) or one chunk stream (stream); the entry is dropped as soon
+    as the call finishes, so nothing is cached here (see response_cache for that).
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self._streams: Dict[str, _StreamBroadcast] = {}
+        self.stats = {"calls": 0, "coalesced_calls": 0, "streams": 0, "coalesced_streams": 0}
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            self.stats["calls"] += 1
+            task = asyncio.ensure_future(factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._finish_call(key, t))
+        else:
+            self.stats["coalesced_calls"] += 1
+            logger.info(f"Solicitud de IA unida a una llamada en curso ({key[:12]})")
+        # shield: a disconnecting client must not cancel the call other requests are waiting on
+        return await asyncio.shield(task)
+
+    def _finish_call(self, key: str, task: asyncio.Future) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # Retrieved here so an error nobody awaited is not logged as lost
+
+    def stream(self, key: str, factory: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            self.stats["streams"] += 1
+            broadcast = _StreamBroadcast(factory(), on_close=lambda b: self._finish_stream(key, b))
+            self._streams[key] = broadcast
+        else:
+            self.stats["coalesced_streams"] += 1
+            logger.info(f"Stream de IA unido a uno en curso ({key[:12]}, {len(broadcast.chunks)} chunks en buffer)")
+        return broadcast.subscribe()
+
+    def _finish_stream(self, key: str, broadcast: _StreamBroadcast) -> None:
+        if self._streams.get(key) is broadcast:
+            del self._streams[key]
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "in_flight_calls": len(self._calls),
+            "in_flight_streams": len(self._streams),
+        }
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+from azure.ai.inference.aio import ChatCompletionsClient
+from azure.core.credentials import AzureKeyCredential
+from azure.core.exceptions import HttpResponseError, ServiceRequestError, ServiceResponseError
+
+from prompt_budget import AI_MAX_RESPONSE_TOKENS, CHARS_PER_TOKEN, estimate_messages_tokens, estimate_tokens
+from retry_policy import (
+    AI_ATTEMPT_TIMEOUT_SECONDS,
+    AI_REQUEST_DEADLINE_SECONDS,
+    LatencyTracker,
+    call_with_retries,
+    hedged,
+)
+from scheduling import TokenBucketScheduler, TokenUsageMetrics
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of model requests (including open streams) in flight per process.
+# Requests beyond the cap wait for a slot instead of piling onto the upstream API.
+AI_MAX_CONCURRENT_REQUESTS = int(os.getenv("AI_MAX_CONCURRENT_REQUESTS", 8))
+DEFAULT_RETRY_AFTER_SECONDS = 10.0
+# Throttling and transient server/gateway failures; anything else (bad request, auth,
+# content filter) fails the same way on every attempt.
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    if isinstance(error, HttpResponseError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    # Connection refused/reset or a response cut off mid-way
+    return isinstance(error, (ServiceRequestError, ServiceResponseError))
+
+
+class LLMClient:
+    """
+    Non-blocking access to the chat model. Uses the async azure.ai.inference client, so
+    waiting on the model (or on the next stream chunk) never blocks the event loop.
+    Calls go through the optional rate scheduler and their token usage is recorded per endpoint.
+
+    Every upstream attempt has its own timeout and only retryable failures are retried, all
+    within one overall deadline. With a secondary_model configured, a completion that takes
+    longer than the primary's recent latency percentile is hedged with a request to it.
+    """
+
+    def __init__(self, endpoint: str, token: str, model: str, max_concurrency: int = AI_MAX_CONCURRENT_REQUESTS,
+                 scheduler: Optional[TokenBucketScheduler] = None, usage: Optional[TokenUsageMetrics] = None,
+                 secondary_model: Optional[str] = None, attempt_timeout: float = AI_ATTEMPT_TIMEOUT_SECONDS,
+                 deadline: float = AI_REQUEST_DEADLINE_SECONDS):
+        self.model = model
+        self.secondary_model = secondary_model or None
+        self.max_concurrency = max_concurrency
+        self.scheduler = scheduler
+        self.usage = usage or TokenUsageMetrics()
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self.latency = LatencyTracker()
+        self.hedge_stats = {"hedged": 0, "secondary_wins": 0}
+        self._client = ChatCompletionsClient(endpoint=endpoint, credential=AzureKeyCredential(token))
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _admit(self, messages: List[Dict[str, str]], params: dict) -> int:
+        """Reserves rate-limit capacity for the call; returns the estimated total tokens."""
+        estimated = estimate_messages_tokens(messages) + params.get("max_tokens", AI_MAX_RESPONSE_TOKENS)
+        if self.scheduler is not None:
+            await self.scheduler.acquire(estimated)
+        return estimated
+
+    def _on_http_error(self, error: HttpResponseError) -> None:
+        if error.status_code == 429 and self.scheduler is not None:
+            headers = error.response.headers if error.response is not None else {}
+            try:
+                retry_after = float(headers.get("Retry-After", DEFAULT_RETRY_AFTER_SECONDS))
+            except ValueError:
+                retry_after = DEFAULT_RETRY_AFTER_SECONDS
+            self.scheduler.penalize(retry_after)
+
+    async def _open(self, model: str, messages: List[Dict[str, str]], **params):
+        """One upstream request, bounded by the per-attempt timeout. Caller holds a slot."""
+        try:
+            return await asyncio.wait_for(
+                self._client.complete(model=model, messages=messages, **params), timeout=self.attempt_timeout
+            )
+        except HttpResponseError as e:
+            self._on_http_error(e)
+            raise
+
+    async def complete(self, messages: List[Dict[str, str]], endpoint: str = "default", **params) -> str:
+        """Returns the full response text of a non-streaming completion."""
+        deadline = asyncio.get_running_loop().time() + self.deadline
+
+        def with_retries(model: str):
+            return call_with_retries(
+                lambda: self._complete_once(model, messages, endpoint, params), is_retryable_error, deadline
+            )
+
+        if not self.secondary_model:
+            return await with_retries(self.model)
+
+        async def secondary():
+            self.hedge_stats["hedged"] += 1
+            return await with_retries(self.secondary_model)
+
+        content, used_secondary = await hedged(lambda: with_retries(self.model), secondary, self.latency.hedge_delay())
+        if used_secondary:
+            self.hedge_stats["secondary_wins"] += 1
+            logger.info(f"Respuesta servida por el modelo secundario {self.secondary_model} ({endpoint})")
+        return content
+
+    async def _complete_once(self, model: str, messages: List[Dict[str, str]], endpoint: str, params: dict) -> str:
+        estimated = await self._admit(messages, params)
+        async with self._semaphore:
+            started = time.monotonic()
+            response = await self._open(model, messages, **params)
+        if model == self.model:
+            self.latency.observe(time.monotonic() - started)
+        content = (response.choices[0].message.content or "").strip() if response.choices else ""
+        if response.usage:
+            prompt_tokens, completion_tokens = response.usage.prompt_tokens, response.usage.completion_tokens
+            self.usage.record(endpoint, prompt_tokens, completion_tokens)
+        else:
+            prompt_tokens, completion_tokens = estimate_messages_tokens(messages), estimate_tokens(content)
+            self.usage.record(endpoint, prompt_tokens, completion_tokens, estimated=True)
+        if self.scheduler is not None:
+            self.scheduler.settle(estimated, prompt_tokens + completion_tokens)
+        return content
+
+    async def stream(self, messages: List[Dict[str, str]], endpoint: str = "default", **params) -> AsyncIterator[str]:
+        """
+        Yields content deltas as they arrive. The concurrency slot is held until the stream
+        is exhausted or the consumer closes the generator (e.g. the client disconnected).
+        """
+        estimated = await self._admit(messages, params)
+        streamed_chars = 0
+        deadline = asyncio.get_running_loop().time() + self.deadline
+        async with self._semaphore:
+            # Opening the stream is retried like a completion; once chunks flow nothing is retried
+            response = await call_with_retries(
+                lambda: self._open(self.model, messages, stream=True, **params), is_retryable_error, deadline
+            )
+            try:
+                async for chunk in response:
+                    if chunk.choices:
+                        delta = chunk.choices[0].delta
+                        if delta and delta.content:
+                            streamed_chars += len(delta.content)
+                            yield delta.content
+            finally:
+                await response.close()
+                # Streamed responses carry no usage block: estimate from what was sent and received
+                prompt_tokens = estimate_messages_tokens(messages)
+                completion_tokens = math.ceil(streamed_chars / CHARS_PER_TOKEN)
+                self.usage.record(endpoint, prompt_tokens, completion_tokens, estimated=True)
+                if self.scheduler is not None:
+                    self.scheduler.settle(estimated, prompt_tokens + completion_tokens)
+
+    async def close(self) -> None:
+        await self._client.close()
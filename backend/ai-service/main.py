@@ -1,15 +1,19 @@
 import os
+import asyncio
 import logging
 from typing import List, Optional, Dict, Any
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-from azure.ai.inference import ChatCompletionsClient
-from azure.core.credentials import AzureKeyCredential
-from fastapi.responses import StreamingResponse
-import asyncio # Ensure asyncio is imported
-import anyio # Import anyio for to_thread
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from llm_client import LLMClient
+from response_cache import build_response_cache, make_cache_key
+from coalescing import RequestCoalescer, prompt_fingerprint
+from prompt_budget import AI_MAX_RESPONSE_TOKENS, fit_chat_sections
+from retry_policy import DeadlineExceeded
+from scheduling import RateLimitExceeded, TokenBucketScheduler
+from static_feedback_client import StaticFeedbackClient, format_static_feedback
 
 # --- Configuration ---
 
@@ -31,11 +35,25 @@ logger.info(f"SYSTEM_PROMPT configurado: {SYSTEM_PROMPT[:50]}..." if len(SYSTEM_
 # Endpoint for GitHub Models API (see docs)
 GITHUB_MODELS_ENDPOINT = os.getenv("GITHUB_MODELS_ENDPOINT", "https://models.github.ai/inference") # Added default
 MODEL_NAME = os.getenv("GITHUB_MODELS_MODEL", "openai/gpt-4.1-mini")  # Added default and changed env var name for consistency
+# Optional second model for hedged requests when the primary is slower than usual (empty = off)
+SECONDARY_MODEL_NAME = os.getenv("GITHUB_MODELS_SECONDARY_MODEL", "")
+
+# Async client: model calls and stream chunks are awaited, never run on the event loop thread.
+# The scheduler queues or sheds calls before the upstream rate limits answer with 429.
+llm = LLMClient(
+    endpoint=GITHUB_MODELS_ENDPOINT, token=GITHUB_TOKEN, model=MODEL_NAME,
+    scheduler=TokenBucketScheduler(), secondary_model=SECONDARY_MODEL_NAME,
+)
+
+# Answers for the same (normalized) code, error class and instruction are reused instead of
+# paying for another model call. Backend: AI_CACHE_BACKEND (auto | redis | sqlite | none).
+response_cache = build_response_cache()
 
-client = ChatCompletionsClient(
-    endpoint=GITHUB_MODELS_ENDPOINT,
-    credential=AzureKeyCredential(GITHUB_TOKEN),
-) # Removed model=MODEL_NAME from client instantiation, will pass it in complete()
+# Identical prompts that arrive while the first one is still running share its upstream call
+coalescer = RequestCoalescer()
+
+# Rule-based review from execution-service; answers first (or alone) for cheap issues
+static_feedback = StaticFeedbackClient()
 
 # --- Pydantic Models ---
 
@@ -56,6 +74,11 @@ class CodeFeedbackRequest(BaseModel):
     challenge_description: Optional[str] = None
     level: str = Field(default="beginner", pattern="^(beginner|intermediate|advanced)$")
 
+class FeedbackRequest(CodeFeedbackRequest):
+    # full: rule-based suggestions plus the model's review
+    # local_only: skip the model when the rules found only trivial issues (syntax, style)
+    mode: str = Field(default="full", pattern="^(full|local_only)$")
+
 class ChatStreamRequest(BaseModel):
     """Model for the streaming chat endpoint, accepting either a query or code."""
     query: Optional[str] = None
@@ -70,33 +93,46 @@ class AIResponse(BaseModel):
 
 # --- AI Interaction Logic ---
 
-retry_decorator = retry(
-    stop=stop_after_attempt(3),
-    wait=wait_exponential(multiplier=1, min=2, max=10),
-    retry=retry_if_exception_type(Exception)
-)
-
-@retry_decorator
-async def generate_ai_response(prompt: str, model_name: str = MODEL_NAME) -> Dict[str, Any]: # Added model_name parameter
+# Retries, per-attempt timeouts, the overall deadline and hedging live in LLMClient
+async def generate_ai_response(prompt: str, model_name: str = MODEL_NAME, endpoint: str = "default") -> Dict[str, Any]: # Added model_name parameter
     try:
-        response = client.complete( # Pass model_name here
-            model=model_name,
+        content = await llm.complete(
             messages=[
                 {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
-            max_tokens=1024,
+            endpoint=endpoint,
+            max_tokens=AI_MAX_RESPONSE_TOKENS,
             temperature=0.7,
         )
-        # Check if choices exist and are not empty
-        if response.choices and len(response.choices) > 0:
-            content = response.choices[0].message.content.strip()
-            return {"content": content}
-        else:
-            return {"content": ""} # Return empty content or handle as an error
+        return {"content": content}
+    except DeadlineExceeded:
+        logger.error(f"El modelo {model_name} no respondió dentro del plazo ({endpoint})")
+        raise HTTPException(status_code=504, detail="El asistente de IA tardó demasiado en responder. Intenta de nuevo.")
     except Exception as e:
         if hasattr(e, 'response') and e.response is not None:
             raise HTTPException(status_code=502, detail=f"GitHub Models API Error with {model_name}: {str(e)}")
+        raise
+
+async def cached_ai_response(endpoint: str, prompt: str, level: str = "", code: Optional[str] = None,
+                             error: Optional[str] = None, instruction: Optional[str] = None,
+                             extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    generate_ai_response behind the response cache. On a miss, concurrent requests with the
+    same cache key share one model call. Only successful answers are stored.
+    """
+    key = make_cache_key(endpoint, MODEL_NAME, level=level, code=code, error=error, instruction=instruction, extra=extra)
+    cached = await response_cache.get(key, endpoint)
+    if cached is not None:
+        logger.info(f"Respuesta de IA servida desde caché ({endpoint})")
+        return cached
+    return await coalescer.run(key, lambda: _generate_and_store(key, prompt, endpoint))
+
+async def _generate_and_store(key: str, prompt: str, endpoint: str) -> Dict[str, Any]:
+    response_data = await generate_ai_response(prompt, endpoint=endpoint)
+    if response_data.get("content"):
+        await response_cache.set(key, response_data)
+    return response_data
 
 # --- FastAPI Application ---
 
@@ -106,6 +142,19 @@ app = FastAPI(
     version="2.0.0"
 )
 
+@app.on_event("shutdown")
+async def close_llm_client():
+    await llm.close()
+    await static_feedback.close()
+
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_exceeded_handler(request, exc: RateLimitExceeded):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "El asistente de IA está recibiendo demasiadas solicitudes. Intenta de nuevo en unos segundos."},
+        headers={"Retry-After": str(max(1, round(exc.retry_after)))},
+    )
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -121,6 +170,26 @@ async def health_check():
     """Checks if the service is running."""
     return {"status": "healthy"}
 
+@app.get("/cache/stats", tags=["Infrastructure"])
+def cache_stats():
+    """Hit rate of the AI response cache, overall and per endpoint, since the process started."""
+    return response_cache.report()
+
+@app.get("/coalescing/stats", tags=["Infrastructure"])
+async def coalescing_stats():
+    """Upstream calls started vs. requests that joined an identical call already in flight."""
+    return coalescer.report()
+
+@app.get("/usage/stats", tags=["Infrastructure"])
+async def usage_stats():
+    """Token usage per endpoint and the state of the client-side rate limiter."""
+    return {
+        "tokens": llm.usage.report(),
+        "rate_limit": llm.scheduler.report() if llm.scheduler else None,
+        "hedging": {"secondary_model": llm.secondary_model, **llm.hedge_stats},
+        "static_feedback": static_feedback.stats,
+    }
+
 @app.post("/hint", response_model=AIResponse, tags=["Code Assistance"])
 async def get_hint(request: HintRequest):
     """Provides a hint for the given Python code and context."""
@@ -139,7 +208,10 @@ async def get_hint(request: HintRequest):
     Focus on explaining the underlying concepts or suggesting specific areas to check.
     Do NOT provide the corrected code or the full solution. Keep the hint focused and actionable for a {request.difficulty} learner.
     """
-    response_data = await generate_ai_response(user_message)
+    response_data = await cached_ai_response(
+        "hint", user_message, level=request.difficulty, code=request.code,
+        error=request.error, instruction=request.instruction,
+    )
     return AIResponse(**response_data) # Unpack dict into the model
 
 @app.post("/evaluate", response_model=AIResponse, tags=["Code Assistance"])
@@ -175,13 +247,14 @@ async def evaluate_solution(request: SolutionEvaluationRequest):
     3. If Correct: Briefly confirm correctness and perhaps offer a small note on good practices if applicable.
     Keep the explanation clear and educational.
     """
-    response_data = await generate_ai_response(prompt)
+    response_data = await cached_ai_response(
+        "evaluate", prompt, code=request.code, instruction=request.description,
+        extra={"expected_output": request.expected_output, "actual_output": request.actual_output},
+    )
     return AIResponse(**response_data)
 
-@app.post("/feedback", response_model=AIResponse, tags=["Code Assistance"])
-async def get_code_feedback(request: CodeFeedbackRequest):
-    """Provides feedback on Python code quality, style, and potential improvements."""
-    prompt = f"""
+def build_feedback_prompt(request: CodeFeedbackRequest) -> str:
+    return f"""
     Act as an AI code reviewer providing feedback to a Python learner at the {request.level} level.
 
     Analyze the following Python code:
@@ -199,40 +272,105 @@ async def get_code_feedback(request: CodeFeedbackRequest):
 
     Format your feedback clearly. Be encouraging and educational. Avoid overwhelming the learner with overly advanced concepts unless directly relevant and explained simply.
     """
-    response_data = await generate_ai_response(prompt)
-
-    # --- Rule-based Suggestions (kept from original, can be refined) ---
-    # These are simple examples; more sophisticated static analysis or
-    # asking the LLM for suggestions could be alternatives.
-    suggestions = []
-    code_lines = request.code.strip().split('\n')
-    is_beginner = "beginner" in request.level.lower()
-    is_intermediate_or_advanced = not is_beginner
-
-    # Beginner suggestions
-    if is_beginner:
-        has_print = any("print(" in line for line in code_lines)
-        has_def = any(line.strip().startswith("def ") for line in code_lines)
-        if has_print and not has_def and len(code_lines) > 3:
-             suggestions.append("Consider wrapping your main logic in a function (e.g., `def main(): ...`) for better organization and reusability.")
-        if len(code_lines) > 10 and not has_def:
-             suggestions.append("As your code grows, think about breaking it down into smaller, manageable functions.")
-
-    # Intermediate/Advanced suggestions
-    if is_intermediate_or_advanced:
-        has_class = any(line.strip().startswith("class ") for line in code_lines)
-        if not has_class and len(code_lines) > 20: # Threshold adjusted
-             suggestions.append("For more complex logic or data structures, consider using classes to organize related data and functions (Object-Oriented Programming).")
-        has_open = any("open(" in line for line in code_lines)
-        has_with = any("with open(" in line for line in code_lines)
-        if has_open and not has_with:
-             suggestions.append("When working with files (`open()`), it's best practice to use a `with` statement to ensure the file is automatically closed, even if errors occur.")
-
-    # Add suggestions to the response
-    response_data["suggestions"] = suggestions
-    # Ensure the AIResponse model can handle the data
+
+def local_only_answer(request: FeedbackRequest, static: Optional[Dict[str, Any]]) -> bool:
+    """local_only mode skips the model when every issue found is one the rules fully explain."""
+    if request.mode != "local_only" or not static or not static["trivial_only"]:
+        return False
+    static_feedback.stats["local_only_answers"] += 1
+    logger.info("Feedback respondido solo con el análisis estático, sin llamar al modelo")
+    return True
+
+@app.post("/feedback", response_model=AIResponse, tags=["Code Assistance"])
+async def get_code_feedback(request: FeedbackRequest):
+    """Provides feedback on Python code quality, style, and potential improvements."""
+    # The rule-based analysis runs alongside the model call instead of after it
+    static_task = asyncio.create_task(static_feedback.analyze(request.code, request.level))
+    if request.mode == "local_only":
+        static = await static_task
+        if local_only_answer(request, static):
+            return AIResponse(content=format_static_feedback(static), suggestions=static["suggestions"])
+
+    # Only the model's text is cached; the rule-based suggestions are cheap and recomputed
+    try:
+        response_data = dict(await cached_ai_response(
+            "feedback", build_feedback_prompt(request), level=request.level, code=request.code,
+            instruction=request.challenge_description,
+        ))
+    except BaseException:
+        static_task.cancel()
+        raise
+
+    static = await static_task
+    response_data["suggestions"] = static["suggestions"] if static else []
     return AIResponse(**response_data)
 
+@app.post("/feedback/stream", tags=["Code Assistance"])
+async def feedback_stream(request: FeedbackRequest):
+    """
+    Streams the rule-based review and the model's feedback, both started at once; the review
+    goes first unless the model answers before it is back. In local_only mode trivial issues
+    are answered without calling the model.
+    """
+    # The rule-based analysis runs alongside the model stream instead of delaying its start
+    static_task = asyncio.create_task(static_feedback.analyze(request.code, request.level))
+    if request.mode == "local_only":
+        static = await static_task
+        if local_only_answer(request, static):
+            async def local_only():
+                yield format_static_feedback(static)
+            return StreamingResponse(local_only(), media_type="text/event-stream")
+
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": build_feedback_prompt(request)}
+    ]
+    stream_params = {"max_tokens": AI_MAX_RESPONSE_TOKENS, "temperature": 0.7}
+    response_stream = coalescer.stream(
+        prompt_fingerprint(messages, model=MODEL_NAME, **stream_params),
+        lambda: llm.stream(messages=messages, endpoint="feedback_stream", **stream_params),
+    )
+
+    def local_text() -> str:
+        static = static_task.result()
+        return format_static_feedback(static) if static and static["issues"] else ""
+
+    async def streamer():
+        first_chunk = asyncio.ensure_future(response_stream.__anext__())
+        local_sent = False
+        try:
+            await asyncio.wait({static_task, first_chunk}, return_when=asyncio.FIRST_COMPLETED)
+            if static_task.done():
+                local_sent = True
+                text = local_text()
+                if text:
+                    yield f"{text}\n\n"
+            try:
+                yield await first_chunk
+            except StopAsyncIteration:
+                pass
+            else:
+                async for content in response_stream:
+                    yield content
+            if not local_sent:
+                await static_task
+                text = local_text()
+                if text:
+                    yield f"\n\n{text}"
+        except RateLimitExceeded:
+            yield "El asistente de IA está recibiendo demasiadas solicitudes. Intenta de nuevo en unos segundos."
+        except Exception as e:
+            logger.error(f"Error durante el streaming del feedback: {str(e)}")
+            yield f"Error: {str(e)}"
+        finally:
+            static_task.cancel()
+            # The stream cannot be closed while a pending read is still running on it
+            first_chunk.cancel()
+            await asyncio.gather(first_chunk, return_exceptions=True)
+            await response_stream.aclose()
+
+    return StreamingResponse(streamer(), media_type="text/event-stream")
+
 @app.post("/explain", response_model=AIResponse, tags=["Code Assistance"])
 async def explain_code(request: CodeFeedbackRequest):
     """Explains a piece of Python code line by line or concept by concept."""
@@ -252,7 +390,7 @@ async def explain_code(request: CodeFeedbackRequest):
     - Any relevant programming concepts demonstrated (e.g., loops, functions, data types, specific library usage).
     - Keep the explanation appropriate for a {request.level} understanding. Avoid jargon where possible or explain it clearly.
     """
-    response_data = await generate_ai_response(prompt)
+    response_data = await cached_ai_response("explain", prompt, level=request.level, code=request.code)
     return AIResponse(**response_data)
 
 
@@ -264,28 +402,40 @@ async def chat_stream(request: ChatStreamRequest):
     """
     logger.info(f"Recibida solicitud de chat: query={request.query}, tiene código={bool(request.code)}")
     
+    # --- Presupuesto de tokens ---
+    # Cada sección se recorta a su límite; la lección conserva las secciones más relacionadas
+    # con la pregunta y el código del alumno dentro del presupuesto restante.
+    sections, section_tokens, truncated = fit_chat_sections(
+        query=request.query, code=request.code, instruction=request.instruction,
+        lesson_context=request.lesson_context, starter_code=request.starter_code,
+    )
+    if truncated:
+        logger.info(f"Secciones recortadas por presupuesto de tokens: {truncated} (estimado por sección: {section_tokens})")
+    query, code, instruction = sections["query"], sections["code"], sections["instruction"]
+    lesson_context, starter_code = sections["lesson_context"], sections["starter_code"]
+
     # --- Lógica de construcción de prompt mejorada ---
     message_parts = []
 
     # El 'query' es el mensaje o pregunta directa del usuario.
     # Es la parte más importante de la interacción.
-    if request.query:
-        logger.info(f"Procesando query del usuario: '{request.query}'")
+    if query:
+        logger.info(f"Procesando query del usuario: '{query}'")
         # Etiquetamos el mensaje del usuario para que la IA entienda que es una comunicación directa.
-        message_parts.append(f"El mensaje del alumno es: '{request.query}'")
+        message_parts.append(f"El mensaje del alumno es: '{query}'")
 
     # El 'code' es el contexto del editor del usuario.
-    if request.code:
-        logger.info(f"Procesando código del usuario (primeros 50 caracteres): '{request.code[:50]}...'")
+    if code:
+        logger.info(f"Procesando código del usuario (primeros 50 caracteres): '{code[:50]}...'")
         # Se añade una condición para evitar tratar saludos simples como código.
         # Si el 'query' y el 'code' son idénticos y cortos, probablemente es un saludo.
-        is_simple_greeting = (request.query and request.query.lower().strip() == request.code.lower().strip() and len(request.code.split()) < 3)
+        is_simple_greeting = (query and query.lower().strip() == code.lower().strip() and len(code.split()) < 3)
         
         if is_simple_greeting:
             logger.info("Detectado saludo simple, no se incluirá el código en el mensaje")
         
         if not is_simple_greeting:
-            message_parts.append(f"Actualmente, su editor de código contiene lo siguiente:\n```python\n{request.code}\n```")
+            message_parts.append(f"Actualmente, su editor de código contiene lo siguiente:\n```python\n{code}\n```")
 
     # Si no hay ni query ni código, no se puede continuar.
     if not message_parts:
@@ -297,56 +447,68 @@ async def chat_stream(request: ChatStreamRequest):
     logger.info(f"Mensaje del usuario construido con {len(message_parts)} partes")
 
     # La instrucción general (si existe) se antepone para guiar a la IA.
-    if request.instruction:
-        logger.info(f"Añadiendo instrucción: '{request.instruction}'")
-        user_message = f"{request.instruction}\n\n{user_message}"
+    if instruction:
+        logger.info(f"Añadiendo instrucción: '{instruction}'")
+        user_message = f"{instruction}\n\n{user_message}"
 
     # Añadir el contexto de la lección y el código de inicio, como antes.
-    if request.lesson_context:
+    if lesson_context:
         logger.info("Añadiendo contexto de lección")
-        user_message += f"\n\nAquí está el contexto de la lección actual para que lo tengas en cuenta:\n---CONTEXTO---\n{request.lesson_context}\n---FIN DE CONTEXTO---"
-    if request.starter_code:
+        user_message += f"\n\nAquí está el contexto de la lección actual para que lo tengas en cuenta:\n---CONTEXTO---\n{lesson_context}\n---FIN DE CONTEXTO---"
+    if starter_code:
         logger.info("Añadiendo código de inicio")
-        user_message += f"\n\nEste es el código de inicio del ejercicio:\n---CÓDIGO DE INICIO---\n{request.starter_code}\n---FIN DE CÓDIGO DE INICIO---"
+        user_message += f"\n\nEste es el código de inicio del ejercicio:\n---CÓDIGO DE INICIO---\n{starter_code}\n---FIN DE CÓDIGO DE INICIO---"
 
 
     # Call the AI with the structured messages
     logger.info(f"Enviando solicitud al modelo {MODEL_NAME}")
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_message}
+    ]
+    stream_params = {"max_tokens": AI_MAX_RESPONSE_TOKENS, "temperature": 0.7}
+    # Identical prompts already streaming are joined through a fan-out buffer instead of a new call
+    response_stream = coalescer.stream(
+        prompt_fingerprint(messages, model=MODEL_NAME, **stream_params),
+        lambda: llm.stream(messages=messages, endpoint="chat_stream", **stream_params),
+    )
+    # Wait for the first chunk here so connection errors still surface as an HTTP 500
     try:
-        response_stream = client.complete(
-            model=MODEL_NAME,
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": user_message}
-            ],
-            stream=True,
-            max_tokens=1024,
-            temperature=0.7,
-        )
+        first_chunk = await response_stream.__anext__()
         logger.info("Solicitud enviada correctamente, iniciando streaming")
+    except StopAsyncIteration:
+        first_chunk = None
+    except RateLimitExceeded:
+        await response_stream.aclose()
+        raise
+    except DeadlineExceeded:
+        await response_stream.aclose()
+        logger.error("El modelo no respondió dentro del plazo al iniciar el streaming")
+        raise HTTPException(status_code=504, detail="El asistente de IA tardó demasiado en responder. Intenta de nuevo.")
     except Exception as e:
+        await response_stream.aclose()
         logger.error(f"Error al iniciar la solicitud al modelo: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error al conectar con el modelo de IA: {str(e)}")
 
     async def streamer_wrapper():
-        chunk_count = 0
+        if first_chunk is None:
+            return
+        chunk_count = 1
         try:
             logger.info("Iniciando streaming de respuesta")
-            for chunk in response_stream:
+            yield first_chunk
+            async for content in response_stream:
                 chunk_count += 1
                 if chunk_count % 10 == 0:  # Log cada 10 chunks para no saturar los logs
                     logger.info(f"Procesando chunk #{chunk_count}")
-                
-                if chunk.choices and len(chunk.choices) > 0:
-                    delta = chunk.choices[0].delta
-                    if delta and delta.content:
-                        yield delta.content
-                        await asyncio.sleep(0)
-            
+                yield content
+
             logger.info(f"Streaming completado. Total de chunks procesados: {chunk_count}")
         except Exception as e:
             logger.error(f"Error durante el streaming de la respuesta: {str(e)}")
             yield f"Error: {str(e)}"
+        finally:
+            await response_stream.aclose()
     
     logger.info("Devolviendo StreamingResponse")        
     return StreamingResponse(streamer_wrapper(), media_type="text/event-stream")
@@ -0,0 +1,184 @@
+import math
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+# --- Token budget settings ---
+# No tokenizer ships with the service; ~3.5 characters per token is a conservative
+# average for mixed Spanish prose and Python code on GPT-4-class tokenizers.
+CHARS_PER_TOKEN = 3.5
+MESSAGE_OVERHEAD_TOKENS = 4  # role/framing tokens added per chat message
+
+AI_PROMPT_MAX_TOKENS = int(os.getenv("AI_PROMPT_MAX_TOKENS", 6000))
+AI_MAX_RESPONSE_TOKENS = int(os.getenv("AI_MAX_RESPONSE_TOKENS", 1024))
+
+# Per-section caps for the chat prompt. lesson_context has no cap of its own: it gets
+# whatever is left of AI_PROMPT_MAX_TOKENS after the other sections.
+SECTION_BUDGETS: Dict[str, int] = {
+    "instruction": 400,
+    "query": 800,
+    "code": 2500,
+    "starter_code": 600,
+}
+
+OMITTED_MARKER = "[...]"
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def estimate_messages_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(estimate_tokens(m.get("content")) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def _max_chars(max_tokens: int) -> int:
+    return int(max_tokens * CHARS_PER_TOKEN)
+
+
+# --- Truncation ---
+def truncate_text(text: str, max_tokens: int) -> Tuple[str, bool]:
+    """Keeps the beginning of free text (the question is usually stated first)."""
+    if estimate_tokens(text) <= max_tokens:
+        return text, False
+    cut = text[:_max_chars(max_tokens)]
+    # Prefer cutting at a word boundary
+    if " " in cut[-40:]:
+        cut = cut[:cut.rfind(" ")]
+    return f"{cut.rstrip()} {OMITTED_MARKER}", True
+
+
+def truncate_code(code: str, max_tokens: int) -> Tuple[str, bool]:
+    """
+    Keeps whole lines from the head (imports, definitions) and the tail (where the student is
+    usually working) and replaces the middle with a comment saying how many lines were dropped.
+    """
+    if estimate_tokens(code) <= max_tokens:
+        return code, False
+    lines = code.splitlines()
+    budget = _max_chars(max_tokens)
+    head_budget = int(budget * 0.6)
+    head: List[str] = []
+    used = 0
+    for line in lines:
+        if used + len(line) + 1 > head_budget:
+            break
+        head.append(line)
+        used += len(line) + 1
+    tail: List[str] = []
+    for line in reversed(lines[len(head):]):
+        if used + len(line) + 1 > budget:
+            break
+        tail.append(line)
+        used += len(line) + 1
+    tail.reverse()
+    omitted = len(lines) - len(head) - len(tail)
+    if not head and not tail:
+        # A single enormous line: fall back to a plain character cut
+        return truncate_text(code, max_tokens)
+    return "\n".join(head + [f"# ... ({omitted} líneas omitidas) ..."] + tail), True
+
+
+# --- Lesson context selection ---
+_HEADING_RE = re.compile(r"^#{1,6}\s", re.MULTILINE)
+_TERM_RE = re.compile(r"[A-Za-zÀ-ÿ_][A-Za-zÀ-ÿ0-9_]{2,}")
+_STOPWORDS = {
+    "the", "and", "for", "que", "los", "las", "del", "por", "con", "una", "uno", "para", "como",
+    "esto", "este", "esta", "pero", "más", "sus", "hay", "son", "print", "return", "def", "self",
+}
+
+
+def _terms(text: Optional[str]) -> set:
+    if not text:
+        return set()
+    return {t.lower() for t in _TERM_RE.findall(text)} - _STOPWORDS
+
+
+def split_sections(markdown: str) -> List[str]:
+    """Splits lesson markdown at its headings; text before the first heading is its own section."""
+    starts = [m.start() for m in _HEADING_RE.finditer(markdown)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    bounds = starts + [len(markdown)]
+    return [markdown[a:b].strip() for a, b in zip(bounds, bounds[1:]) if markdown[a:b].strip()]
+
+
+def select_lesson_sections(markdown: str, focus: str, max_tokens: int) -> Tuple[str, bool]:
+    """
+    Fits the lesson into max_tokens by keeping the sections most related to the focus text
+    (the student's question, code and instruction). The lesson introduction wins ties, and the
+    chosen sections are emitted in their original order.
+    """
+    if estimate_tokens(markdown) <= max_tokens:
+        return markdown, False
+    if max_tokens <= 0:
+        return "", True
+    sections = split_sections(markdown)
+    focus_terms = _terms(focus)
+
+    def score(index: int) -> int:
+        section = sections[index]
+        heading = section.splitlines()[0]
+        # Matches in the heading count double: they name what the section is about
+        return len(focus_terms & _terms(section)) + len(focus_terms & _terms(heading))
+
+    ranked = sorted(range(len(sections)), key=lambda i: (-score(i), i))
+    chosen: Dict[int, str] = {}
+    used = 0
+    for index in ranked:
+        cost = estimate_tokens(sections[index]) + 1
+        if used + cost <= max_tokens:
+            chosen[index] = sections[index]
+            used += cost
+        elif not chosen:
+            # Even the best section alone is too big: keep its beginning
+            chosen[index], _ = truncate_text(sections[index], max_tokens)
+            break
+
+    parts: List[str] = []
+    previous = -1
+    for index in sorted(chosen):
+        if index != previous + 1:
+            parts.append(OMITTED_MARKER)
+        parts.append(chosen[index])
+        previous = index
+    if previous != len(sections) - 1:
+        parts.append(OMITTED_MARKER)
+    return "\n\n".join(parts), True
+
+
+# --- Chat prompt fitting ---
+def fit_chat_sections(query: Optional[str] = None, code: Optional[str] = None,
+                      instruction: Optional[str] = None, lesson_context: Optional[str] = None,
+                      starter_code: Optional[str] = None,
+                      max_tokens: int = AI_PROMPT_MAX_TOKENS) -> Tuple[Dict[str, Optional[str]], Dict[str, int], List[str]]:
+    """
+    Applies the per-section budgets to the chat inputs. Returns the fitted sections, the
+    estimated tokens per section and the names of the sections that were truncated.
+    """
+    fitted: Dict[str, Optional[str]] = {}
+    truncated: List[str] = []
+    for name, value, truncate in (
+        ("instruction", instruction, truncate_text),
+        ("query", query, truncate_text),
+        ("code", code, truncate_code),
+        ("starter_code", starter_code, truncate_code),
+    ):
+        if value:
+            value, was_truncated = truncate(value, SECTION_BUDGETS[name])
+            if was_truncated:
+                truncated.append(name)
+        fitted[name] = value
+
+    tokens = {name: estimate_tokens(value) for name, value in fitted.items()}
+    lesson_budget = max(0, max_tokens - sum(tokens.values()))
+    if lesson_context:
+        focus = " ".join(v for v in (query, instruction, code) if v)
+        lesson_context, was_truncated = select_lesson_sections(lesson_context, focus, lesson_budget)
+        if was_truncated:
+            truncated.append("lesson_context")
+    fitted["lesson_context"] = lesson_context
+    tokens["lesson_context"] = estimate_tokens(lesson_context)
+    return fitted, tokens, truncated
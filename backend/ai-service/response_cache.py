@@ -0,0 +1,313 @@
+import ast
+import asyncio
+import builtins
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# --- Cache settings ---
+AI_CACHE_BACKEND = os.getenv("AI_CACHE_BACKEND", "auto")  # auto | redis | sqlite | none
+AI_CACHE_TTL_SECONDS = int(os.getenv("AI_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", 20000))
+AI_CACHE_SQLITE_PATH = os.getenv("AI_CACHE_SQLITE_PATH", "/tmp/pycher_ai_cache.sqlite3")
+# Near-duplicate mode: code that only differs in identifier names shares a cache entry
+AI_CACHE_NEAR_DUPLICATES = os.getenv("AI_CACHE_NEAR_DUPLICATES", "false").lower() in ("1", "true", "yes")
+CACHE_KEY_VERSION = 2  # Bump when prompts change so old answers are not served
+# Feedback and hints comment on style, comments and line numbers, so their key keeps the layout
+LAYOUT_SENSITIVE_ENDPOINTS = {"feedback", "hint"}
+
+
+# --- Key normalization ---
+def _text_fallback(code: str) -> str:
+    """Whitespace/comment-insensitive form for code that does not parse."""
+    lines = []
+    for line in code.strip().splitlines():
+        line = line.split("#", 1)[0].rstrip()
+        if line.strip():
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def normalize_layout(code: Optional[str]) -> str:
+    """Source with line endings unified and trailing whitespace/blank lines dropped; indentation and comments are kept."""
+    if not code or not code.strip():
+        return ""
+    lines = [line.rstrip() for line in code.replace("\r\n", "\n").replace("\r", "\n").split("\n")]
+    while lines and not lines[-1]:
+        lines.pop()
+    return "\n".join(lines)
+
+
+class _IdentifierCanonicalizer(ast.NodeTransformer):
+    """Renames user identifiers to v0, v1, ... in order of first appearance. Builtins keep their names."""
+
+    def __init__(self):
+        self.names: Dict[str, str] = {}
+
+    def _canonical(self, name: str) -> str:
+        if hasattr(builtins, name):
+            return name
+        return self.names.setdefault(name, f"v{len(self.names)}")
+
+    def visit_Name(self, node: ast.Name):
+        node.id = self._canonical(node.id)
+        return node
+
+    def visit_arg(self, node: ast.arg):
+        node.arg = self._canonical(node.arg)
+        return node
+
+    def visit_FunctionDef(self, node: ast.FunctionDef):
+        node.name = self._canonical(node.name)
+        self.generic_visit(node)
+        return node
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node: ast.ClassDef):
+        node.name = self._canonical(node.name)
+        self.generic_visit(node)
+        return node
+
+
+def normalize_code(code: Optional[str], near_duplicates: bool = AI_CACHE_NEAR_DUPLICATES) -> str:
+    """
+    AST dump of the code, so formatting and comments do not matter. In near-duplicate
+    mode identifiers are canonicalized as well (a fingerprint of the program's shape).
+    """
+    if not code or not code.strip():
+        return ""
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return _text_fallback(code)
+    if near_duplicates:
+        tree = _IdentifierCanonicalizer().visit(tree)
+    return ast.dump(tree, annotate_fields=False, include_attributes=False)
+
+
+_ERROR_CLASS_RE = re.compile(r"\b([A-Za-z_][A-Za-z0-9_]*(?:Error|Exception|Warning|Interrupt|Exit))\b")
+
+def error_class(error: Optional[str]) -> str:
+    """'Traceback ... NameError: name x is not defined' -> 'NameError'. Last match wins (the raised one)."""
+    if not error or not error.strip():
+        return ""
+    matches = _ERROR_CLASS_RE.findall(error)
+    return matches[-1] if matches else " ".join(error.split()).lower()
+
+
+def _normalize_text(value: Optional[str]) -> str:
+    return " ".join(value.split()).lower() if value else ""
+
+
+def make_cache_key(endpoint: str, model: str, level: str = "", code: Optional[str] = None,
+                   error: Optional[str] = None, instruction: Optional[str] = None,
+                   extra: Optional[Dict[str, Any]] = None) -> str:
+    layout_sensitive = endpoint in LAYOUT_SENSITIVE_ENDPOINTS
+    normalized = normalize_layout(code) if layout_sensitive else normalize_code(code)
+    parts = {
+        "v": CACHE_KEY_VERSION,
+        "endpoint": endpoint,
+        "model": model,
+        "level": level or "",
+        "code": hashlib.sha256(normalized.encode()).hexdigest(),
+        "near": AI_CACHE_NEAR_DUPLICATES and not layout_sensitive,
+        "error": error_class(error),
+        "instruction": _normalize_text(instruction),
+        # Extra fields (e.g. program outputs) are compared exactly: case and spacing can be the bug
+        "extra": {k: v.strip() if isinstance(v, str) else v for k, v in sorted((extra or {}).items())},
+    }
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+    return f"ai_cache:{endpoint}:{digest}"
+
+
+# --- Backends (synchronous; ResponseCache runs them off the event loop) ---
+class SQLiteCacheBackend:
+    def __init__(self, path: str = AI_CACHE_SQLITE_PATH, max_entries: int = AI_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ai_response_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_ai_response_cache_last_access ON ai_response_cache (last_access)")
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM ai_response_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM ai_response_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE ai_response_cache SET last_access = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key: str, value: str, ttl_seconds: int) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ai_response_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl_seconds, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute("DELETE FROM ai_response_cache WHERE expires_at <= ?", (now,))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM ai_response_cache").fetchone()
+        if count > self.max_entries:
+            # Least recently used entries go first
+            self._conn.execute(
+                "DELETE FROM ai_response_cache WHERE key IN ("
+                " SELECT key FROM ai_response_cache ORDER BY last_access ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM ai_response_cache").fetchone()[0]
+
+
+class RedisCacheBackend:
+    """Entries expire by TTL; a sorted set of keys by last access enforces max_entries (LRU)."""
+
+    INDEX_KEY = "ai_cache:index"
+
+    def __init__(self, client, max_entries: int = AI_CACHE_MAX_ENTRIES):
+        self.client = client
+        self.max_entries = max_entries
+
+    @classmethod
+    def from_env(cls) -> "RedisCacheBackend":
+        import redis  # Only needed when the Redis backend is selected
+
+        client = redis.Redis(
+            host=os.getenv("REDIS_HOST", "localhost"),
+            port=int(os.getenv("REDIS_PORT", 6379)),
+            username=os.getenv("REDIS_USER"),
+            password=os.getenv("REDIS_PASSWORD"),
+            decode_responses=True,
+            socket_connect_timeout=2,
+            socket_timeout=2,
+        )
+        client.ping()
+        return cls(client)
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.client.get(key)
+        if value is not None:
+            self.client.zadd(self.INDEX_KEY, {key: time.time()})
+        return value
+
+    def set(self, key: str, value: str, ttl_seconds: int) -> None:
+        now = time.time()
+        pipe = self.client.pipeline(transaction=False)
+        pipe.setex(key, ttl_seconds, value)
+        pipe.zadd(self.INDEX_KEY, {key: now})
+        # Keys untouched for a whole TTL have already expired on their own
+        pipe.zremrangebyscore(self.INDEX_KEY, 0, now - ttl_seconds)
+        pipe.zcard(self.INDEX_KEY)
+        *_, count = pipe.execute()
+        if count > self.max_entries:
+            overflow = self.client.zpopmin(self.INDEX_KEY, count - self.max_entries)
+            if overflow:
+                self.client.delete(*[member for member, _ in overflow])
+
+    def size(self) -> int:
+        return self.client.zcard(self.INDEX_KEY)
+
+
+# --- Cache facade ---
+class ResponseCache:
+    def __init__(self, backend=None, ttl_seconds: int = AI_CACHE_TTL_SECONDS):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.stats: Dict[str, Dict[str, int]] = {}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    def _record(self, endpoint: str, outcome: str) -> None:
+        with self._stats_lock:
+            counters = self.stats.setdefault(endpoint, {"hits": 0, "misses": 0, "errors": 0})
+            counters[outcome] += 1
+
+    async def get(self, key: str, endpoint: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        try:
+            raw = await asyncio.to_thread(self.backend.get, key)
+        except Exception as e:
+            logger.warning(f"AI cache read failed ({endpoint}): {e}")
+            self._record(endpoint, "errors")
+            return None
+        self._record(endpoint, "hits" if raw is not None else "misses")
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Dict[str, Any]) -> None:
+        if not self.enabled:
+            return
+        try:
+            await asyncio.to_thread(self.backend.set, key, json.dumps(value), self.ttl_seconds)
+        except Exception as e:
+            logger.warning(f"AI cache write failed: {e}")
+
+    def report(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            endpoints = {}
+            total_hits = total_lookups = 0
+            for endpoint, counters in self.stats.items():
+                lookups = counters["hits"] + counters["misses"]
+                total_hits += counters["hits"]
+                total_lookups += lookups
+                endpoints[endpoint] = {**counters, "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0}
+        try:
+            entries = self.backend.size() if self.enabled else 0
+        except Exception:
+            entries = None
+        return {
+            "backend": type(self.backend).__name__ if self.enabled else None,
+            "near_duplicates": AI_CACHE_NEAR_DUPLICATES,
+            "entries": entries,
+            "hit_rate": round(total_hits / total_lookups, 4) if total_lookups else 0.0,
+            "endpoints": endpoints,
+        }
+
+
+def build_response_cache() -> ResponseCache:
+    """Picks the backend from AI_CACHE_BACKEND; 'auto' prefers Redis and falls back to SQLite."""
+    backend_name = AI_CACHE_BACKEND.lower()
+    if backend_name == "none":
+        logger.info("AI response cache disabled")
+        return ResponseCache(None)
+    if backend_name in ("redis", "auto"):
+        try:
+            backend = RedisCacheBackend.from_env()
+            logger.info("AI response cache using Redis")
+            return ResponseCache(backend)
+        except Exception as e:
+            if backend_name == "redis":
+                logger.error(f"AI response cache: Redis unavailable ({e}), cache disabled")
+                return ResponseCache(None)
+            logger.warning(f"AI response cache: Redis unavailable ({e}), using SQLite")
+    try:
+        backend = SQLiteCacheBackend()
+        logger.info(f"AI response cache using SQLite at {AI_CACHE_SQLITE_PATH}")
+        return ResponseCache(backend)
+    except Exception as e:
+        logger.error(f"AI response cache: SQLite unavailable ({e}), cache disabled")
+        return ResponseCache(None)
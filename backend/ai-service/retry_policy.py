@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import os
+import random
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# --- Deadlines and retries ---
+# The gateway gives non-streaming AI calls 60 s; finishing (or failing) a bit earlier lets
+# the client see our error instead of a gateway timeout.
+AI_REQUEST_DEADLINE_SECONDS = float(os.getenv("AI_REQUEST_DEADLINE_SECONDS", 55))
+AI_ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("AI_ATTEMPT_TIMEOUT_SECONDS", 25))
+AI_MAX_ATTEMPTS = int(os.getenv("AI_MAX_ATTEMPTS", 3))
+AI_RETRY_BASE_DELAY_SECONDS = float(os.getenv("AI_RETRY_BASE_DELAY_SECONDS", 0.5))
+AI_RETRY_MAX_DELAY_SECONDS = float(os.getenv("AI_RETRY_MAX_DELAY_SECONDS", 4))
+
+# --- Hedging ---
+AI_HEDGE_PERCENTILE = float(os.getenv("AI_HEDGE_PERCENTILE", 0.95))
+AI_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("AI_HEDGE_MIN_DELAY_SECONDS", 2))
+AI_HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("AI_HEDGE_DEFAULT_DELAY_SECONDS", 10))
+LATENCY_WINDOW = 200
+LATENCY_MIN_SAMPLES = 20
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def backoff_delay(attempt: int, base: float = AI_RETRY_BASE_DELAY_SECONDS, cap: float = AI_RETRY_MAX_DELAY_SECONDS) -> float:
+    """Exponential backoff with full jitter, so retries of a burst do not land together."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+async def call_with_retries(attempt: Callable[[], Awaitable[Any]], is_retryable: Callable[[BaseException], bool],
+                            deadline: float, max_attempts: int = AI_MAX_ATTEMPTS) -> Any:
+    """
+    Runs attempt() until it succeeds, fails with a non-retryable error, runs out of attempts
+    or hits the deadline (event loop time). Per-attempt timeouts are the attempt's own job;
+    a timed-out attempt is retried like any other retryable failure.
+    """
+    loop = asyncio.get_running_loop()
+    last_error: Optional[BaseException] = None
+    for attempt_number in range(max_attempts):
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        try:
+            return await asyncio.wait_for(attempt(), timeout=remaining)
+        except asyncio.TimeoutError as e:
+            last_error = e
+            if loop.time() >= deadline:
+                break
+        except Exception as e:
+            if not is_retryable(e):
+                raise
+            last_error = e
+        if attempt_number == max_attempts - 1:
+            break
+        delay = backoff_delay(attempt_number)
+        if loop.time() + delay >= deadline:
+            break
+        logger.warning(f"Intento {attempt_number + 1}/{max_attempts} al modelo falló ({type(last_error).__name__}), reintentando en {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+    if last_error is None or isinstance(last_error, asyncio.TimeoutError):
+        raise DeadlineExceeded("AI request deadline exceeded") from last_error
+    raise last_error
+
+
+class LatencyTracker:
+    """Sliding window of recent successful call latencies."""
+
+    def __init__(self, window: int = LATENCY_WINDOW, min_samples: int = LATENCY_MIN_SAMPLES):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def observe(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    def hedge_delay(self) -> float:
+        """How long the primary gets before a hedged request is sent."""
+        observed = self.percentile(AI_HEDGE_PERCENTILE)
+        if observed is None:
+            return AI_HEDGE_DEFAULT_DELAY_SECONDS
+        return max(AI_HEDGE_MIN_DELAY_SECONDS, observed)
+
+
+async def hedged(primary: Callable[[], Awaitable[Any]], secondary: Callable[[], Awaitable[Any]],
+                 hedge_after: float) -> Tuple[Any, bool]:
+    """
+    Starts primary(); if it has not finished after hedge_after seconds, also starts
+    secondary(). If the primary fails before that, secondary() runs as a fallback.
+    Returns (result, used_secondary) for the first call that succeeds and cancels the
+    other. If both fail, the primary's error is raised.
+    """
+    primary_task = asyncio.ensure_future(primary())
+    secondary_task: Optional[asyncio.Future] = None
+    try:
+        done, _ = await asyncio.wait({primary_task}, timeout=hedge_after)
+        if done and primary_task.exception() is None:
+            return primary_task.result(), False
+
+        secondary_task = asyncio.ensure_future(secondary())
+        pending = {primary_task, secondary_task} - done
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), task is secondary_task
+        # Both failed. The secondary's error is retrieved here so it is not reported as lost
+        secondary_task.exception()
+        raise primary_task.exception()
+    finally:
+        for task in (primary_task, secondary_task):
+            if task is not None and not task.done():
+                task.cancel()
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict
+
+logger = logging.getLogger(__name__)
+
+# --- Upstream rate limits ---
+# Defaults follow the GitHub Models limits for gpt-4.1-mini; 0 disables a limit.
+AI_RATE_LIMIT_RPM = int(os.getenv("AI_RATE_LIMIT_RPM", 15))
+AI_RATE_LIMIT_TPM = int(os.getenv("AI_RATE_LIMIT_TPM", 0))
+# Requests that would have to queue longer than this are shed with a 429 right away
+AI_RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv("AI_RATE_LIMIT_MAX_WAIT_SECONDS", 15))
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"AI rate limit reached, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class _TokenBucket:
+    """
+    Reservation-style token bucket: a reservation may drive the level negative, and the
+    debt tells later callers how long they have to wait. Single event loop, no locking.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay_for(self, amount: float, now: float) -> float:
+        self._refill(now)
+        amount = min(amount, self.capacity)  # A single oversized request must still be admissible
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def reserve(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+    def refund(self, amount: float) -> None:
+        self.level = min(self.capacity, self.level + amount)
+
+
+class TokenBucketScheduler:
+    """
+    Client-side admission control in front of the model API. Each call reserves one request
+    and its estimated tokens, waits until the buckets cover the reservation, or is shed when
+    the wait would exceed max_wait. An upstream 429 pauses all admissions for its Retry-After.
+    """
+
+    def __init__(self, requests_per_minute: int = AI_RATE_LIMIT_RPM, tokens_per_minute: int = AI_RATE_LIMIT_TPM,
+                 max_wait: float = AI_RATE_LIMIT_MAX_WAIT_SECONDS):
+        self.requests = _TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = _TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.max_wait = max_wait
+        self._paused_until = 0.0
+        self.stats = {"admitted": 0, "queued": 0, "shed": 0, "upstream_429": 0, "queued_seconds": 0.0}
+
+    def _delay(self, tokens: int, now: float) -> float:
+        delay = max(0.0, self._paused_until - now)
+        if self.requests is not None:
+            delay = max(delay, self.requests.delay_for(1, now))
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.delay_for(tokens, now))
+        return delay
+
+    async def acquire(self, tokens: int) -> None:
+        delay = self._delay(tokens, time.monotonic())
+        if delay > self.max_wait:
+            self.stats["shed"] += 1
+            logger.warning(f"Solicitud de IA descartada: la cola de rate limit requiere {delay:.1f}s")
+            raise RateLimitExceeded(delay)
+        if self.requests is not None:
+            self.requests.reserve(1)
+        if self.tokens is not None:
+            self.tokens.reserve(tokens)
+        self.stats["admitted"] += 1
+        if delay > 0:
+            self.stats["queued"] += 1
+            self.stats["queued_seconds"] += delay
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                # The client went away while queued: give the capacity back
+                if self.requests is not None:
+                    self.requests.refund(1)
+                if self.tokens is not None:
+                    self.tokens.refund(tokens)
+                raise
+
+    def settle(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """Corrects the token bucket once the real usage of a call is known."""
+        if self.tokens is not None:
+            self.tokens.refund(estimated_tokens - actual_tokens)
+
+    def penalize(self, retry_after: float) -> None:
+        """Upstream answered 429: stop admitting requests until it says we may retry."""
+        self.stats["upstream_429"] += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        logger.warning(f"El modelo devolvió 429, pausando solicitudes {retry_after:.1f}s")
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "queued_seconds": round(self.stats["queued_seconds"], 3),
+            "requests_per_minute": int(self.requests.capacity) if self.requests else None,
+            "tokens_per_minute": int(self.tokens.capacity) if self.tokens else None,
+            "max_wait_seconds": self.max_wait,
+        }
+
+
+class TokenUsageMetrics:
+    """Per-endpoint token counters. Streaming calls report estimated completion tokens."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints: Dict[str, Dict[str, int]] = {}
+
+    def record(self, endpoint: str, prompt_tokens: int, completion_tokens: int, estimated: bool = False) -> None:
+        logger.info(
+            f"Uso de tokens endpoint={endpoint} prompt={prompt_tokens} completion={completion_tokens}"
+            f"{' (estimado)' if estimated else ''}"
+        )
+        with self._lock:
+            counters = self.endpoints.setdefault(
+                endpoint, {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "estimated_requests": 0}
+            )
+            counters["requests"] += 1
+            counters["prompt_tokens"] += prompt_tokens
+            counters["completion_tokens"] += completion_tokens
+            counters["estimated_requests"] += int(estimated)
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            endpoints = {
+                name: {
+                    **c,
+                    "avg_prompt_tokens": round(c["prompt_tokens"] / c["requests"], 1),
+                    "avg_completion_tokens": round(c["completion_tokens"] / c["requests"], 1),
+                }
+                for name, c in self.endpoints.items()
+            }
+        return {
+            "prompt_tokens": sum(c["prompt_tokens"] for c in endpoints.values()),
+            "completion_tokens": sum(c["completion_tokens"] for c in endpoints.values()),
+            "endpoints": endpoints,
+        }
@@ -0,0 +1,45 @@
+import logging
+import os
+from typing import Any, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+EXECUTION_SERVICE_URL = os.getenv("EXECUTION_SERVICE_URL", "http://execution-service:8001")
+# The analysis never runs code; if it is not back by then, feedback goes on without it
+STATIC_FEEDBACK_TIMEOUT_SECONDS = float(os.getenv("STATIC_FEEDBACK_TIMEOUT_SECONDS", 2))
+
+
+class StaticFeedbackClient:
+    """Rule-based code feedback from execution-service /analyze (CodeAnalyzer AST facts)."""
+
+    def __init__(self, base_url: str = EXECUTION_SERVICE_URL, timeout: float = STATIC_FEEDBACK_TIMEOUT_SECONDS):
+        self._client = httpx.AsyncClient(base_url=base_url, timeout=timeout)
+        self.stats = {"local_only_answers": 0, "analysis_failures": 0}
+
+    async def analyze(self, code: str, level: str) -> Optional[Dict[str, Any]]:
+        try:
+            response = await self._client.post("/analyze", json={"code": code, "level": level})
+            response.raise_for_status()
+            return response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            # ValueError: a body that is not JSON (e.g. a proxy error page)
+            self.stats["analysis_failures"] += 1
+            logger.warning(f"Análisis estático no disponible: {e}")
+            return None
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+def format_static_feedback(result: Dict[str, Any]) -> str:
+    """Markdown summary of the rule-based issues, shown before (or instead of) the AI answer."""
+    if result.get("syntax_error"):
+        return (
+            "**Revisión automática:** tu código tiene un error de sintaxis, así que aún no se puede ejecutar.\n"
+            f"- {result['issues'][0]['message']}"
+        )
+    lines = ["**Revisión automática:**"]
+    lines.extend(f"- {issue['message']}" for issue in result.get("issues", []))
+    return "\n".join(lines)
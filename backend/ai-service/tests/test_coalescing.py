@@ -0,0 +1,135 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from coalescing import RequestCoalescer, prompt_fingerprint  # noqa: E402
+
+
+def test_fingerprint_depends_on_messages_and_params():
+    messages = [{"role": "user", "content": "hola"}]
+    assert prompt_fingerprint(messages, temperature=0.7) == prompt_fingerprint(list(messages), temperature=0.7)
+    assert prompt_fingerprint(messages, temperature=0.7) != prompt_fingerprint(messages, temperature=0.2)
+    assert prompt_fingerprint(messages) != prompt_fingerprint([{"role": "user", "content": "adiós"}])
+
+
+def test_concurrent_identical_calls_share_one_upstream_call():
+    upstream_calls = 0
+
+    async def slow_completion():
+        nonlocal upstream_calls
+        upstream_calls += 1
+        await asyncio.sleep(0.05)
+        return {"content": "pista"}
+
+    async def scenario():
+        coalescer = RequestCoalescer()
+        results = await asyncio.gather(*(coalescer.run("k", slow_completion) for _ in range(10)))
+        # Once finished, the next request starts a new call
+        await coalescer.run("k", slow_completion)
+        return coalescer, results
+
+    coalescer, results = asyncio.run(scenario())
+    assert results == [{"content": "pista"}] * 10
+    assert upstream_calls == 2
+    assert coalescer.report()["coalesced_calls"] == 9
+    assert coalescer.report()["in_flight_calls"] == 0
+
+
+def test_errors_reach_every_waiter():
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream caído")
+
+    async def scenario():
+        coalescer = RequestCoalescer()
+        return await asyncio.gather(coalescer.run("k", failing), coalescer.run("k", failing), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_cancelled_waiter_does_not_cancel_shared_call():
+    async def slow_completion():
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    async def scenario():
+        coalescer = RequestCoalescer()
+        first = asyncio.create_task(coalescer.run("k", slow_completion))
+        second = asyncio.create_task(coalescer.run("k", slow_completion))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(scenario()) == "ok"
+
+
+async def _fake_stream(chunks, delay, opened):
+    opened.append(1)
+    for chunk in chunks:
+        await asyncio.sleep(delay)
+        yield chunk
+
+
+def test_stream_joiners_receive_the_full_response():
+    chunks = ["a", "b", "c", "d"]
+    opened = []
+
+    async def consume(coalescer, start_delay):
+        await asyncio.sleep(start_delay)
+        return [c async for c in coalescer.stream("k", lambda: _fake_stream(chunks, 0.02, opened))]
+
+    async def scenario():
+        coalescer = RequestCoalescer()
+        # The second client joins after part of the response has already been buffered
+        return await asyncio.gather(consume(coalescer, 0), consume(coalescer, 0.03)), coalescer
+
+    (first, late), coalescer = asyncio.run(scenario())
+    assert first == chunks
+    assert late == chunks
+    assert len(opened) == 1
+    assert coalescer.report()["coalesced_streams"] == 1
+    assert coalescer.report()["in_flight_streams"] == 0
+
+
+def test_stream_error_is_raised_to_subscribers():
+    async def broken():
+        yield "a"
+        raise RuntimeError("corte")
+
+    async def scenario():
+        coalescer = RequestCoalescer()
+        received = []
+        with pytest.raises(RuntimeError):
+            async for chunk in coalescer.stream("k", broken):
+                received.append(chunk)
+        return received
+
+    assert asyncio.run(scenario()) == ["a"]
+
+
+def test_stream_is_cancelled_when_every_subscriber_leaves():
+    closed = []
+
+    async def endless():
+        try:
+            while True:
+                await asyncio.sleep(0.01)
+                yield "x"
+        finally:
+            closed.append(True)
+
+    async def scenario():
+        coalescer = RequestCoalescer()
+        subscriber = coalescer.stream("k", endless)
+        await subscriber.__anext__()
+        await subscriber.aclose()
+        await asyncio.sleep(0.05)
+        return coalescer
+
+    coalescer = asyncio.run(scenario())
+    assert closed == [True]
+    assert coalescer.report()["in_flight_streams"] == 0
@@ -0,0 +1,129 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("azure.ai.inference.aio")
+pytest.importorskip("aiohttp")
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from llm_client import LLMClient  # noqa: E402
+
+CHUNKS_PER_STREAM = 5
+CHUNK_DELAY_SECONDS = 0.1
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    """Minimal chat-completions endpoint: streams CHUNKS_PER_STREAM slow SSE chunks."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not body.get("stream"):
+            payload = {
+                "id": "fake", "object": "chat.completion", "created": 0, "model": "fake",
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": " hola "}}],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+            }
+            data = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        label = body["messages"][-1]["content"]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for i in range(CHUNKS_PER_STREAM):
+            time.sleep(CHUNK_DELAY_SECONDS)
+            chunk = {
+                "id": "fake", "object": "chat.completion.chunk", "created": 0, "model": "fake",
+                "choices": [{"index": 0, "finish_reason": None, "delta": {"role": "assistant", "content": f"{label}{i}"}}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+@pytest.fixture(scope="module")
+def fake_llm_endpoint():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeLLMHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+async def _collect(llm: LLMClient, label: str, events: list):
+    async for content in llm.stream([{"role": "user", "content": label}]):
+        events.append((label, content, time.perf_counter()))
+
+
+def _run_two_streams(endpoint: str, max_concurrency: int):
+    async def scenario():
+        llm = LLMClient(endpoint=endpoint, token="test-token", model="fake", max_concurrency=max_concurrency)
+        events = []
+        ticks = 0
+
+        async def ticker():
+            # Would stall if a stream blocked the event loop
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker_task = asyncio.create_task(ticker())
+        start = time.perf_counter()
+        try:
+            await asyncio.gather(_collect(llm, "A", events), _collect(llm, "B", events))
+        finally:
+            ticker_task.cancel()
+            await llm.close()
+        return events, ticks, time.perf_counter() - start
+
+    return asyncio.run(scenario())
+
+
+def test_concurrent_streams_interleave(fake_llm_endpoint):
+    events, ticks, elapsed = _run_two_streams(fake_llm_endpoint, max_concurrency=4)
+
+    labels = [label for label, _, _ in events]
+    assert labels.count("A") == CHUNKS_PER_STREAM
+    assert labels.count("B") == CHUNKS_PER_STREAM
+    # Chunks of both streams arrive mixed, not one whole stream after the other
+    assert labels != sorted(labels)
+    # Both streams ran in parallel: well under two back-to-back streams
+    assert elapsed < 2 * CHUNKS_PER_STREAM * CHUNK_DELAY_SECONDS * 0.8
+    # The event loop kept running other work while waiting for chunks
+    assert ticks >= (CHUNKS_PER_STREAM * CHUNK_DELAY_SECONDS / 0.01) * 0.5
+
+
+def test_concurrency_cap_serializes_streams(fake_llm_endpoint):
+    events, _, _ = _run_two_streams(fake_llm_endpoint, max_concurrency=1)
+
+    labels = [label for label, _, _ in events]
+    first = labels[0]
+    # With a single slot the second stream only starts once the first is finished
+    assert labels[:CHUNKS_PER_STREAM] == [first] * CHUNKS_PER_STREAM
+
+
+def test_complete_returns_stripped_content(fake_llm_endpoint):
+    async def scenario():
+        llm = LLMClient(endpoint=fake_llm_endpoint, token="test-token", model="fake")
+        try:
+            return await llm.complete([{"role": "user", "content": "hola"}])
+        finally:
+            await llm.close()
+
+    assert asyncio.run(scenario()) == "hola"
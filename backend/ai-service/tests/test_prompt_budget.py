@@ -0,0 +1,64 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from prompt_budget import (  # noqa: E402
+    AI_PROMPT_MAX_TOKENS,
+    SECTION_BUDGETS,
+    estimate_tokens,
+    fit_chat_sections,
+    select_lesson_sections,
+    truncate_code,
+)
+
+LESSON = "\n\n".join(
+    [
+        "# Introducción\nEn esta lección veremos estructuras de control.",
+        "## Condicionales\n" + "El bloque if evalúa una condición booleana. " * 40,
+        "## Bucles for\n" + "Un bucle for recorre los elementos de una lista o range. " * 40,
+        "## Bucles while\n" + "Un bucle while se repite mientras la condición sea verdadera. " * 40,
+    ]
+)
+
+
+def test_small_inputs_are_left_untouched():
+    sections, tokens, truncated = fit_chat_sections(query="¿Qué es un bucle?", code="print(1)", lesson_context="# Hola")
+    assert sections["query"] == "¿Qué es un bucle?"
+    assert sections["code"] == "print(1)"
+    assert sections["lesson_context"] == "# Hola"
+    assert truncated == []
+    assert tokens["code"] == estimate_tokens("print(1)")
+
+
+def test_long_code_keeps_head_and_tail_lines():
+    code = "\n".join(f"linea_{i} = {i}" for i in range(2000))
+    fitted, was_truncated = truncate_code(code, 200)
+    assert was_truncated
+    assert estimate_tokens(fitted) <= 200 + 20
+    assert fitted.startswith("linea_0 = 0")
+    assert fitted.endswith("linea_1999 = 1999")
+    assert "líneas omitidas" in fitted
+
+
+def test_lesson_keeps_the_sections_related_to_the_question():
+    budget = estimate_tokens(LESSON) // 2
+    fitted, was_truncated = select_lesson_sections(LESSON, "mi bucle while no termina", budget)
+    assert was_truncated
+    assert estimate_tokens(fitted) <= budget + 10
+    assert "## Bucles while" in fitted
+    assert "## Condicionales" not in fitted
+    # Original order is kept
+    assert fitted.index("# Introducción") < fitted.index("## Bucles while")
+
+
+def test_total_prompt_stays_within_budget():
+    huge_code = "x = 1\n" * 20000
+    huge_lesson = LESSON * 20
+    sections, tokens, truncated = fit_chat_sections(
+        query="ayuda " * 2000, code=huge_code, lesson_context=huge_lesson, starter_code=huge_code,
+        instruction="Resuelve el ejercicio. " * 500,
+    )
+    assert set(truncated) == {"query", "code", "lesson_context", "starter_code", "instruction"}
+    for name, budget in SECTION_BUDGETS.items():
+        assert tokens[name] <= budget + 20
+    assert sum(tokens.values()) <= AI_PROMPT_MAX_TOKENS + 50
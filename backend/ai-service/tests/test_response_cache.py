@@ -0,0 +1,108 @@
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from response_cache import (  # noqa: E402
+    ResponseCache,
+    SQLiteCacheBackend,
+    error_class,
+    make_cache_key,
+    normalize_code,
+    normalize_layout,
+)
+
+
+def test_formatting_and_comments_do_not_change_the_key():
+    a = "def f(x):\n    return x+1\n"
+    b = "# suma uno\ndef f( x ):\n\n    return x + 1  # resultado\n"
+    assert normalize_code(a) == normalize_code(b)
+    assert make_cache_key("explain", "m", "beginner", a) == make_cache_key("explain", "m", "beginner", b)
+    assert make_cache_key("explain", "m", "beginner", a) != make_cache_key("explain", "m", "beginner", "def f(x):\n    return x+2\n")
+
+
+def test_feedback_and_hint_keys_keep_the_layout():
+    a = "def f(x):\n    return x+1"
+    b = "def f( x ):\n\treturn   x+1   # todo"
+    assert make_cache_key("explain", "m", "beginner", a) == make_cache_key("explain", "m", "beginner", b)
+    for endpoint in ("feedback", "hint"):
+        assert make_cache_key(endpoint, "m", "beginner", a) != make_cache_key(endpoint, "m", "beginner", b)
+        # Trailing whitespace and line endings are not part of the layout
+        assert make_cache_key(endpoint, "m", "beginner", a) == make_cache_key(endpoint, "m", "beginner", "def f(x):  \r\n    return x+1\n\n")
+    assert normalize_layout("x = 1\n\n\ny = 2\n") != normalize_layout("x = 1\ny = 2\n")
+
+
+def test_key_depends_on_endpoint_model_and_level():
+    code = "print('hola')"
+    keys = {
+        make_cache_key("hint", "m", "beginner", code),
+        make_cache_key("explain", "m", "beginner", code),
+        make_cache_key("hint", "other", "beginner", code),
+        make_cache_key("hint", "m", "advanced", code),
+    }
+    assert len(keys) == 4
+
+
+def test_error_message_is_reduced_to_its_class():
+    first = "Traceback (most recent call last):\n  File \"<string>\", line 1\nNameError: name 'x' is not defined"
+    second = "NameError: name 'total' is not defined"
+    assert error_class(first) == error_class(second) == "NameError"
+    assert make_cache_key("hint", "m", code="x", error=first) == make_cache_key("hint", "m", code="x", error=second)
+    assert make_cache_key("hint", "m", code="x", error=first) != make_cache_key("hint", "m", code="x", error="TypeError: boom")
+
+
+def test_near_duplicate_fingerprint_ignores_identifier_names():
+    a = "def area(w, h):\n    return w * h\nprint(area(2, 3))"
+    b = "def rect(ancho, alto):\n    return ancho * alto\nprint(rect(2, 3))"
+    assert normalize_code(a, near_duplicates=False) != normalize_code(b, near_duplicates=False)
+    assert normalize_code(a, near_duplicates=True) == normalize_code(b, near_duplicates=True)
+    # Builtins are part of the program's meaning and are not renamed
+    assert normalize_code("print(x)", near_duplicates=True) != normalize_code("len(x)", near_duplicates=True)
+
+
+def test_unparseable_code_still_gets_a_stable_key():
+    assert normalize_code("def f(:\n    pass  # roto") == normalize_code("def f(:\n    pass")
+
+
+def test_sqlite_backend_ttl_and_lru_eviction(tmp_path):
+    backend = SQLiteCacheBackend(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    backend.set("a", "1", ttl_seconds=60)
+    backend.set("b", "2", ttl_seconds=60)
+    time.sleep(0.01)
+    assert backend.get("a") == "1"  # "b" is now the least recently used
+    backend.set("c", "3", ttl_seconds=60)
+    assert backend.size() == 2
+    assert backend.get("b") is None
+    assert backend.get("a") == "1" and backend.get("c") == "3"
+
+    backend.set("short", "x", ttl_seconds=0)
+    assert backend.get("short") is None
+
+
+def test_response_cache_reports_hit_rate(tmp_path):
+    cache = ResponseCache(SQLiteCacheBackend(str(tmp_path / "cache.sqlite3")), ttl_seconds=60)
+
+    async def scenario():
+        assert await cache.get("k", "hint") is None
+        await cache.set("k", {"content": "pista"})
+        assert await cache.get("k", "hint") == {"content": "pista"}
+        assert await cache.get("k", "hint") == {"content": "pista"}
+
+    asyncio.run(scenario())
+    report = cache.report()
+    assert report["endpoints"]["hint"]["hits"] == 2
+    assert report["endpoints"]["hint"]["misses"] == 1
+    assert report["hit_rate"] == round(2 / 3, 4)
+    assert report["entries"] == 1
+
+
+def test_disabled_cache_is_a_no_op():
+    cache = ResponseCache(None)
+
+    async def scenario():
+        await cache.set("k", {"content": "x"})
+        return await cache.get("k", "hint")
+
+    assert asyncio.run(scenario()) is None
+    assert cache.report()["backend"] is None
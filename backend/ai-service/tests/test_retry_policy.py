@@ -0,0 +1,154 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import retry_policy  # noqa: E402
+from retry_policy import DeadlineExceeded, LatencyTracker, call_with_retries, hedged  # noqa: E402
+
+
+class Retryable(Exception):
+    pass
+
+
+class Fatal(Exception):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(retry_policy, "backoff_delay", lambda attempt: 0.01)
+
+
+def _is_retryable(error):
+    return isinstance(error, (Retryable, asyncio.TimeoutError))
+
+
+def _run(coro_factory):
+    async def scenario():
+        deadline = asyncio.get_running_loop().time()
+        return await coro_factory(deadline)
+
+    return asyncio.run(scenario())
+
+
+def test_retryable_errors_are_retried_until_success():
+    calls = []
+
+    async def attempt():
+        calls.append(1)
+        if len(calls) < 3:
+            raise Retryable()
+        return "ok"
+
+    assert _run(lambda now: call_with_retries(attempt, _is_retryable, now + 5, max_attempts=3)) == "ok"
+    assert len(calls) == 3
+
+
+def test_non_retryable_errors_fail_immediately():
+    calls = []
+
+    async def attempt():
+        calls.append(1)
+        raise Fatal()
+
+    with pytest.raises(Fatal):
+        _run(lambda now: call_with_retries(attempt, _is_retryable, now + 5, max_attempts=3))
+    assert len(calls) == 1
+
+
+def test_last_error_is_raised_when_attempts_run_out():
+    async def attempt():
+        raise Retryable()
+
+    with pytest.raises(Retryable):
+        _run(lambda now: call_with_retries(attempt, _is_retryable, now + 5, max_attempts=2))
+
+
+def test_hung_call_is_cut_at_the_overall_deadline():
+    async def attempt():
+        await asyncio.sleep(60)
+
+    async def scenario(now):
+        with pytest.raises(DeadlineExceeded):
+            await call_with_retries(attempt, _is_retryable, now + 0.1, max_attempts=3)
+        return asyncio.get_running_loop().time() - now
+
+    assert _run(scenario) < 0.5
+
+
+def test_timed_out_attempts_are_retried():
+    calls = []
+
+    async def attempt():
+        calls.append(1)
+        if len(calls) == 1:
+            # The attempt's own timeout (as LLMClient applies it) fires
+            await asyncio.wait_for(asyncio.sleep(60), timeout=0.01)
+        return "ok"
+
+    assert _run(lambda now: call_with_retries(attempt, _is_retryable, now + 5, max_attempts=2)) == "ok"
+
+
+def test_latency_percentile_drives_the_hedge_delay():
+    tracker = LatencyTracker(window=100, min_samples=10)
+    assert tracker.hedge_delay() == retry_policy.AI_HEDGE_DEFAULT_DELAY_SECONDS
+    for i in range(1, 101):
+        tracker.observe(i / 10)
+    assert tracker.percentile(0.95) == pytest.approx(9.6)
+    assert tracker.hedge_delay() == pytest.approx(9.6)
+
+
+def test_fast_primary_is_not_hedged():
+    started = []
+
+    async def primary():
+        return "primary"
+
+    async def secondary():
+        started.append(1)
+        return "secondary"
+
+    assert asyncio.run(hedged(primary, secondary, hedge_after=0.1)) == ("primary", False)
+    assert started == []
+
+
+def test_slow_primary_is_hedged_and_cancelled():
+    cancelled = []
+
+    async def primary():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+
+    async def secondary():
+        await asyncio.sleep(0.01)
+        return "secondary"
+
+    assert asyncio.run(hedged(primary, secondary, hedge_after=0.05)) == ("secondary", True)
+    assert cancelled == [1]
+
+
+def test_failed_primary_falls_back_to_secondary():
+    async def primary():
+        raise Retryable()
+
+    async def secondary():
+        return "secondary"
+
+    assert asyncio.run(hedged(primary, secondary, hedge_after=1)) == ("secondary", True)
+
+
+def test_primary_error_is_reported_when_both_fail():
+    async def primary():
+        raise Fatal("primario")
+
+    async def secondary():
+        raise Retryable("secundario")
+
+    with pytest.raises(Fatal):
+        asyncio.run(hedged(primary, secondary, hedge_after=0.01))
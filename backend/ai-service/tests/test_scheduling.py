@@ -0,0 +1,83 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from scheduling import RateLimitExceeded, TokenBucketScheduler, TokenUsageMetrics  # noqa: E402
+
+
+def test_burst_within_capacity_is_admitted_immediately():
+    async def scenario():
+        scheduler = TokenBucketScheduler(requests_per_minute=60, tokens_per_minute=0, max_wait=5)
+        start = time.monotonic()
+        for _ in range(10):
+            await scheduler.acquire(100)
+        return scheduler, time.monotonic() - start
+
+    scheduler, elapsed = asyncio.run(scenario())
+    assert elapsed < 0.1
+    assert scheduler.stats["admitted"] == 10
+    assert scheduler.stats["queued"] == 0
+
+
+def test_requests_over_capacity_are_queued_then_shed():
+    async def scenario():
+        # 600 requests/minute = one every 0.1 s once the burst of 600 is spent
+        scheduler = TokenBucketScheduler(requests_per_minute=600, tokens_per_minute=0, max_wait=0.25)
+        scheduler.requests.level = 0
+        start = time.monotonic()
+        await scheduler.acquire(1)
+        await scheduler.acquire(1)
+        waited = time.monotonic() - start
+        with pytest.raises(RateLimitExceeded) as shed:
+            for _ in range(5):
+                asyncio.ensure_future(scheduler.acquire(1))
+                await asyncio.sleep(0)
+            await scheduler.acquire(1)
+        return scheduler, waited, shed.value
+
+    scheduler, waited, shed = asyncio.run(scenario())
+    assert 0.15 <= waited < 0.5
+    assert scheduler.stats["shed"] >= 1
+    assert shed.retry_after > 0.25
+
+
+def test_token_bucket_limits_large_prompts():
+    async def scenario():
+        scheduler = TokenBucketScheduler(requests_per_minute=0, tokens_per_minute=6000, max_wait=1)
+        await scheduler.acquire(6000)
+        # The bucket refills 100 tokens/s: another 6000 would need a minute
+        with pytest.raises(RateLimitExceeded):
+            await scheduler.acquire(6000)
+        # Usage turned out far below the estimate, so capacity comes back
+        scheduler.settle(6000, 100)
+        await scheduler.acquire(5000)
+
+    asyncio.run(scenario())
+
+
+def test_upstream_429_pauses_admissions():
+    async def scenario():
+        scheduler = TokenBucketScheduler(requests_per_minute=60, tokens_per_minute=0, max_wait=1)
+        scheduler.penalize(30)
+        with pytest.raises(RateLimitExceeded) as shed:
+            await scheduler.acquire(1)
+        return scheduler, shed.value
+
+    scheduler, shed = asyncio.run(scenario())
+    assert shed.retry_after > 29
+    assert scheduler.report()["upstream_429"] == 1
+
+
+def test_usage_metrics_aggregate_per_endpoint():
+    metrics = TokenUsageMetrics()
+    metrics.record("hint", 100, 50)
+    metrics.record("hint", 300, 150)
+    metrics.record("chat_stream", 1000, 200, estimated=True)
+    report = metrics.report()
+    assert report["prompt_tokens"] == 1400
+    assert report["endpoints"]["hint"]["avg_prompt_tokens"] == 200
+    assert report["endpoints"]["chat_stream"]["estimated_requests"] == 1
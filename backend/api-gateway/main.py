@@ -39,6 +39,15 @@ SERVICE_URLS = {
 }
 
 
+# Headers used for signed service-to-service calls (see backend/shared/internal_auth.py).
+# They must never be accepted from outside, so every proxy strips them.
+INTERNAL_HEADER_PREFIX = "x-internal-"
+
+def is_forwardable_header(name: str, excluded: list) -> bool:
+    name = name.lower()
+    return name not in excluded and not name.startswith(INTERNAL_HEADER_PREFIX)
+
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
@@ -84,7 +93,7 @@ async def content_service_proxy(request: Request, path: str):
             req = client.build_request(
                 method=request.method,
                 url=url,
-                headers={k: v for k, v in request.headers.items() if k.lower() not in ['host']},
+                headers={k: v for k, v in request.headers.items() if is_forwardable_header(k, ['host'])},
                 params=request.query_params,
                 content=await request.body(),
                 timeout=60.0
@@ -142,12 +151,20 @@ async def content_service_proxy(request: Request, path: str):
 @app.api_route("/api/v1/ai/chat/stream", methods=["POST"])
 async def ai_chat_stream(request: Request):
     """Proxy streaming chat to the AI service."""
+    return await proxy_ai_stream(request, "chat/stream")
+
+@app.api_route("/api/v1/ai/feedback/stream", methods=["POST"])
+async def ai_feedback_stream(request: Request):
+    """Proxy streaming code feedback (rule-based review first, then the AI) to the AI service."""
+    return await proxy_ai_stream(request, "feedback/stream")
+
+async def proxy_ai_stream(request: Request, path: str):
     service_name = "ai-service"
     if service_name not in SERVICE_URLS:
         raise HTTPException(status_code=503, detail=f"{service_name.replace('-', ' ').title()} not available")
 
-    url = f"{SERVICE_URLS[service_name]}/chat/stream"
-    headers = {k: v for k, v in request.headers.items() if k.lower() not in ['host', 'content-length']}
+    url = f"{SERVICE_URLS[service_name]}/{path}"
+    headers = {k: v for k, v in request.headers.items() if is_forwardable_header(k, ['host', 'content-length'])}
     body = await request.body()
 
     async def stream_response():
@@ -212,7 +229,7 @@ async def user_service_proxy(request: Request, path: str):
             method_upper = request.method.upper()
             headers = {
                 k: v for k, v in request.headers.items()
-                if k.lower() not in ['host', 'content-length', 'connection', 'transfer-encoding', 'user-agent']
+                if is_forwardable_header(k, ['host', 'content-length', 'connection', 'transfer-encoding', 'user-agent'])
             }
             # For file downloads, a long timeout might be needed if generation is slow,
             # but user-service generates to BytesIO first, so this is for the transfer.
@@ -0,0 +1,200 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# Redis client for caching
+redis_host = os.getenv("REDIS_HOST", "redis")
+redis_port = os.getenv("REDIS_PORT", 6379)
+redis_user = os.getenv("REDIS_USER", None)
+redis_password = os.getenv("REDIS_PASSWORD", None)
+redis_client = redis.Redis(host=redis_host, username=redis_user, password=redis_password, port=redis_port, decode_responses=True)
+
+# --- Content tree cache settings ---
+CONTENT_VERSION_KEY = "content:version"
+CONTENT_CACHE_TTL = int(os.getenv("CONTENT_CACHE_TTL", 3600))  # Redis TTL per entry
+L1_MAX_ENTRIES = int(os.getenv("CONTENT_L1_MAX_ENTRIES", 2048))
+L1_TTL_SECONDS = float(os.getenv("CONTENT_L1_TTL_SECONDS", 300))
+VERSION_CHECK_INTERVAL = float(os.getenv("CONTENT_VERSION_CHECK_INTERVAL", 2))  # seconds between version reads
+LOCK_TTL_MS = 10_000  # Redis fill lock expiry, in case the filling worker dies
+LOCK_WAIT_SECONDS = 3.0  # How long to wait for another worker to fill the key
+LOCK_POLL_SECONDS = 0.05
+
+
+class ContentCache:
+    """
+    Read-through cache for the course -> module -> lesson -> exercise tree.
+
+    Keys are namespaced by a global content version (`content:version` in Redis).
+    Any write or reseed bumps the version, which makes every older entry unreachable;
+    stale entries then age out through their TTL. Reads go through a small in-process
+    LRU (L1) before Redis, and misses are single-flighted both across threads
+    (per-key lock) and across workers (Redis SET NX lock) so only one caller loads
+    a given key from Postgres.
+    """
+
+    def __init__(self, client: redis.Redis):
+        self.client = client
+        self._l1: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._l1_lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._key_locks_guard = threading.Lock()
+        self._version = 0
+        self._version_checked_at = 0.0
+
+    # --- Version handling ---
+    def current_version(self) -> int:
+        now = time.monotonic()
+        if now - self._version_checked_at < VERSION_CHECK_INTERVAL:
+            return self._version
+        try:
+            value = self.client.get(CONTENT_VERSION_KEY)
+            version = int(value) if value else 0
+        except Exception as e:
+            # Keep serving from L1 with the last known version while Redis is unavailable
+            logger.error(f"Redis GET error for {CONTENT_VERSION_KEY}: {e}")
+            return self._version
+        if version != self._version:
+            logger.info(f"Content version changed {self._version} -> {version}, clearing L1 cache")
+            self._clear_l1()
+            self._version = version
+        self._version_checked_at = now
+        return version
+
+    def bump_version(self) -> Optional[int]:
+        """Invalidates the whole content tree. Call after any committed content write."""
+        try:
+            version = int(self.client.incr(CONTENT_VERSION_KEY))
+        except Exception as e:
+            logger.error(f"Redis INCR error for {CONTENT_VERSION_KEY}: {e}")
+            version = None
+        self._clear_l1()
+        self._version_checked_at = 0.0
+        return version
+
+    # --- L1 (in-process) ---
+    def _l1_get(self, key: str) -> Optional[str]:
+        with self._l1_lock:
+            entry = self._l1.get(key)
+            if entry is None:
+                return None
+            expires_at, payload = entry
+            if expires_at < time.monotonic():
+                del self._l1[key]
+                return None
+            self._l1.move_to_end(key)
+            return payload
+
+    def _l1_set(self, key: str, payload: str) -> None:
+        with self._l1_lock:
+            self._l1[key] = (time.monotonic() + L1_TTL_SECONDS, payload)
+            self._l1.move_to_end(key)
+            while len(self._l1) > L1_MAX_ENTRIES:
+                self._l1.popitem(last=False)
+
+    def _clear_l1(self) -> None:
+        with self._l1_lock:
+            self._l1.clear()
+        with self._key_locks_guard:
+            self._key_locks.clear()
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._key_locks_guard:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = threading.Lock()
+                self._key_locks[key] = lock
+            return lock
+
+    # --- Redis (L2) ---
+    def _redis_get(self, key: str) -> Optional[str]:
+        try:
+            return self.client.get(key)
+        except Exception as e:
+            logger.error(f"Redis GET error for {key}: {e}")
+            return None
+
+    def _redis_set(self, key: str, payload: str) -> None:
+        try:
+            self.client.setex(key, CONTENT_CACHE_TTL, payload)
+        except Exception as e:
+            logger.error(f"Redis SETEX error for {key}: {e}")
+
+    def _acquire_fill_lock(self, lock_key: str) -> bool:
+        try:
+            return bool(self.client.set(lock_key, "1", nx=True, px=LOCK_TTL_MS))
+        except Exception as e:
+            logger.error(f"Redis SET NX error for {lock_key}: {e}")
+            return True  # Redis unavailable: nobody else can fill it either
+
+    def _release_fill_lock(self, lock_key: str) -> None:
+        try:
+            self.client.delete(lock_key)
+        except Exception as e:
+            logger.error(f"Redis DELETE error for {lock_key}: {e}")
+
+    def _wait_for_fill(self, key: str) -> Optional[str]:
+        deadline = time.monotonic() + LOCK_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_SECONDS)
+            payload = self._redis_get(key)
+            if payload is not None:
+                return payload
+        return None
+
+    # --- Public API ---
+    def get_or_load(self, key: str, loader: Callable[[], Any]) -> Any:
+        """
+        Returns the cached value for `key`, calling `loader` on a miss.
+        The loader must return JSON-serialisable data; None is cached too (negative caching).
+        A fresh copy is returned on every call, so callers may mutate the result.
+        """
+        full_key = f"content:v{self.current_version()}:{key}"
+
+        payload = self._l1_get(full_key)
+        if payload is not None:
+            return json.loads(payload)
+
+        payload = self._redis_get(full_key)
+        if payload is not None:
+            self._l1_set(full_key, payload)
+            return json.loads(payload)
+
+        with self._key_lock(full_key):
+            # Another thread may have filled it while we waited for the lock
+            payload = self._l1_get(full_key)
+            if payload is not None:
+                return json.loads(payload)
+
+            lock_key = f"lock:{full_key}"
+            if self._acquire_fill_lock(lock_key):
+                try:
+                    payload = self._redis_get(full_key)
+                    if payload is None:
+                        logger.debug(f"Content cache MISS: {full_key}. Loading from DB.")
+                        payload = json.dumps(loader())
+                        self._redis_set(full_key, payload)
+                finally:
+                    self._release_fill_lock(lock_key)
+            else:
+                payload = self._wait_for_fill(full_key)
+                if payload is None:
+                    logger.warning(f"Timed out waiting for {full_key} to be filled. Loading from DB.")
+                    payload = json.dumps(loader())
+
+            self._l1_set(full_key, payload)
+            return json.loads(payload)
+
+
+content_cache = ContentCache(redis_client)
+
+
+def bump_content_version() -> Optional[int]:
+    return content_cache.bump_version()
@@ -1,7 +1,8 @@
 from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 import routes
-from database import engine, Base
+from database import engine, Base, SessionLocal
+from navigation import get_navigation_index
 import logging
 
 # Create database tables
@@ -19,6 +20,17 @@ app.add_middleware(
 
 app.include_router(routes.router, prefix="/api/v1/content")
 
+@app.on_event("startup")
+def build_navigation_index_on_startup():
+    db = SessionLocal()
+    try:
+        get_navigation_index(db)
+    except Exception as e:
+        # The index is rebuilt lazily on the first lookup if this fails
+        logging.getLogger(__name__).error(f"Could not build navigation index on startup: {e}")
+    finally:
+        db.close()
+
 
 @app.get("/health")
 async def health_check():
@@ -0,0 +1,102 @@
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from cache import content_cache
+from models import Lesson, Module
+
+logger = logging.getLogger(__name__)
+
+
+class NavigationIndex:
+    """
+    Ordered, in-memory view of the course -> module -> lesson tree used for navigation.
+    Built from two column-only queries; every lookup afterwards is a dictionary hit.
+    """
+
+    def __init__(self, version: int, modules: List[tuple], lessons: List[tuple]):
+        self.version = version
+        self.modules: Dict[int, dict] = {}  # module_id -> {"id", "course_id", "title"}
+        self.lessons: Dict[int, dict] = {}  # lesson_id -> {"id", "title", "module_id"}
+        self.module_order: Dict[int, List[int]] = {}  # course_id -> ordered module ids
+        self.lesson_order: Dict[int, List[int]] = {}  # module_id -> ordered lesson ids
+        self.first_lesson_by_module: Dict[int, int] = {}
+        self.next_lesson_id: Dict[int, Optional[int]] = {}
+
+        for module_id, course_id, title, order_index in sorted(modules, key=lambda m: (m[1], m[3], m[0])):
+            self.modules[module_id] = {"id": module_id, "course_id": course_id, "title": title}
+            self.module_order.setdefault(course_id, []).append(module_id)
+
+        for lesson_id, module_id, title, order_index in sorted(lessons, key=lambda l: (l[1], l[3], l[0])):
+            if module_id not in self.modules:
+                continue
+            self.lessons[lesson_id] = {"id": lesson_id, "title": title, "module_id": module_id}
+            self.lesson_order.setdefault(module_id, []).append(lesson_id)
+
+        for module_id, lesson_ids in self.lesson_order.items():
+            self.first_lesson_by_module[module_id] = lesson_ids[0]
+            for position, lesson_id in enumerate(lesson_ids):
+                self.next_lesson_id[lesson_id] = lesson_ids[position + 1] if position + 1 < len(lesson_ids) else None
+
+        # Crossing a module boundary: the next lesson is the first lesson of the following
+        # module in the course.
+        for module_ids in self.module_order.values():
+            for position, module_id in enumerate(module_ids):
+                lesson_ids = self.lesson_order.get(module_id)
+                if not lesson_ids:
+                    continue
+                if position + 1 < len(module_ids):
+                    self.next_lesson_id[lesson_ids[-1]] = self.first_lesson_by_module.get(module_ids[position + 1])
+
+    @classmethod
+    def build(cls, db: Session, version: int) -> "NavigationIndex":
+        # Soft-deleted content is left out, so navigation never points at it
+        modules = db.query(Module.id, Module.course_id, Module.title, Module.order_index).filter(
+            Module.is_active.isnot(False)
+        ).all()
+        lessons = db.query(Lesson.id, Lesson.module_id, Lesson.title, Lesson.order_index).filter(
+            Lesson.is_active.isnot(False)
+        ).all()
+        index = cls(version, modules, lessons)
+        logger.info(f"Built navigation index v{version}: {len(index.modules)} modules, {len(index.lessons)} lessons")
+        return index
+
+    def _lesson_info(self, lesson_id: Optional[int]) -> Optional[Dict]:
+        if lesson_id is None:
+            return None
+        lesson = self.lessons[lesson_id]
+        module = self.modules[lesson["module_id"]]
+        return {
+            "id": lesson["id"],
+            "title": lesson["title"],
+            "module_id": module["id"],
+            "module_title": module["title"],
+        }
+
+    def next_lesson(self, lesson_id: int) -> Optional[Dict]:
+        return self._lesson_info(self.next_lesson_id.get(lesson_id))
+
+    def first_lesson_of_module(self, module_id: int) -> Optional[Dict]:
+        return self._lesson_info(self.first_lesson_by_module.get(module_id))
+
+    def modules_for_course(self, course_id: int) -> List[int]:
+        return list(self.module_order.get(course_id, []))
+
+
+# --- Process-wide index, rebuilt when the content version changes ---
+_navigation_index: Optional[NavigationIndex] = None
+_navigation_lock = threading.Lock()
+
+
+def get_navigation_index(db: Session) -> NavigationIndex:
+    global _navigation_index
+    version = content_cache.current_version()
+    index = _navigation_index
+    if index is not None and index.version == version:
+        return index
+    with _navigation_lock:
+        if _navigation_index is None or _navigation_index.version != version:
+            _navigation_index = NavigationIndex.build(db, version)
+        return _navigation_index
@@ -1,13 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.responses import FileResponse
 import os
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, undefer_group
 import models # Ensure models is imported (e.g., from ..shared import models or similar)
 from typing import List, Optional, Dict # Ensure List and Optional are imported
 import services, schemas # Ensure services and schemas are imported
 from database import get_db # Ensure get_db is imported
 import logging
 from services import get_user_context
+from shared.models import EXERCISE_BODY
 
 logger = logging.getLogger("content-service")
 
@@ -83,7 +84,7 @@ async def read_modules_for_course_with_lock_status_standalone_route( # Renamed
     modules = await services.get_modules_by_course_with_lock_status(db, course_id, user_id, token)
     return modules
 
-@router.get("/modules/{module_id}/lessons", response_model=List[schemas.LessonSchema])
+@router.get("/modules/{module_id}/lessons", response_model=List[schemas.LessonSummarySchema])
 async def read_lessons_for_module_with_lock_status_standalone_route( # Renamed
     module_id: int,
     db: Session = Depends(get_db),
@@ -104,8 +105,8 @@ def get_lesson_route(lesson_id: int, db: Session = Depends(get_db)):
     # Calculate and attach the next lesson info before returning
     next_lesson_info = services.get_next_lesson_info(db, lesson_id)
 
-    # Pydantic will automatically pick up this attribute when creating the response
-    lesson.next_lesson = next_lesson_info
+    # The cached lesson is a fresh dict per call, so it is safe to extend it here
+    lesson["next_lesson"] = next_lesson_info
 
     return lesson
 
@@ -115,7 +116,7 @@ def get_exercises_for_lesson_route(lesson_id: int, db: Session = Depends(get_db)
     if lesson is None:
         raise HTTPException(status_code=404, detail="Lesson not found")
 
-    exercises = services.get_exercises(db, lesson_id=lesson.id)
+    exercises = services.get_exercises(db, lesson_id=lesson["id"])
     return exercises
 
 @router.get("/exercises/{exercise_id}", response_model=schemas.Exercise)
@@ -209,7 +210,7 @@ def read_course_exam_exercises( # Renamed for clarity if needed, but name is fin
     by having module_id and lesson_id as NULL.
     Optionally, could also filter by validation_type == 'exam'.
     """
-    exam_exercises = db.query(models.Exercise).filter(
+    exam_exercises = db.query(models.Exercise).options(undefer_group(EXERCISE_BODY)).filter(
         models.Exercise.course_id == course_id,
         models.Exercise.module_id == None,  # Check for NULL module_id
         models.Exercise.lesson_id == None,  # Check for NULL lesson_id
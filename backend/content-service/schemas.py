@@ -11,12 +11,14 @@ class ExerciseSchema(BaseModel): # Renamed from Exercise for clarity if it's a P
     class Config:
         from_attributes = True
 
-class LessonSchema(BaseModel): # Renamed from Lesson for clarity
+LESSON_SUMMARY_LENGTH = 160
+
+class LessonSummarySchema(BaseModel): # Lesson as listed in navigation; the body is served by /lessons/{id}
     id: int
     title: str
     module_id: int
     order_index: int
-    content: Optional[str] = None # Keep if needed, or make a LessonBasicSchema
+    summary: Optional[str] = None # First LESSON_SUMMARY_LENGTH characters of the content
     # lesson_type: str # Add if you have different types of lessons
     # exercises: List[ExerciseSchema] = [] # If exercises are nested under lessons
     is_locked: bool = False # ADDED
@@ -33,7 +35,7 @@ class ModuleSchema(BaseModel): # Renamed from Module for clarity
     # level: Optional[str] = None # From your get_modules example
     lesson_count: Optional[int] = 0 # This will be the count of lessons returned
     # image_url: Optional[str] = None # From your get_modules example
-    lessons: List[LessonSchema] = [] # ADDED: To nest lessons with their lock status
+    lessons: List[LessonSummarySchema] = [] # ADDED: To nest lessons with their lock status
     is_locked: bool = False # ADDED
     is_exam: Optional[bool] = None # ADDED: If modules can be exams
 
@@ -124,7 +126,7 @@ class ModuleCreate(ModuleBase):
 class Module(ModuleBase):
     lesson_count: Optional[int] = 0
     is_exam: bool
-    lessons: List[LessonSchema] = []
+    lessons: List[LessonSummarySchema] = []
     class Config:
         from_attributes = True
 
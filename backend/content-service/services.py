@@ -1,30 +1,27 @@
 from http.client import HTTPException
-from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy.orm import Session, joinedload, selectinload, undefer_group
 import random
 from fastapi import Request, Depends
 from sqlalchemy import func
-from typing import Optional, Dict, List, Any # Ensure Dict and List are imported
+from typing import Optional, Dict, List, Any, Tuple # Ensure Dict and List are imported
 import models # Assuming your models are in models.py (e.g., models.Lesson, models.Module, models.Course)
 import schemas # Assuming your Pydantic schemas are in schemas.py
-import redis
 import os
 from jose import jwt, JWTError
 import json
 import httpx # ADDED for async HTTP calls
+import asyncio
 from models import (
     Module, Lesson, Exercise, Course, UserCourseEnrollment, CourseRating,
     User, UserModuleProgress, UserLessonProgress  # <-- Add these
 )
-from schemas import ModuleCreate, LessonCreate, ExerciseCreate
+from schemas import ModuleCreate, LessonCreate, ExerciseCreate, LESSON_SUMMARY_LENGTH
+from shared.models import LESSON_BODY, EXERCISE_BODY
 import logging
 import hashlib
-# Redis client for caching
-redis_host = os.getenv("REDIS_HOST", "redis")
-redis_port = os.getenv("REDIS_PORT", 6379)
-redis_user = os.getenv("REDIS_USER", None)
-redis_password = os.getenv("REDIS_PASSWORD", None)
-redis_client = redis.Redis(host=redis_host, username=redis_user, password=redis_password, port=redis_port, decode_responses=True)
-CACHE_TTL = 3600  # 1 hour
+from cache import redis_client, content_cache, bump_content_version
+from navigation import get_navigation_index
+from shared.internal_auth import internal_auth_enabled, sign_internal_request
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")  # Use the same key as user-service
 ALGORITHM = os.getenv("ALGORITHM", "HS256")  # Use the same algorithm as user-service
@@ -34,14 +31,81 @@ USER_SERVICE_URL = os.getenv("USER_SERVICE_URL/api/v1/users", "http://user-servi
 logger = logging.getLogger(__name__) # Use the existing logger or the one from the top
 logger.info(f"Using USER_SERVICE_URL: {USER_SERVICE_URL}")
 
+# --- Per-user progress cache ---
+# Progress responses from user-service are cached per user under the user's progress
+# version. user-service bumps `progress_version:{user_id}` after every committed
+# progress change, so a new version simply makes older cache entries unreachable
+# and they expire through PROGRESS_CACHE_TTL.
+PROGRESS_CACHE_TTL = 600  # 10 minutes
+
+def _ids_digest(ids: List[int]) -> str:
+    # Sort IDs to ensure cache key consistency regardless of input order
+    sorted_ids_str = ",".join(map(str, sorted(set(ids)))) # Ensure unique, sorted IDs
+    return hashlib.md5(sorted_ids_str.encode()).hexdigest()
+
+# Keys written by user-service on login/refresh; a bumped generation revokes every session
+TOKEN_GENERATION_KEY = "token_generation"
+
+def _session_token_is_current(token: str) -> bool:
+    """True if the bearer token is still the one user-service stores for its user (not logged out or replaced)."""
+    try:
+        username = jwt.get_unverified_claims(token).get("sub")  # Signature already checked by get_user_context
+        if not username:
+            return False
+        generation = redis_client.get(TOKEN_GENERATION_KEY) or 0
+        return redis_client.get(f"token:{generation}:{username}") == token
+    except Exception as e:
+        logger.error(f"Could not check session token in Redis: {e}")
+        return False
+
+def _user_service_headers(user_id: int, token: str, target_url: str) -> Dict[str, str]:
+    """
+    Signs the call with the internal service secret so user-service trusts the
+    already-decoded user_id without re-authenticating it. A signed user_id skips
+    user-service's revocation check, so the call is only signed for a token that is
+    still stored; otherwise (or without INTERNAL_SERVICE_SECRET) the user's bearer
+    token is forwarded and user-service decides.
+    """
+    internal_headers = {}
+    if internal_auth_enabled() and _session_token_is_current(token):
+        internal_headers = sign_internal_request("content-service", user_id, "POST", httpx.URL(target_url).path)
+    return internal_headers or {"Authorization": f"Bearer {token}"}
+
 # --- Helper for creating cache keys for batch requests ---
-def _create_batch_cache_key(user_id: int, item_type: str, ids: List[int]) -> str:
+def _create_batch_cache_key(user_id: int, item_type: str, ids: List[int], version: int = 0) -> str:
     if not ids:
-        return f"user:{user_id}:batch_{item_type}_progress:empty"
-    # Sort IDs to ensure cache key consistency regardless of input order
-    sorted_ids_str = ",".join(map(str, sorted(list(set(ids))))) # Ensure unique, sorted IDs
-    ids_hash = hashlib.md5(sorted_ids_str.encode()).hexdigest()
-    return f"user:{user_id}:batch_{item_type}_progress:{ids_hash}"
+        return f"user:{user_id}:v{version}:batch_{item_type}_progress:empty"
+    return f"user:{user_id}:v{version}:batch_{item_type}_progress:{_ids_digest(ids)}"
+
+def _get_user_progress_version(user_id: int) -> Optional[int]:
+    """Reads the user's progress version. Returns None if Redis is unavailable (cache bypassed)."""
+    try:
+        value = redis_client.get(f"progress_version:{user_id}")
+        return int(value) if value else 0
+    except Exception as e:
+        logger.error(f"Redis GET error for progress version of U{user_id}: {e}")
+        return None
+
+def _progress_cache_get(cache_key: Optional[str]) -> Optional[Any]:
+    if cache_key is None:
+        return None
+    try:
+        cached_data = redis_client.get(cache_key)
+        if cached_data:
+            logger.debug(f"Cache HIT for progress: {cache_key}")
+            return json.loads(cached_data)
+    except Exception as e:
+        logger.error(f"Redis GET error for {cache_key}: {e}")
+    logger.debug(f"Cache MISS for progress: {cache_key}")
+    return None
+
+def _progress_cache_set(cache_key: Optional[str], data: Any) -> None:
+    if cache_key is None:
+        return
+    try:
+        redis_client.setex(cache_key, PROGRESS_CACHE_TTL, json.dumps(data))
+    except Exception as e:
+        logger.error(f"Redis SETEX error for {cache_key}: {e}")
 
 # --- New Batch Fetching Functions (internal to content-service) ---
 async def _fetch_batch_module_progress(
@@ -50,22 +114,18 @@ async def _fetch_batch_module_progress(
     if not module_ids:
         return {}
 
-    # cache_key = _create_batch_cache_key(user_id, "module", module_ids) # Assuming _create_batch_cache_key exists
-    # try:
-    #     cached_data = redis_client.get(cache_key)
-    #     if cached_data:
-    #         logger.debug(f"Cache HIT for batch module progress: {cache_key}")
-    #         return json.loads(cached_data)
-    # except Exception as e:
-    #     logger.error(f"Redis GET error for {cache_key}: {e}")
-
-    # logger.debug(f"Cache MISS for batch module progress: {cache_key}. Fetching from user-service.")
-    headers = {"Authorization": f"Bearer {token}"}
+    version = _get_user_progress_version(user_id)
+    cache_key = _create_batch_cache_key(user_id, "module", module_ids, version) if version is not None else None
+    cached_data = _progress_cache_get(cache_key)
+    if cached_data is not None:
+        return {int(k): v for k, v in cached_data.items()}
+
     payload = {"module_ids": module_ids}
     progress_map: Dict[int, Any] = {}
 
     target_url = f"{USER_SERVICE_URL}/modules/progress/batch"
-    logger.info(f"Calling User Service (batch module progress). Method: POST, URL: {target_url}, Headers: {headers}, Payload: {payload}")
+    headers = _user_service_headers(user_id, token, target_url)
+    logger.info(f"Calling User Service (batch module progress). Method: POST, URL: {target_url}, U{user_id}, Payload: {payload}")
 
     try:
         resp = await client.post(target_url, json=payload, headers=headers)
@@ -74,12 +134,7 @@ async def _fetch_batch_module_progress(
         # user-service returns {"progress": {id: progress_obj, ...}}
         # So, data.get("progress", {}) gives {id_str: progress_obj, ...}
         progress_map = {int(k): v for k, v in data.get("progress", {}).items()}
-
-        # try:
-        #     redis_client.setex(cache_key, 3600, json.dumps(progress_map)) # CACHE_TTL
-        #     logger.debug(f"Cached batch module progress: {cache_key}")
-        # except Exception as e:
-        #     logger.error(f"Redis SETEX error for {cache_key}: {e}")
+        _progress_cache_set(cache_key, progress_map)
 
     except httpx.HTTPStatusError as e:
         logger.error(f"HTTP error fetching batch module progress for U{user_id} M_IDs {module_ids}: {e.response.status_code} - {e.response.text}", exc_info=True)
@@ -95,34 +150,25 @@ async def _fetch_batch_lesson_progress(
     if not lesson_ids:
         return {}
 
-    # cache_key = _create_batch_cache_key(user_id, "lesson", lesson_ids)
-    # try:
-    #     cached_data = redis_client.get(cache_key)
-    #     if cached_data:
-    #         logger.debug(f"Cache HIT for batch lesson progress: {cache_key}")
-    #         return json.loads(cached_data)
-    # except Exception as e:
-    #     logger.error(f"Redis GET error for {cache_key}: {e}")
-
-    # logger.debug(f"Cache MISS for batch lesson progress: {cache_key}. Fetching from user-service.")
-    headers = {"Authorization": f"Bearer {token}"}
+    version = _get_user_progress_version(user_id)
+    cache_key = _create_batch_cache_key(user_id, "lesson", lesson_ids, version) if version is not None else None
+    cached_data = _progress_cache_get(cache_key)
+    if cached_data is not None:
+        return {int(k): v for k, v in cached_data.items()}
+
     payload = {"lesson_ids": lesson_ids}
     progress_map: Dict[int, Any] = {}
 
     target_url = f"{USER_SERVICE_URL}/lessons/progress/batch"
-    logger.info(f"Calling User Service (batch lesson progress). Method: POST, URL: {target_url}, Headers: {headers}, Payload: {payload}")
+    headers = _user_service_headers(user_id, token, target_url)
+    logger.info(f"Calling User Service (batch lesson progress). Method: POST, URL: {target_url}, U{user_id}, Payload: {payload}")
 
     try:
         resp = await client.post(target_url, json=payload, headers=headers)
         resp.raise_for_status()
         data = resp.json()
         progress_map = {int(k): v for k, v in data.get("progress", {}).items()}
-
-        # try:
-        #     redis_client.setex(cache_key, 3600, json.dumps(progress_map)) # CACHE_TTL
-        #     logger.debug(f"Cached batch lesson progress: {cache_key}")
-        # except Exception as e:
-        #     logger.error(f"Redis SETEX error for {cache_key}: {e}")
+        _progress_cache_set(cache_key, progress_map)
 
     except httpx.HTTPStatusError as e:
         logger.error(f"HTTP error fetching batch lesson progress for U{user_id} L_IDs {lesson_ids}: {e.response.status_code} - {e.response.text}", exc_info=True)
@@ -131,125 +177,221 @@ async def _fetch_batch_lesson_progress(
 
     return progress_map
 
-def get_modules(db: Session, skip: int = 0, limit: int = 100):
-    # Try to get from cache
-    cached = redis_client.get("modules:list")
-    if cached:
-        return json.loads(cached)
-
-    # Get from DB if not cached
-    modules = db.query(Module).order_by(Module.order).offset(skip).limit(limit).all()
-
-    # Cache the result
-    module_list = []
-    for module in modules:
-        lesson_count = db.query(Lesson).filter(Lesson.module_id == module.id).count()
-        module_list.append({
-            "id": modules.id,
-            "title": modules.title,
-            "description": modules.description,
-            "level": modules.level,
-            "lesson_count": lesson_count,
-            "image_url": module.image_url
-        })
-
-    redis_client.setex("modules:list", CACHE_TTL, json.dumps(module_list))
-    return module_list
+def _progress_is_completed(progress: Any) -> bool:
+    # The lesson batch endpoint returns bare booleans while the module batch endpoint
+    # returns full progress objects, so accept both shapes.
+    if isinstance(progress, dict):
+        return bool(progress.get("is_completed", False))
+    return bool(progress)
 
-def get_module(db: Session, module_id: str):
-    # Try to get from cache
-    cached = redis_client.get(f"module:{module_id}")
-    if cached:
-        return json.loads(cached)
-
-    # Get from DB if not cached
-    module = db.query(Module).filter(Module.id == module_id).first()
-    if not module:
-        return None
+async def _fetch_course_progress_snapshot(
+    user_id: int, token: str, module_ids: List[int], lesson_ids: List[int], client: httpx.AsyncClient
+) -> Tuple[Dict[int, bool], Dict[int, bool]]:
+    """
+    Fetches completion flags for every module and lesson id of a course in a single
+    call to user-service. Returns (module_completion_map, lesson_completion_map).
+    """
+    if not module_ids and not lesson_ids:
+        return {}, {}
+
+    version = _get_user_progress_version(user_id)
+    cache_key = None
+    if version is not None:
+        cache_key = f"{_create_batch_cache_key(user_id, 'snapshot', module_ids, version)}:{_ids_digest(lesson_ids)}"
+    cached_data = _progress_cache_get(cache_key)
+    if cached_data is not None:
+        return (
+            {int(k): v for k, v in cached_data.get("modules", {}).items()},
+            {int(k): v for k, v in cached_data.get("lessons", {}).items()},
+        )
+
+    payload = {"module_ids": module_ids, "lesson_ids": lesson_ids}
+    target_url = f"{USER_SERVICE_URL}/progress/snapshot"
+    headers = _user_service_headers(user_id, token, target_url)
+    logger.info(f"Calling User Service (course progress snapshot). URL: {target_url}, U{user_id}, {len(module_ids)} modules, {len(lesson_ids)} lessons")
 
-    # Don't cache the full module with lessons to save memory
-    return module
+    try:
+        resp = await client.post(target_url, json=payload, headers=headers)
+        if resp.status_code == 404:
+            # Older user-service without the snapshot endpoint: fall back to the two
+            # batch endpoints, which are independent and can run concurrently.
+            logger.warning("Progress snapshot endpoint not available, falling back to batch endpoints.")
+            module_progress, lesson_progress = await asyncio.gather(
+                _fetch_batch_module_progress(user_id, token, module_ids, client),
+                _fetch_batch_lesson_progress(user_id, token, lesson_ids, client),
+            )
+            return (
+                {mid: _progress_is_completed(p) for mid, p in module_progress.items()},
+                {lid: _progress_is_completed(p) for lid, p in lesson_progress.items()},
+            )
+        resp.raise_for_status()
+        data = resp.json()
+        module_map = {int(k): bool(v) for k, v in data.get("modules", {}).items()}
+        lesson_map = {int(k): bool(v) for k, v in data.get("lessons", {}).items()}
+        _progress_cache_set(cache_key, {"modules": module_map, "lessons": lesson_map})
+        return module_map, lesson_map
+    except httpx.HTTPStatusError as e:
+        logger.error(f"HTTP error fetching progress snapshot for U{user_id}: {e.response.status_code} - {e.response.text}", exc_info=True)
+    except Exception as e:
+        logger.error(f"Unexpected error fetching progress snapshot for U{user_id}: {e}", exc_info=True)
+
+    return {}, {}
+
+def _lesson_summaries_query(db: Session):
+    """Lesson columns for navigation lists: a short preview instead of the full content."""
+    return db.query(
+        Lesson.id,
+        Lesson.title,
+        Lesson.module_id,
+        Lesson.order_index,
+        func.substr(Lesson.content, 1, LESSON_SUMMARY_LENGTH).label("summary"),
+    )
 
-def get_lessons(db: Session, module_id: str):
-    # Try to get from cache
-    cached = redis_client.get(f"module:{module_id}:lessons")
-    if cached:
-        return json.loads(cached)
+def _apply_lesson_lock_status(db_lessons: list, lesson_completion: Dict[int, bool], authenticated: bool) -> List[schemas.LessonSummarySchema]:
+    """
+    Builds LessonSummarySchema instances for an ordered list of lesson rows of one module.
+    The first lesson is always open; every other lesson is locked until its
+    predecessor is completed (or always locked for unauthenticated users).
+    """
+    processed_lessons = []
+    for i, lesson_db_model in enumerate(db_lessons):
+        current_lesson_locked = False
+        if i > 0:
+            predecessor_lesson_id = db_lessons[i-1].id
+            previous_lesson_completed = authenticated and lesson_completion.get(predecessor_lesson_id, False)
+            current_lesson_locked = not previous_lesson_completed
+
+        lesson_schema_instance = schemas.LessonSummarySchema.from_orm(lesson_db_model)
+        lesson_schema_instance.is_locked = current_lesson_locked
+        processed_lessons.append(lesson_schema_instance)
+    return processed_lessons
 
-    # Get from DB if not cached
-    lessons = db.query(Lesson).filter(Lesson.module_id == module_id).order_by(Lesson.order_index).all()
+# --- Content tree reads (cached, see cache.py) ---
+# Content removed from the seed is soft-deleted (is_active=False) and never served as part of
+# the tree. A seed sync bumps the content version, so cached reads drop it as well.
+ACTIVE_COURSE = Course.is_active.isnot(False)
+ACTIVE_MODULE = Module.is_active.isnot(False)
+ACTIVE_LESSON = Lesson.is_active.isnot(False)
+ACTIVE_EXERCISE = Exercise.is_active.isnot(False)
 
-    lesson_list = [{
+def _lesson_to_dict(lesson: Lesson) -> dict:
+    return {
         "id": lesson.id,
         "title": lesson.title,
         "module_id": lesson.module_id,
         "order_index": lesson.order_index,
+        "duration_minutes": lesson.duration_minutes,
         "content": lesson.content,
-    } for lesson in lessons]
-
-    redis_client.setex(f"module:{module_id}:lessons", CACHE_TTL, json.dumps(lesson_list))
-    return lesson_list
-
-def get_lesson(db: Session, lesson_id):
-    logger.info(f"Fetching lesson with id={lesson_id}")
-    lesson = db.query(Lesson).filter(Lesson.id == lesson_id).first()
-    if not lesson:
-        logger.warning(f"Lesson {lesson_id} not found in DB")
-        return None
-    return lesson
-
-def get_exercises(db: Session, lesson_id: str):
-    lesson_id = int(lesson_id)  # Ensure lesson_id is an integer
-    cached = redis_client.get(f"lesson:{lesson_id}:exercises")
-    if cached:
-        return json.loads(cached)
+    }
 
-    # Get from DB if not cached
-    exercises = db.query(Exercise).filter(Exercise.lesson_id == lesson_id).order_by(Exercise.order_index).all()
+def _module_to_dict(module: Module, lesson_count: int) -> dict:
+    return {
+        "id": module.id,
+        "course_id": module.course_id,
+        "title": module.title,
+        "description": module.description,
+        "order_index": module.order_index,
+        "duration_minutes": module.duration_minutes,
+        "is_exam": bool(module.is_exam),
+        "lesson_count": lesson_count,
+    }
 
-    exercise_list = [{
+def _exercise_to_dict(exercise: Exercise) -> dict:
+    return {
         "id": exercise.id,
         "title": exercise.title,
         "lesson_id": exercise.lesson_id,
+        "module_id": exercise.module_id,
         "order_index": exercise.order_index,
-        "instructions": exercise.instructions,
         "description": exercise.description,
+        "instructions": exercise.instructions,
         "starter_code": exercise.starter_code,
+        "hints": exercise.hints,
         "validation_type": exercise.validation_type,
         "validation_rules": exercise.validation_rules,
-        "hints": exercise.hints
-    } for exercise in exercises]
+        "explanation": exercise.explanation,
+    }
+
+def get_modules(db: Session, skip: int = 0, limit: int = 100):
+    def load():
+        lesson_counts = (
+            db.query(Lesson.module_id, func.count(Lesson.id).label("lesson_count"))
+            .filter(ACTIVE_LESSON)
+            .group_by(Lesson.module_id)
+            .subquery()
+        )
+        rows = (
+            db.query(Module, func.coalesce(lesson_counts.c.lesson_count, 0))
+            .outerjoin(lesson_counts, lesson_counts.c.module_id == Module.id)
+            .filter(ACTIVE_MODULE)
+            .order_by(Module.course_id, Module.order_index)
+            .offset(skip)
+            .limit(limit)
+            .all()
+        )
+        return [_module_to_dict(module, lesson_count) for module, lesson_count in rows]
+
+    return content_cache.get_or_load(f"modules:list:{skip}:{limit}", load)
+
+def get_module(db: Session, module_id: str):
+    module_id = int(module_id)
+
+    def load():
+        module = db.query(Module).filter(Module.id == module_id, ACTIVE_MODULE).first()
+        if not module:
+            return None
+        lessons = _lesson_summaries_query(db).filter(Lesson.module_id == module_id, ACTIVE_LESSON).order_by(Lesson.order_index).all()
+        module_data = _module_to_dict(module, len(lessons))
+        module_data["lessons"] = [dict(lesson._mapping) for lesson in lessons]
+        return module_data
+
+    return content_cache.get_or_load(f"module:{module_id}", load)
+
+def get_lessons(db: Session, module_id: str):
+    module_id = int(module_id)
 
-    redis_client.setex(f"lesson:{lesson_id}:exercises", CACHE_TTL, json.dumps(exercise_list))
-    return exercise_list
+    def load():
+        lessons = db.query(Lesson).options(undefer_group(LESSON_BODY)).filter(
+            Lesson.module_id == module_id, ACTIVE_LESSON
+        ).order_by(Lesson.order_index).all()
+        return [_lesson_to_dict(lesson) for lesson in lessons]
+
+    return content_cache.get_or_load(f"module:{module_id}:lessons", load)
+
+def get_lesson(db: Session, lesson_id):
+    lesson_id = int(lesson_id)
+
+    def load():
+        logger.info(f"Fetching lesson with id={lesson_id}")
+        lesson = db.query(Lesson).options(undefer_group(LESSON_BODY)).filter(Lesson.id == lesson_id, ACTIVE_LESSON).first()
+        if not lesson:
+            logger.warning(f"Lesson {lesson_id} not found in DB")
+            return None
+        return _lesson_to_dict(lesson)
+
+    return content_cache.get_or_load(f"lesson:{lesson_id}", load)
+
+def get_exercises(db: Session, lesson_id: str):
+    lesson_id = int(lesson_id)  # Ensure lesson_id is an integer
+
+    def load():
+        exercises = db.query(Exercise).options(undefer_group(EXERCISE_BODY)).filter(
+            Exercise.lesson_id == lesson_id, ACTIVE_EXERCISE
+        ).order_by(Exercise.order_index).all()
+        return [_exercise_to_dict(exercise) for exercise in exercises]
+
+    return content_cache.get_or_load(f"lesson:{lesson_id}:exercises", load)
 
 def get_exercise(db: Session, exercise_id: str):
-    # Try to get from cache
-    cached = redis_client.get(f"exercise:{exercise_id}")
-    if cached:
-        return json.loads(cached)
-
-    # Get from DB if not cached
-    exercise = db.query(Exercise).filter(Exercise.id == exercise_id).first()
-    if not exercise:
-        return None
+    exercise_id = int(exercise_id)
 
-    exercise_data = {
-        "id": exercise.id,
-        "title": exercise.title,
-        "lesson_id": exercise.lesson_id,
-        "order_index": exercise.order_index,
-        "description": exercise.description,
-        "instructions": exercise.instructions,
-        "starter_code": exercise.starter_code,
-        "hints": getattr(exercise, 'hints', None),
-        "validation_type": getattr(exercise, 'validation_type', None),
-        "validation_rules": getattr(exercise, 'validation_rules', {}),
-        "explanation": getattr(exercise, 'explanation', None)
-    }
+    def load():
+        exercise = db.query(Exercise).options(undefer_group(EXERCISE_BODY)).filter(Exercise.id == exercise_id).first()
+        if not exercise:
+            return None
+        return _exercise_to_dict(exercise)
 
-    redis_client.setex(f"exercise:{exercise_id}", CACHE_TTL, json.dumps(exercise_data))
-    return exercise_data
+    return content_cache.get_or_load(f"exercise:{exercise_id}", load)
 
 def create_module(db: Session, module: ModuleCreate):
     db_module = Module(
@@ -264,8 +406,8 @@ def create_module(db: Session, module: ModuleCreate):
     db.commit()
     db.refresh(db_module)
 
-    # Invalidate cache
-    redis_client.delete("modules:list")
+    # Invalidate cached content tree
+    bump_content_version()
 
     return db_module
 
@@ -281,8 +423,8 @@ def create_lesson(db: Session, lesson: LessonCreate):
     db.commit()
     db.refresh(db_lesson)
 
-    # Invalidate cache
-    redis_client.delete(f"module:{lesson.module_id}:lessons")
+    # Invalidate cached content tree
+    bump_content_version()
 
     return db_lesson
 
@@ -302,8 +444,8 @@ def create_exercise(db: Session, exercise: ExerciseCreate):
     db.commit()
     db.refresh(db_exercise)
 
-    # Invalidate cache
-    redis_client.delete(f"lesson:{exercise.lesson_id}:exercises")
+    # Invalidate cached content tree
+    bump_content_version()
 
     return db_exercise
 
@@ -312,13 +454,14 @@ def create_course(db: Session, course_data):
     db.add(course)
     db.commit()
     db.refresh(course)
+    bump_content_version()
     return course
 
 def get_courses(db: Session, skip=0, limit=100):
-    return db.query(Course).offset(skip).limit(limit).all()
+    return db.query(Course).filter(ACTIVE_COURSE).offset(skip).limit(limit).all()
 
 def get_course(db: Session, course_id: int):
-    return db.query(Course).filter(Course.id == course_id).first()
+    return db.query(Course).filter(Course.id == course_id, ACTIVE_COURSE).first()
 
 def enroll_user_in_course(db: Session, user_id: int, course_id: int):
     # Create enrollment
@@ -357,165 +500,102 @@ def rate_course(db: Session, user_id: int, course_id: int, rating: float):
         db.commit()
 
 def get_modules_by_course(db: Session, course_id: int):
-    return db.query(Module).filter(Module.course_id == course_id).order_by(Module.order_index).all()
+    return db.query(Module).filter(Module.course_id == course_id, ACTIVE_MODULE).order_by(Module.order_index).all()
 
 def get_exercise_for_lesson(db: Session, lesson_id: int):
-    return db.query(Exercise).filter(Exercise.lesson_id == lesson_id).first()
+    return db.query(Exercise).options(undefer_group(EXERCISE_BODY)).filter(Exercise.lesson_id == lesson_id, ACTIVE_EXERCISE).first()
 
 def get_module_final_exercise(db: Session, module_id: int):
-    return db.query(Exercise).filter(
+    return db.query(Exercise).options(undefer_group(EXERCISE_BODY)).filter(
         Exercise.module_id == module_id,
-        Exercise.lesson_id == None
+        Exercise.lesson_id == None,
+        ACTIVE_EXERCISE
     ).first()
 
 def get_next_lesson_info(db: Session, current_lesson_id: int) -> Optional[Dict]:
     """
     Determines the next lesson, which could be in the current module or the next module.
     Returns a dictionary with 'id', 'title', 'module_id', and 'module_title' of the next lesson,
-    or None if no next lesson exists.
+    or None if no next lesson exists. Served from the in-memory navigation index.
     """
-    current_lesson = db.query(models.Lesson).options(
-        joinedload(models.Lesson.module).joinedload(models.Module.course) # Eager load module and course
-    ).filter(models.Lesson.id == current_lesson_id).first()
+    return get_navigation_index(db).next_lesson(current_lesson_id)
 
-    if not current_lesson or not current_lesson.module or not current_lesson.module.course_id:
-        # Current lesson, its module, or course context is missing
-        return None
 
-    current_module = current_lesson.module
-    current_course_id = current_lesson.module.course_id
-
-    # 1. Try to find the next lesson in the current module
-    lessons_in_current_module = db.query(models.Lesson).filter(
-        models.Lesson.module_id == current_module.id,
-        models.Lesson.order_index > current_lesson.order_index
-    ).order_by(models.Lesson.order_index.asc()).all()
-
-    if lessons_in_current_module:
-        next_l = lessons_in_current_module[0]
-        return {
-            "id": next_l.id,
-            "title": next_l.title,
-            "module_id": current_module.id,
-            "module_title": current_module.title
-        }
-
-    # 2. If no next lesson in current module, try to find the first lesson of the next module in the same course
-    modules_in_course = db.query(models.Module).filter(
-        models.Module.course_id == current_course_id,
-        models.Module.order_index > current_module.order_index
-    ).order_by(models.Module.order_index.asc()).all()
-
-    if modules_in_course:
-        next_module_candidate = modules_in_course[0]
-        # Find the first lesson in this next module candidate
-        first_lesson_in_next_module = db.query(models.Lesson).filter(
-            models.Lesson.module_id == next_module_candidate.id
-        ).order_by(models.Lesson.order_index.asc()).first()
-
-        if first_lesson_in_next_module:
-            return {
-                "id": first_lesson_in_next_module.id,
-                "title": first_lesson_in_next_module.title,
-                "module_id": next_module_candidate.id,
-                "module_title": next_module_candidate.title
-            }
-
-    # 3. No next lesson found in the current module or any subsequent module in the course
-    return None
-
-async def get_lessons_with_lock_status(db: Session, module_id: int, user_id: int, token: str) -> List[schemas.LessonSchema]:
-    db_lessons = db.query(models.Lesson).filter(
+async def get_lessons_with_lock_status(db: Session, module_id: int, user_id: int, token: str) -> List[schemas.LessonSummarySchema]:
+    db_lessons = _lesson_summaries_query(db).filter(
         models.Lesson.module_id == module_id,
         models.Lesson.is_active == True
     ).order_by(models.Lesson.order_index).all()
 
-    processed_lessons = []
     if not db_lessons:
-        return processed_lessons
-
-    predecessor_lesson_ids_to_check = [db_lessons[i-1].id for i in range(1, len(db_lessons))]
-    batch_progress_map: Dict[int, Any] = {} # Stores full progress objects
-
-    async with httpx.AsyncClient() as client:
-        if predecessor_lesson_ids_to_check and user_id is not None and token: # Only fetch if there are predecessors and user is authenticated
-            try:
-                batch_progress_map = await _fetch_batch_lesson_progress(user_id, token, predecessor_lesson_ids_to_check, client)
-            except Exception as e:
-                logger.error(f"Failed to fetch batch lesson progress for M{module_id} U{user_id}: {e}", exc_info=True)
-                # Proceed with all subsequent lessons locked if batch fetch fails
-
-        for i, lesson_db_model in enumerate(db_lessons):
-            current_lesson_locked = False
-            if user_id is None or not token: # Unauthenticated users see all subsequent items as locked
-                if i > 0:
-                    current_lesson_locked = True
-            elif i > 0: # Not the first lesson, and user is authenticated
-                predecessor_lesson_id = db_lessons[i-1].id
-                predecessor_progress = batch_progress_map.get(predecessor_lesson_id)
+        return []
 
-                previous_lesson_completed = False
-                if predecessor_progress and isinstance(predecessor_progress, dict):
-                    previous_lesson_completed = predecessor_progress.get("is_completed", False)
+    authenticated = user_id is not None and bool(token)
+    predecessor_lesson_ids_to_check = [lesson.id for lesson in db_lessons[:-1]]
+    lesson_completion: Dict[int, bool] = {}
 
-                if not previous_lesson_completed:
-                    current_lesson_locked = True
+    if predecessor_lesson_ids_to_check and authenticated:
+        async with httpx.AsyncClient() as client:
+            _, lesson_completion = await _fetch_course_progress_snapshot(
+                user_id, token, [], predecessor_lesson_ids_to_check, client
+            )
 
-                logger.debug(f"U{user_id} M{module_id} L{lesson_db_model.id}: Predecessor L{predecessor_lesson_id} completed: {previous_lesson_completed}. Current locked: {current_lesson_locked}")
-
-            lesson_schema_instance = schemas.LessonSchema.from_orm(lesson_db_model)
-            lesson_schema_instance.is_locked = current_lesson_locked
-            processed_lessons.append(lesson_schema_instance)
-
-    return processed_lessons
+    return _apply_lesson_lock_status(db_lessons, lesson_completion, authenticated)
 
 async def get_modules_by_course_with_lock_status(db: Session, course_id: int, user_id: int, token: str) -> List[schemas.ModuleSchema]:
+    """
+    Resolves the lock status of every module and lesson in a course with one
+    lessons query and a single progress snapshot call to user-service.
+    """
     db_modules = db.query(models.Module).filter(
         models.Module.course_id == course_id,
         models.Module.is_active == True
     ).order_by(models.Module.order_index).all()
 
-    processed_modules = []
     if not db_modules:
-        return processed_modules
-
-    predecessor_module_ids_to_check = [db_modules[i-1].id for i in range(1, len(db_modules))]
-    batch_progress_map: Dict[int, Any] = {} # Stores full progress objects
-
-    async with httpx.AsyncClient() as client:
-        if predecessor_module_ids_to_check and user_id is not None and token: # Only fetch if there are predecessors and user is authenticated
-            try:
-                batch_progress_map = await _fetch_batch_module_progress(user_id, token, predecessor_module_ids_to_check, client)
-            except Exception as e:
-                logger.error(f"Failed to fetch batch module progress for C{course_id} U{user_id}: {e}", exc_info=True)
-                # Proceed with all subsequent modules locked if batch fetch fails
-
-        for i, module_db_model in enumerate(db_modules):
-            current_module_locked = False
-            if user_id is None or not token: # Unauthenticated users see all subsequent items as locked
-                 if i > 0:
-                    current_module_locked = True
-            elif i > 0: # Not the first module, and user is authenticated
-                predecessor_module_id = db_modules[i-1].id
-                predecessor_progress = batch_progress_map.get(predecessor_module_id)
-
-                previous_module_completed = False
-                if predecessor_progress and isinstance(predecessor_progress, dict):
-                    previous_module_completed = predecessor_progress.get("is_completed", False)
-
-                if not previous_module_completed:
-                    current_module_locked = True
-
-                logger.debug(f"U{user_id} C{course_id} M{module_db_model.id}: Predecessor M{predecessor_module_id} completed: {previous_module_completed}. Current locked: {current_module_locked}")
-
-            # Fetch lessons for this module (this already uses batching internally if adapted as above)
-            lessons_for_this_module = await get_lessons_with_lock_status(db, module_db_model.id, user_id, token)
-
-            module_schema_instance = schemas.ModuleSchema.from_orm(module_db_model)
-            module_schema_instance.is_locked = current_module_locked
-            module_schema_instance.lessons = lessons_for_this_module
-            module_schema_instance.lesson_count = len(lessons_for_this_module)
-            processed_modules.append(module_schema_instance)
+        return []
+
+    module_ids = [module.id for module in db_modules]
+    lessons_by_module: Dict[int, list] = {mid: [] for mid in module_ids}
+    db_lessons = _lesson_summaries_query(db).filter(
+        models.Lesson.module_id.in_(module_ids),
+        models.Lesson.is_active == True
+    ).order_by(models.Lesson.module_id, models.Lesson.order_index).all()
+    for lesson in db_lessons:
+        lessons_by_module[lesson.module_id].append(lesson)
+
+    authenticated = user_id is not None and bool(token)
+    predecessor_module_ids_to_check = module_ids[:-1]
+    predecessor_lesson_ids_to_check = [
+        lesson.id for lessons in lessons_by_module.values() for lesson in lessons[:-1]
+    ]
+    module_completion: Dict[int, bool] = {}
+    lesson_completion: Dict[int, bool] = {}
+
+    if authenticated and (predecessor_module_ids_to_check or predecessor_lesson_ids_to_check):
+        async with httpx.AsyncClient() as client:
+            module_completion, lesson_completion = await _fetch_course_progress_snapshot(
+                user_id, token, predecessor_module_ids_to_check, predecessor_lesson_ids_to_check, client
+            )
+
+    processed_modules = []
+    for i, module_db_model in enumerate(db_modules):
+        current_module_locked = False
+        if i > 0:
+            predecessor_module_id = db_modules[i-1].id
+            previous_module_completed = authenticated and module_completion.get(predecessor_module_id, False)
+            current_module_locked = not previous_module_completed
+            logger.debug(f"U{user_id} C{course_id} M{module_db_model.id}: Predecessor M{predecessor_module_id} completed: {previous_module_completed}. Current locked: {current_module_locked}")
+
+        lessons_for_this_module = _apply_lesson_lock_status(
+            lessons_by_module[module_db_model.id], lesson_completion, authenticated
+        )
+
+        module_schema_instance = schemas.ModuleSchema.from_orm(module_db_model)
+        module_schema_instance.is_locked = current_module_locked
+        module_schema_instance.lessons = lessons_for_this_module
+        module_schema_instance.lesson_count = len(lessons_for_this_module)
+        processed_modules.append(module_schema_instance)
 
     return processed_modules
 
@@ -530,8 +610,16 @@ async def get_course_details_with_lock_status(db: Session, course_id: int, user_
 
     modules_with_status = await get_modules_by_course_with_lock_status(db, course_id, user_id, token)
 
-    course_schema_instance = schemas.CourseSchema.from_orm(db_course)
-    course_schema_instance.modules = modules_with_status
+    # Built field by field: from_orm would walk db_course.modules -> lessons lazily just to be overwritten
+    course_schema_instance = schemas.CourseSchema(
+        id=db_course.id,
+        title=db_course.title,
+        description=db_course.description,
+        duration_minutes=db_course.duration_minutes,
+        students_count=db_course.students_count,
+        rating=db_course.rating,
+        modules=modules_with_status,
+    )
     # course_schema_instance.is_locked = db_course.is_locked # If course lock status is determined
 
     return course_schema_instance
@@ -611,17 +699,20 @@ def get_course_exam_exercise(db: Session, course_id: int):
     Fetches all exam-type exercises for a given course and returns one at random,
     using order_index as the random selector for reproducibility if needed.
     """
-    exam_pool = db.query(Exercise).filter(
+    exam_pool = db.query(Exercise.id).filter(
         Exercise.course_id == course_id,
         Exercise.module_id == None,
-        Exercise.lesson_id == None
+        Exercise.lesson_id == None,
+        ACTIVE_EXERCISE
     ).order_by(Exercise.order_index).all()
 
     if not exam_pool:
         return None
 
-    # Use order_index for randomness: pick a random index in the pool
+    # Use order_index for randomness: pick a random index in the pool, then load only that body
     random_idx = random.randint(0, len(exam_pool) - 1)
-    random_exam_exercise = exam_pool[random_idx]
+    random_exam_exercise = db.query(Exercise).options(undefer_group(EXERCISE_BODY)).filter(
+        Exercise.id == exam_pool[random_idx].id
+    ).first()
     logger.info(f"Selected random exam exercise by order_index: {random_exam_exercise.order_index} (id={random_exam_exercise.id}) for course {course_id}")
     return random_exam_exercise
@@ -0,0 +1,186 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+from expected_outputs import ReferenceRunner
+from test_case_engine import DEFAULT_CONSTRAINTS, case_seed, generate_inputs, rules_version
+
+logger = logging.getLogger(__name__)
+
+# --- Differential grading ---
+# Exercises of type differential_output ship a reference_solution instead of expected outputs.
+# The solution runs once per generated input and only a fingerprint of each output line is
+# kept; student output is matched line by line as it is printed.
+DIFFERENTIAL_NUM_CASES = int(os.getenv("DIFFERENTIAL_NUM_CASES", 200))
+# A submission runs a sample of the precomputed cases, all within one time budget
+DIFFERENTIAL_GRADING_CASES = int(os.getenv("DIFFERENTIAL_GRADING_CASES", 20))
+DIFFERENTIAL_GRADING_BUDGET_SECONDS = float(os.getenv("DIFFERENTIAL_GRADING_BUDGET_SECONDS", 10))
+FINGERPRINT_HEX_CHARS = 16
+REFERENCE_FINGERPRINTS_PATH = os.getenv(
+    "REFERENCE_FINGERPRINTS_PATH",
+    os.path.join(os.path.dirname(__file__), "shared", "seed_data", "reference_fingerprints.json"),
+)
+
+_FINGERPRINTS: Dict[Tuple[int, str], List[Dict[str, Any]]] = {}
+
+
+def fingerprint_line(line: str) -> str:
+    return hashlib.sha256(line.encode("utf-8")).hexdigest()[:FINGERPRINT_HEX_CHARS]
+
+
+def fingerprint_output(stdout: str) -> List[str]:
+    """
+    Per-line fingerprints of an output. Trailing whitespace on each line and blank lines at
+    the start and end are ignored, the same way OutputMatcher reads the student's output.
+    """
+    lines = [line.rstrip() for line in stdout.splitlines()]
+    while lines and not lines[0]:
+        lines.pop(0)
+    while lines and not lines[-1]:
+        lines.pop()
+    return [fingerprint_line(line) for line in lines]
+
+
+class OutputMatcher:
+    """Matches output lines against reference fingerprints as they arrive; feed() returns False on the first difference."""
+
+    def __init__(self, expected: List[str]):
+        self.expected = expected
+        self.position = 0
+        self.pending_blank_lines = 0
+        self.started = False
+        self.mismatch: Optional[Dict[str, Any]] = None
+
+    def feed(self, raw_line: str) -> bool:
+        line = raw_line.rstrip()
+        if not line:
+            # Blank lines only count once more output follows them
+            if self.started:
+                self.pending_blank_lines += 1
+            return True
+        self.started = True
+        for _ in range(self.pending_blank_lines):
+            if not self._match(""):
+                return False
+        self.pending_blank_lines = 0
+        return self._match(line)
+
+    def finish(self) -> bool:
+        """True if the output had exactly the reference's lines."""
+        if self.mismatch is None and self.position < len(self.expected):
+            self.mismatch = {"line": self.position + 1, "actual": None}
+        return self.mismatch is None
+
+    def _match(self, line: str) -> bool:
+        if self.position >= len(self.expected) or fingerprint_line(line) != self.expected[self.position]:
+            self.mismatch = {"line": self.position + 1, "actual": line}
+            return False
+        self.position += 1
+        return True
+
+
+# --- Reference fingerprints ---
+def _store_key(exercise_id: int, version: str) -> str:
+    return f"{exercise_id}:{version}"
+
+
+def _num_cases(rules: Dict[str, Any]) -> int:
+    return rules.get("num_cases", DIFFERENTIAL_NUM_CASES)
+
+
+def fingerprint_version(rules: Dict[str, Any]) -> str:
+    """rules_version plus the effective case count, which can come from DIFFERENTIAL_NUM_CASES."""
+    return f"{rules_version(rules)}-n{_num_cases(rules)}"
+
+
+def build_fingerprints(exercise_id: int, rules: Dict[str, Any], run_reference: ReferenceRunner) -> List[Dict[str, Any]]:
+    """Runs the reference solution on the exercise's seeded inputs; raises ValueError if it fails on any."""
+    solution = rules.get("reference_solution")
+    if not solution:
+        raise ValueError("Validation config error: differential_output requires 'reference_solution'")
+    rng = random.Random(case_seed(exercise_id, fingerprint_version(rules)))
+    inputs = generate_inputs(rules.get("input_constraints", DEFAULT_CONSTRAINTS), _num_cases(rules), rng)
+    cases = []
+    for case_input in inputs:
+        try:
+            stdout = run_reference(solution, f"{case_input}\n")
+        except ValueError as e:
+            raise ValueError(f"Validation config error on case '{case_input}': {e}") from e
+        cases.append({"input": case_input, "lines": fingerprint_output(stdout)})
+    return cases
+
+
+def get_fingerprints(exercise_id: int, rules: Dict[str, Any], run_reference: ReferenceRunner) -> List[Dict[str, Any]]:
+    key = (exercise_id, fingerprint_version(rules))
+    if key not in _FINGERPRINTS:
+        _FINGERPRINTS[key] = build_fingerprints(exercise_id, rules, run_reference)
+    return _FINGERPRINTS[key]
+
+
+def grading_cases(cases: List[Dict[str, Any]], user_code: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    The cases a submission is graded on: a sample of the fingerprinted set seeded by the code,
+    so the same submission always gets the same cases but no fixed subset can be memorized.
+    """
+    limit = DIFFERENTIAL_GRADING_CASES if limit is None else limit
+    if len(cases) <= limit:
+        return cases
+    rng = random.Random(hashlib.sha256(user_code.encode("utf-8")).hexdigest())
+    return [cases[i] for i in sorted(rng.sample(range(len(cases)), limit))]
+
+
+def precompute_fingerprints(exercises: Dict[int, Dict[str, Any]], run_reference: ReferenceRunner) -> int:
+    """Fingerprints every differential_output exercise not already loaded from the store; returns how many are ready."""
+    ready = 0
+    for exercise_id, exercise in exercises.items():
+        if exercise.get("validation_type") != "differential_output":
+            continue
+        try:
+            get_fingerprints(exercise_id, exercise.get("validation_rules", {}), run_reference)
+            ready += 1
+        except ValueError as e:
+            logger.error(f"EID {exercise_id}: no se pudieron calcular las huellas de la solución de referencia: {e}")
+    return ready
+
+
+def load_fingerprints(path: str = REFERENCE_FINGERPRINTS_PATH) -> int:
+    """Loads precomputed fingerprints. Entries of an older rules version or case count are never looked up again."""
+    if not os.path.exists(path):
+        return 0
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"No se pudieron leer las huellas de {path}: {e}")
+        return 0
+    for key, cases in stored.items():
+        exercise_id, version = key.split(":", 1)
+        _FINGERPRINTS[(int(exercise_id), version)] = cases
+    return len(stored)
+
+
+def save_fingerprints(path: str = REFERENCE_FINGERPRINTS_PATH) -> int:
+    stored = {_store_key(exercise_id, version): cases for (exercise_id, version), cases in _FINGERPRINTS.items()}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(stored, f)
+    return len(stored)
+
+
+def fingerprint_set_count() -> int:
+    return len(_FINGERPRINTS)
+
+
+if __name__ == "__main__":
+    # Offline precompute: python differential_grading.py [seed_exercises.json] [output.json]
+    from validators import run_reference_solution
+
+    exercises_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), "shared", "seed_data", "seed_exercises.json")
+    output_path = sys.argv[2] if len(sys.argv) > 2 else REFERENCE_FINGERPRINTS_PATH
+    with open(exercises_path, "r", encoding="utf-8") as f:
+        exercises = {int(exercise["id"]): exercise for exercise in json.load(f) if "id" in exercise}
+    ready = precompute_fingerprints(exercises, run_reference_solution)
+    print(f"Fingerprinted {ready} differential_output exercises; wrote {save_fingerprints(output_path)} sets to {output_path}")
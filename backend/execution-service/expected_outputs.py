@@ -0,0 +1,106 @@
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# --- Normalized expected outputs ---
+# Computed once when the exercises load and stored on the exercise's validation_rules under
+# this key; validators read them from there. Rules that were not prepared (ad-hoc calls,
+# tests) fall back to normalizing on the fly.
+PRECOMPUTED_KEY = "_expected"
+
+# (code, stdin) -> stdout of an exercise's reference solution; raises ValueError if it fails
+ReferenceRunner = Callable[[str, Optional[str]], str]
+# Validation types graded on the whole script's output (expected_script_output)
+SCRIPT_OUTPUT_TYPES = {"exam", "function_scenarios"}
+
+
+def normalize_output(text: str) -> str:
+    """Comparison form used by the per-case validators: Unix newlines, no surrounding whitespace."""
+    return text.replace("\r\n", "\n").strip()
+
+
+def normalize_script_output(text: str) -> str:
+    """Comparison form of a whole script's output in exams: every line stripped."""
+    return "\n".join(line.strip() for line in text.strip().splitlines())
+
+
+def normalize_exact_output(text: str) -> str:
+    """simple_print compares the exact output; only newlines are unified."""
+    return text.replace("\r\n", "\n")
+
+
+def precomputed(rules: Dict[str, Any]) -> Dict[str, Any]:
+    return rules.get(PRECOMPUTED_KEY, {})
+
+
+def expected_exact_output(rules: Dict[str, Any]) -> Optional[str]:
+    if "exact_output" in precomputed(rules):
+        return precomputed(rules)["exact_output"]
+    raw = rules.get("expected_exact_output")
+    return normalize_exact_output(raw) if raw is not None else None
+
+
+def expected_script_output(rules: Dict[str, Any]) -> Optional[str]:
+    if "script_output" in precomputed(rules):
+        return precomputed(rules)["script_output"]
+    raw = rules.get("expected_script_output")
+    return normalize_script_output(raw) if raw else None
+
+
+def expected_case_outputs(rules: Dict[str, Any]) -> List[Optional[str]]:
+    """Normalized expected output of each entry in rules["test_cases"] (None if it has none)."""
+    if "test_cases" in precomputed(rules):
+        return precomputed(rules)["test_cases"]
+    return [
+        normalize_output(case["expected_output"]) if case.get("expected_output") is not None else None
+        for case in rules.get("test_cases", [])
+    ]
+
+
+def prepare_expected_outputs(validation_type: str, rules: Dict[str, Any],
+                             run_reference: Optional[ReferenceRunner] = None) -> Dict[str, Any]:
+    """
+    Normalized expected outputs for an exercise's rules. Literal expected outputs win; where
+    one is missing and the exercise ships a reference_solution, the solution's output is used.
+    """
+    solution = rules.get("reference_solution") if run_reference is not None else None
+    prepared: Dict[str, Any] = {}
+
+    if rules.get("expected_script_output"):
+        prepared["script_output"] = normalize_script_output(rules["expected_script_output"])
+    elif solution and validation_type in SCRIPT_OUTPUT_TYPES:
+        prepared["script_output"] = normalize_script_output(run_reference(solution, None))
+
+    if rules.get("expected_exact_output") is not None:
+        prepared["exact_output"] = normalize_exact_output(rules["expected_exact_output"])
+    elif solution and validation_type == "simple_print":
+        prepared["exact_output"] = normalize_exact_output(run_reference(solution, None))
+
+    if rules.get("test_cases"):
+        outputs = []
+        for case in rules["test_cases"]:
+            expected = case.get("expected_output")
+            if expected is None and solution and case.get("input") is not None:
+                expected = run_reference(solution, f"{case['input']}\n")
+            outputs.append(normalize_output(expected) if expected is not None else None)
+        prepared["test_cases"] = outputs
+    return prepared
+
+
+def precompute_expected_outputs(exercises: Dict[int, Dict[str, Any]], run_reference: Optional[ReferenceRunner] = None) -> int:
+    """Stores the normalized expected outputs on every exercise's rules; returns how many got any."""
+    prepared_count = 0
+    for exercise_id, exercise in exercises.items():
+        rules = exercise.get("validation_rules")
+        if not isinstance(rules, dict):
+            continue
+        try:
+            prepared = prepare_expected_outputs(exercise.get("validation_type", ""), rules, run_reference)
+        except ValueError as e:
+            logger.error(f"EID {exercise_id}: no se pudo calcular la salida esperada: {e}")
+            continue
+        if prepared:
+            rules[PRECOMPUTED_KEY] = prepared
+            prepared_count += 1
+    return prepared_count
@@ -1,6 +1,6 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 import os
 import time
 import logging
@@ -21,7 +21,11 @@ logger = logging.getLogger(__name__)
 
 # Import from the new validators module
 # Assuming validators.py is in the same directory as main.py
-from validators import VALIDATOR_MAP, DynamicValidationResult, general_security_check, run_user_code_sandboxed
+from differential_grading import fingerprint_set_count, load_fingerprints, precompute_fingerprints
+from expected_outputs import precompute_expected_outputs
+from test_case_engine import case_set_count, precompute_case_sets
+from validators import VALIDATOR_MAP, DynamicValidationResult, general_security_check, run_reference_solution, run_user_code_sandboxed
+from static_feedback import analyze_code_quality
 
 app = FastAPI(title="Python Code Execution and Validation Service")
 
@@ -41,6 +45,10 @@ class CodeRequest(BaseModel):
     input_data: Optional[str] = None # Default input for the first/only scenario if not specified in rules
     timeout: Optional[int] = 10  # Default timeout in seconds
 
+class AnalyzeRequest(BaseModel):
+    code: str
+    level: str = Field(default="beginner", pattern="^(beginner|intermediate|advanced)$")
+
 class ValidationResultModel(BaseModel):
     output: Optional[str] = None # Output from the user's code if relevant
     error: Optional[str] = None  # Validation errors or runtime errors
@@ -63,6 +71,11 @@ def load_exercises_on_startup():
                     # Log a warning for exercises missing an ID
                     print(f"Warning: Exercise found without an 'id' field: {exercise.get('title', 'Untitled Exercise')}")
         print(f"Successfully loaded {len(EXERCISES_DATA)} exercises.")
+        print(f"Precomputed expected outputs for {precompute_expected_outputs(EXERCISES_DATA, run_reference_solution)} exercises.")
+        print(f"Precomputed test cases for {precompute_case_sets(EXERCISES_DATA, run_reference_solution)} dynamic_output exercises.")
+        # Fingerprints precomputed offline (python differential_grading.py) are reused; missing ones are built now
+        print(f"Loaded {load_fingerprints()} stored reference fingerprint sets.")
+        print(f"Reference fingerprints ready for {precompute_fingerprints(EXERCISES_DATA, run_reference_solution)} differential_output exercises.")
     except FileNotFoundError:
         print(f"ERROR: Exercises file not found at {EXERCISES_FILE_PATH}")
         # Potentially raise an error or exit if exercises are critical for startup
@@ -81,10 +94,15 @@ async def startup_event():
 # --- API Endpoints ---
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "loaded_exercises": len(EXERCISES_DATA)}
+    return {"status": "healthy", "loaded_exercises": len(EXERCISES_DATA), "case_sets": case_set_count(), "fingerprint_sets": fingerprint_set_count()}
+
+@app.post("/analyze")
+def analyze_code(request: AnalyzeRequest):
+    """Static, rule-based feedback from the AST. Never runs the code, so it answers in milliseconds."""
+    return analyze_code_quality(request.code, request.level)
 
 @app.post("/execute", response_model=ValidationResultModel)
-async def execute_and_validate_code(request: CodeRequest):
+def execute_and_validate_code(request: CodeRequest):
     start_time = time.time()
     logger.info(f"Starting execution for exercise ID: {request.exercise_id}")
 
@@ -124,7 +142,7 @@ async def execute_and_validate_code(request: CodeRequest):
         logging.info(f"EID {request.exercise_id}: {run_description_for_log}")
 
         # Ensure dynamic_output is handled here for single input run
-        if validation_type in ["simple_print", "saludo_personalizado", "variable_output", "dynamic_output", "function_and_output", "conditional_print"]:
+        if validation_type in ["simple_print", "saludo_personalizado", "variable_output", "dynamic_output", "function_and_output", "conditional_print", "differential_output"]:
             final_run_result = validator_func(
                 user_code=request.code,
                 rules=exercise_rules_from_config,
@@ -167,11 +185,12 @@ async def execute_and_validate_code(request: CodeRequest):
             # This is where dynamic_output should generate its multiple cases.
             logging.info(f"EID {request.exercise_id}: No predefined scenarios found. Performing a default run.")
             run_description_for_log = "Default Run (No Scenarios Defined, No Request Input)"
-            if validation_type in ["simple_print", "saludo_personalizado", "variable_output", "dynamic_output", "function_and_output"]: # Ensure dynamic_output is here
+            if validation_type in ["simple_print", "saludo_personalizado", "variable_output", "dynamic_output", "function_and_output", "differential_output"]: # Ensure dynamic_output is here
                 final_run_result = validator_func(
                     user_code=request.code,
                     rules=exercise_rules_from_config,
-                    input_data=None, # Validator will generate cases if input_data is None
+                    input_data=None, # Validator uses the exercise's precomputed cases if input_data is None
+                    exercise_id=request.exercise_id,
                     timeout=request.timeout
                 )
             elif validation_type == "function_check":
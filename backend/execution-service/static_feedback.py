@@ -0,0 +1,183 @@
+import ast
+import re
+from typing import Any, Dict, List, Optional
+
+from validators import CodeAnalyzer
+
+# --- Static feedback rules ---
+# Issues in these categories are fully explained by the rule itself; feedback made only of
+# them can be answered locally without asking the AI service.
+TRIVIAL_CATEGORIES = {"syntax", "style"}
+MAX_LINE_LENGTH = 79
+
+_SNAKE_CASE_RE = re.compile(r"^_{0,2}[a-z][a-z0-9_]*_{0,2}$")
+_CAP_WORDS_RE = re.compile(r"^_?[A-Z][A-Za-z0-9]*$")
+_SYNTAX_LINE_RE = re.compile(r"line (\d+)")
+
+
+def _issue(rule: str, category: str, message: str, lines: Optional[List[int]] = None) -> Dict[str, Any]:
+    return {
+        "rule": rule,
+        "category": category,
+        "message": message,
+        "lines": sorted(set(lines or [])),
+        "trivial": category in TRIVIAL_CATEGORIES,
+    }
+
+
+def _format_lines(lines: List[int]) -> str:
+    shown = ", ".join(str(n) for n in lines[:5])
+    return f"{shown}, ..." if len(lines) > 5 else shown
+
+
+def _pep8_issues(code: str, tree: ast.AST) -> List[Dict[str, Any]]:
+    issues = []
+    long_lines, trailing, tabs = [], [], []
+    for number, line in enumerate(code.splitlines(), start=1):
+        if len(line) > MAX_LINE_LENGTH:
+            long_lines.append(number)
+        if line != line.rstrip():
+            trailing.append(number)
+        if line[:len(line) - len(line.lstrip())].count("\t"):
+            tabs.append(number)
+    if long_lines:
+        issues.append(_issue("E501", "style", f"Lines longer than {MAX_LINE_LENGTH} characters (lines {_format_lines(long_lines)}). PEP 8 recommends splitting them.", long_lines))
+    if trailing:
+        issues.append(_issue("W291", "style", f"Trailing whitespace at the end of lines {_format_lines(trailing)}.", trailing))
+    if tabs:
+        issues.append(_issue("W191", "style", f"Indentation uses tabs (lines {_format_lines(tabs)}). PEP 8 recommends 4 spaces per level.", tabs))
+
+    bad_functions, bad_classes, multi_imports, none_comparisons, bool_comparisons, bare_excepts = [], [], [], [], [], []
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and not _SNAKE_CASE_RE.match(node.name):
+            bad_functions.append((node.lineno, node.name))
+        elif isinstance(node, ast.ClassDef) and not _CAP_WORDS_RE.match(node.name):
+            bad_classes.append((node.lineno, node.name))
+        elif isinstance(node, ast.Import) and len(node.names) > 1:
+            multi_imports.append(node.lineno)
+        elif isinstance(node, ast.Compare):
+            for op, right in zip(node.ops, node.comparators):
+                if isinstance(op, (ast.Eq, ast.NotEq)) and isinstance(right, ast.Constant):
+                    if right.value is None:
+                        none_comparisons.append(node.lineno)
+                    elif isinstance(right.value, bool):
+                        bool_comparisons.append(node.lineno)
+        elif isinstance(node, ast.ExceptHandler) and node.type is None:
+            bare_excepts.append(node.lineno)
+
+    if bad_functions:
+        names = ", ".join(f"`{name}`" for _, name in bad_functions)
+        issues.append(_issue("N802", "style", f"Function names should be lowercase with underscores (snake_case): {names}.", [n for n, _ in bad_functions]))
+    if bad_classes:
+        names = ", ".join(f"`{name}`" for _, name in bad_classes)
+        issues.append(_issue("N801", "style", f"Class names should use CapWords: {names}.", [n for n, _ in bad_classes]))
+    if multi_imports:
+        issues.append(_issue("E401", "style", f"Put each import on its own line (lines {_format_lines(multi_imports)}).", multi_imports))
+    if none_comparisons:
+        issues.append(_issue("E711", "style", f"Compare with None using `is None` / `is not None` instead of `==` / `!=` (lines {_format_lines(none_comparisons)}).", none_comparisons))
+    if bool_comparisons:
+        issues.append(_issue("E712", "style", f"Avoid comparing with True/False using `==`; use the condition directly, e.g. `if activo:` (lines {_format_lines(bool_comparisons)}).", bool_comparisons))
+    if bare_excepts:
+        issues.append(_issue("E722", "correctness", f"A bare `except:` also catches errors you did not expect (even Ctrl+C). Catch a specific exception such as `except ValueError:` (lines {_format_lines(bare_excepts)}).", bare_excepts))
+    return issues
+
+
+def _unused_local_variables(tree: ast.AST) -> List[Dict[str, Any]]:
+    """Locals assigned inside a function and never read there. Module-level names are skipped:
+    exercises often ask for a variable that only the validator reads."""
+    unused = {}
+    for func in ast.walk(tree):
+        if not isinstance(func, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        assigned: Dict[str, int] = {}
+        loaded = set()
+        declared_outside = set()
+        for node in ast.walk(func):
+            # Only plain `name = ...`; loop variables and unpacking are usually intentional
+            if isinstance(node, (ast.Assign, ast.AnnAssign)):
+                targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+                for target in targets:
+                    if isinstance(target, ast.Name):
+                        assigned.setdefault(target.id, target.lineno)
+            elif isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Store):
+                loaded.add(node.id)
+            elif isinstance(node, (ast.Global, ast.Nonlocal)):
+                declared_outside.update(node.names)
+        for name, line in assigned.items():
+            if name not in loaded and name not in declared_outside and not name.startswith("_"):
+                # Nested functions are walked from their parent too; report each name once
+                unused.setdefault((line, name), func.name)
+    unused = [(line, name, func_name) for (line, name), func_name in sorted(unused.items())]
+    if not unused:
+        return []
+    names = ", ".join(f"`{name}` (in `{func_name}`)" for _, name, func_name in unused)
+    return [_issue("F841", "style", f"Variables assigned but never used: {names}. Remove them or use them.", [n for n, _, _ in unused])]
+
+
+def _open_without_with(tree: ast.AST) -> List[Dict[str, Any]]:
+    managed = {
+        id(item.context_expr)
+        for node in ast.walk(tree) if isinstance(node, (ast.With, ast.AsyncWith))
+        for item in node.items
+    }
+    lines = [
+        node.lineno for node in ast.walk(tree)
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "open"
+        and id(node) not in managed
+    ]
+    if not lines:
+        return []
+    return [_issue("open-without-with", "correctness", "When working with files (`open()`), it's best practice to use a `with` statement to ensure the file is automatically closed, even if errors occur.", lines)]
+
+
+def _structure_suggestions(analyzer: CodeAnalyzer, code_lines: List[str], level: str) -> List[Dict[str, Any]]:
+    issues = []
+    has_print = bool(analyzer.analysis.get("print_calls"))
+    has_def = bool(analyzer.analysis.get("defined_functions"))
+    has_class = bool(analyzer.analysis.get("defined_classes"))
+    if level == "beginner":
+        if has_print and not has_def and len(code_lines) > 3:
+            issues.append(_issue("missing-functions", "structure", "Consider wrapping your main logic in a function (e.g., `def main(): ...`) for better organization and reusability."))
+        if len(code_lines) > 10 and not has_def:
+            issues.append(_issue("long-script", "structure", "As your code grows, think about breaking it down into smaller, manageable functions."))
+    elif not has_class and len(code_lines) > 20:
+        issues.append(_issue("missing-classes", "structure", "For more complex logic or data structures, consider using classes to organize related data and functions (Object-Oriented Programming)."))
+    return issues
+
+
+def analyze_code_quality(code: str, level: str = "beginner") -> Dict[str, Any]:
+    """
+    Rule-based feedback from the AST: syntax errors, PEP 8 basics, unused locals, files opened
+    without `with` and missing structure for the learner's level. Runs no user code.
+    """
+    analyzer = CodeAnalyzer(code)
+    code_lines = [line for line in code.strip().splitlines() if line.strip()]
+
+    if analyzer.syntax_error:
+        match = _SYNTAX_LINE_RE.search(analyzer.syntax_error)
+        issues = [_issue("syntax-error", "syntax", f"Syntax error: {analyzer.syntax_error}", [int(match.group(1))] if match else [])]
+        facts: Dict[str, Any] = {"line_count": len(code_lines)}
+    else:
+        issues = (
+            _pep8_issues(code, analyzer.tree)
+            + _unused_local_variables(analyzer.tree)
+            + _open_without_with(analyzer.tree)
+            + _structure_suggestions(analyzer, code_lines, level)
+        )
+        facts = {
+            "line_count": len(code_lines),
+            "functions": sorted(analyzer.analysis["defined_functions"]),
+            "classes": sorted(analyzer.analysis["defined_classes"]),
+            "imports": sorted(analyzer.analysis["imports"]),
+            "print_calls": len(analyzer.analysis["print_calls"]),
+            "has_with": analyzer.analysis["has_with"],
+            "has_try_except": analyzer.analysis["has_try_except"],
+        }
+
+    return {
+        "syntax_error": analyzer.syntax_error,
+        "issues": issues,
+        "suggestions": [issue["message"] for issue in issues],
+        "trivial_only": bool(issues) and all(issue["trivial"] for issue in issues),
+        "facts": facts,
+    }
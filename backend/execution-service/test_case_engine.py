@@ -0,0 +1,193 @@
+import hashlib
+import json
+import logging
+import random
+import string
+from typing import Any, Dict, List, Optional, Tuple
+
+from expected_outputs import ReferenceRunner, normalize_output
+
+logger = logging.getLogger(__name__)
+
+# --- Input generation ---
+# Rule fields that decide which cases are generated and what they should print. Changing any
+# of them gives the exercise a new rules version, and with it a new case set.
+RULES_VERSION_FIELDS = (
+    "input_constraints", "num_cases", "transform_for_template", "output_format_template", "reference_solution",
+)
+DEFAULT_CONSTRAINTS = {"type": "int", "min": 0, "max": 100}
+DEFAULT_NUM_CASES = 5
+
+CHARSETS = {
+    "alpha": string.ascii_letters,
+    "lowercase": string.ascii_lowercase,
+    "alphanumeric": string.ascii_letters + string.digits,
+    "numeric": string.digits,
+}
+INPUT_TYPES = {"int": int, "str": str, "string": str, "bool": bool, "float": float}
+
+
+def rules_version(rules: Dict[str, Any]) -> str:
+    """Short hash of the rule fields that affect the generated cases."""
+    relevant = {field: rules.get(field) for field in RULES_VERSION_FIELDS}
+    canonical = json.dumps(relevant, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:12]
+
+
+def case_seed(exercise_id: Optional[int], version: str) -> int:
+    digest = hashlib.sha256(f"{exercise_id}:{version}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def _charset(constraints: Dict[str, Any]) -> str:
+    charset = constraints.get("charset", "lowercase")
+    # Named charsets, or the literal characters to draw from
+    return CHARSETS.get(charset, charset) or CHARSETS["lowercase"]
+
+
+def _format_float(value: float, decimals: int) -> str:
+    return str(round(float(value), decimals))
+
+
+def _boundary_values(constraints: Dict[str, Any]) -> List[Any]:
+    """Edge inputs worth testing on every exercise: range limits, zero and min/max lengths."""
+    kind = constraints.get("type", "int")
+    if kind == "int":
+        low, high = constraints.get("min", 0), constraints.get("max", 100)
+        return [low, high] + ([0] if low < 0 < high else [])
+    if kind == "float":
+        low, high = constraints.get("min", 0.0), constraints.get("max", 100.0)
+        return [float(low), float(high)] + ([0.0] if low < 0 < high else [])
+    if kind in ("str", "string"):
+        charset = _charset(constraints)
+        min_length, max_length = constraints.get("min_length", 3), constraints.get("max_length", 10)
+        return [charset[0] * min_length, (charset * max_length)[:max_length]]
+    if kind == "list":
+        element = constraints.get("element", DEFAULT_CONSTRAINTS)
+        edges = _boundary_values(element)
+        min_length, max_length = constraints.get("min_length", 0), constraints.get("max_length", 5)
+        shortest = edges[:1] * min_length
+        longest = (edges * max_length)[:max_length]
+        return [shortest, longest]
+    return []
+
+
+def _random_value(constraints: Dict[str, Any], rng: random.Random) -> Any:
+    kind = constraints.get("type", "int")
+    if kind == "int":
+        return rng.randint(constraints.get("min", 0), constraints.get("max", 100))
+    if kind == "float":
+        return rng.uniform(constraints.get("min", 0.0), constraints.get("max", 100.0))
+    if kind in ("str", "string"):
+        length = rng.randint(constraints.get("min_length", 3), constraints.get("max_length", 10))
+        return "".join(rng.choices(_charset(constraints), k=length))
+    if kind == "list":
+        element = constraints.get("element", DEFAULT_CONSTRAINTS)
+        length = rng.randint(constraints.get("min_length", 0), constraints.get("max_length", 5))
+        return [_random_value(element, rng) for _ in range(length)]
+    raise ValueError(f"Unsupported input type '{kind}'")
+
+
+def render_input(value: Any, constraints: Dict[str, Any]) -> str:
+    """The line the student's program reads with input()."""
+    kind = constraints.get("type", "int")
+    if kind == "float":
+        return _format_float(value, constraints.get("decimals", 2))
+    if kind == "list":
+        element = constraints.get("element", DEFAULT_CONSTRAINTS)
+        return constraints.get("separator", " ").join(render_input(item, element) for item in value)
+    return str(value)
+
+
+def parse_input(case_input: str, constraints: Dict[str, Any]) -> Any:
+    """Inverse of render_input: the typed value the transform expression receives."""
+    kind = constraints.get("type", "str")
+    if kind == "list":
+        element = constraints.get("element", DEFAULT_CONSTRAINTS)
+        items = case_input.split(constraints.get("separator", " ")) if case_input else []
+        return [parse_input(item, element) for item in items]
+    if kind not in INPUT_TYPES:
+        raise ValueError(f"Unsupported input type '{kind}'")
+    return INPUT_TYPES[kind](case_input)
+
+
+def generate_inputs(constraints: Dict[str, Any], num_cases: int, rng: random.Random) -> List[str]:
+    """
+    num_cases distinct-where-possible inputs: boundary values first (leaving room for at least
+    one random case), then random values drawn from rng.
+    """
+    if constraints.get("type", "int") not in ("int", "float", "str", "string", "list"):
+        return []
+    rendered: List[str] = []
+    for value in _boundary_values(constraints)[:max(num_cases - 1, 0)]:
+        case_input = render_input(value, constraints)
+        if case_input not in rendered:
+            rendered.append(case_input)
+    attempts = 0
+    while len(rendered) < num_cases:
+        case_input = render_input(_random_value(constraints, rng), constraints)
+        attempts += 1
+        # Small ranges cannot give num_cases distinct values; accept repeats after a while
+        if case_input not in rendered or attempts > num_cases * 10:
+            rendered.append(case_input)
+    return rendered
+
+
+def expected_output_for(case_input: str, rules: Dict[str, Any]) -> str:
+    """What a correct program prints for case_input, from transform_for_template and output_format_template."""
+    value = parse_input(case_input, rules.get("input_constraints", {}))
+    transformed = eval(rules.get("transform_for_template", "value"), {"value": value})
+    return rules.get("output_format_template", "{var}\n").replace("{var}", str(transformed))
+
+
+# --- Precomputed case sets ---
+_CASE_SETS: Dict[Tuple[Optional[int], str], List[Dict[str, str]]] = {}
+
+
+def build_case_set(exercise_id: Optional[int], rules: Dict[str, Any],
+                   run_reference: Optional[ReferenceRunner] = None) -> List[Dict[str, str]]:
+    """
+    Deterministic cases for an exercise: the same (exercise, rules version) always yields the
+    same inputs and expected outputs. Exercises with a reference_solution and no
+    transform_for_template take the expected output from running the solution on each input.
+    Raises ValueError on a broken validation config.
+    """
+    constraints = rules.get("input_constraints", DEFAULT_CONSTRAINTS)
+    solution = rules.get("reference_solution") if "transform_for_template" not in rules else None
+    if solution and run_reference is None:
+        raise ValueError("Validation config error: reference_solution needs a runner")
+    rng = random.Random(case_seed(exercise_id, rules_version(rules)))
+    cases = []
+    for case_input in generate_inputs(constraints, rules.get("num_cases", DEFAULT_NUM_CASES), rng):
+        try:
+            expected = run_reference(solution, f"{case_input}\n") if solution else expected_output_for(case_input, rules)
+        except Exception as e:
+            raise ValueError(f"Validation config error on case '{case_input}': {e}") from e
+        cases.append({"input": case_input, "expected_output": expected, "normalized_expected": normalize_output(expected)})
+    return cases
+
+
+def get_case_set(exercise_id: Optional[int], rules: Dict[str, Any],
+                 run_reference: Optional[ReferenceRunner] = None) -> List[Dict[str, str]]:
+    key = (exercise_id, rules_version(rules))
+    if key not in _CASE_SETS:
+        _CASE_SETS[key] = build_case_set(exercise_id, rules, run_reference)
+    return _CASE_SETS[key]
+
+
+def precompute_case_sets(exercises: Dict[int, Dict[str, Any]], run_reference: Optional[ReferenceRunner] = None) -> int:
+    """Builds the case sets of every dynamic_output exercise at load time; returns how many were built."""
+    built = 0
+    for exercise_id, exercise in exercises.items():
+        if exercise.get("validation_type") != "dynamic_output":
+            continue
+        try:
+            get_case_set(exercise_id, exercise.get("validation_rules", {}), run_reference)
+            built += 1
+        except ValueError as e:
+            logger.error(f"EID {exercise_id}: no se pudieron generar los casos de prueba: {e}")
+    return built
+
+
+def case_set_count() -> int:
+    return len(_CASE_SETS)
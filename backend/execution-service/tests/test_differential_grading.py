@@ -0,0 +1,115 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import differential_grading  # noqa: E402
+from differential_grading import (  # noqa: E402
+    OutputMatcher,
+    fingerprint_output,
+    get_fingerprints,
+    grading_cases,
+    load_fingerprints,
+    save_fingerprints,
+)
+import validators  # noqa: E402
+from validators import run_reference_solution, validate_differential_exercise  # noqa: E402
+
+RULES = {
+    "input_constraints": {"type": "int", "min": -50, "max": 50},
+    "num_cases": 20,
+    "reference_solution": "n = int(input())\nprint('Par' if n % 2 == 0 else 'Impar')\nprint(n * n)\n",
+}
+
+
+def _match(expected_output, actual_output):
+    matcher = OutputMatcher(fingerprint_output(expected_output))
+    for line in actual_output.splitlines(keepends=True):
+        if not matcher.feed(line):
+            return False, matcher.mismatch
+    return matcher.finish(), matcher.mismatch
+
+
+def test_matcher_ignores_trailing_whitespace_and_outer_blank_lines():
+    assert _match("Hola\n\nMundo\n", "\nHola  \n\nMundo\n\n\n") == (True, None)
+
+
+def test_matcher_stops_at_first_differing_line():
+    passed, mismatch = _match("a\nb\nc\n", "a\nx\nc\n")
+    assert not passed
+    assert mismatch == {"line": 2, "actual": "x"}
+
+
+def test_matcher_reports_missing_and_extra_lines():
+    assert _match("a\nb\n", "a\n")[1] == {"line": 2, "actual": None}
+    assert _match("a\n", "a\nb\n")[1] == {"line": 2, "actual": "b"}
+    # An inner blank line is part of the output
+    assert _match("a\nb\n", "a\n\nb\n")[1] == {"line": 2, "actual": ""}
+
+
+def test_fingerprints_are_stored_and_reloaded(tmp_path):
+    cases = get_fingerprints(501, RULES, run_reference_solution)
+    assert len(cases) == 20
+    assert all(len(case["lines"]) == 2 for case in cases)
+
+    path = str(tmp_path / "fingerprints.json")
+    saved = save_fingerprints(path)
+    differential_grading._FINGERPRINTS.clear()
+    assert load_fingerprints(path) == saved
+    assert get_fingerprints(501, RULES, lambda code, stdin: 1 / 0) == cases
+
+
+def test_default_case_count_is_part_of_the_fingerprint_key(monkeypatch):
+    rules = {key: value for key, value in RULES.items() if key != "num_cases"}
+    monkeypatch.setattr(differential_grading, "DIFFERENTIAL_NUM_CASES", 5)
+    assert len(get_fingerprints(504, rules, run_reference_solution)) == 5
+    monkeypatch.setattr(differential_grading, "DIFFERENTIAL_NUM_CASES", 8)
+    assert len(get_fingerprints(504, rules, run_reference_solution)) == 8
+
+
+def test_differential_grading_passes_a_correct_solution():
+    code = "x = int(input())\nif x % 2:\n    print('Impar')\nelse:\n    print('Par')\nprint(x ** 2)\n"
+    result = validate_differential_exercise(code, RULES, exercise_id=502)
+    assert result.passed, result.message
+
+
+def test_differential_grading_short_circuits_on_first_wrong_line():
+    code = "x = int(input())\nprint('Impar')\nwhile True:\n    print(x)\n"
+    started = time.monotonic()
+    result = validate_differential_exercise(code, RULES, exercise_id=502, timeout=5)
+    assert not result.passed
+    assert "line" in result.message
+    # The endless loop is killed at the first differing line, not by the timeout
+    assert time.monotonic() - started < 4
+
+
+def test_submission_runs_a_stable_sample_of_the_cases():
+    cases = get_fingerprints(501, RULES, run_reference_solution)
+    sample = grading_cases(cases, "print(1)", limit=5)
+    assert len(sample) == 5
+    assert grading_cases(cases, "print(1)", limit=5) == sample
+    assert grading_cases(cases, "print(1)", limit=50) == cases
+
+
+def test_grading_stops_at_the_total_time_budget(monkeypatch):
+    monkeypatch.setattr(validators, "DIFFERENTIAL_GRADING_BUDGET_SECONDS", 1)
+    code = "import time\ntime.sleep(0.3)\nn = int(input())\nprint('Par' if n % 2 == 0 else 'Impar')\nprint(n * n)\n"
+    started = time.monotonic()
+    result = validate_differential_exercise(code, RULES, exercise_id=502)
+    assert not result.passed
+    assert "timed out" in result.message
+    assert time.monotonic() - started < 3
+
+
+def test_direct_input_runs_the_reference_once():
+    result = validate_differential_exercise("n = int(input())\nprint('Par')\nprint(n * n)\n", RULES, input_data="4")
+    assert result.passed, result.message
+    result = validate_differential_exercise("print('Par')\n", RULES, input_data="4")
+    assert not result.passed
+    assert "ends at line 1" in result.message
+
+
+def test_missing_reference_solution_is_a_config_error():
+    result = validate_differential_exercise("print(1)", {"num_cases": 2}, exercise_id=503)
+    assert not result.passed
+    assert "reference_solution" in result.message
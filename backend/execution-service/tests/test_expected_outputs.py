@@ -0,0 +1,76 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from expected_outputs import (  # noqa: E402
+    PRECOMPUTED_KEY,
+    expected_case_outputs,
+    expected_script_output,
+    precompute_expected_outputs,
+    prepare_expected_outputs,
+)
+from test_case_engine import build_case_set  # noqa: E402
+from validators import run_reference_solution, validate_exam_exercise  # noqa: E402
+
+
+def _runner(outputs):
+    calls = []
+
+    def run(code, input_data):
+        calls.append(input_data)
+        return outputs[input_data]
+
+    run.calls = calls
+    return run
+
+
+def test_literal_outputs_are_normalized_once():
+    rules = {
+        "expected_script_output": "  Hola  \r\n  Mundo\n\n",
+        "test_cases": [{"input": "5", "expected_output": "Positivo\r\n"}, {"input": "x"}],
+    }
+    prepared = prepare_expected_outputs("exam", rules)
+    assert prepared["script_output"] == "Hola\nMundo"
+    assert prepared["test_cases"] == ["Positivo", None]
+
+
+def test_reference_solution_fills_missing_outputs():
+    runner = _runner({None: "Total: 3\n", "-1\n": "Negativo\n"})
+    rules = {"reference_solution": "...", "test_cases": [{"input": "-1"}], "functions": []}
+    prepared = prepare_expected_outputs("exam", rules, runner)
+    assert prepared == {"script_output": "Total: 3", "test_cases": ["Negativo"]}
+    # Literal expected outputs win over the solution
+    prepared = prepare_expected_outputs("exam", dict(rules, expected_script_output="Otro"), runner)
+    assert prepared["script_output"] == "Otro"
+
+
+def test_precompute_stores_outputs_on_the_rules():
+    exercises = {
+        1: {"validation_type": "conditional_print", "validation_rules": {"test_cases": [{"input": "1", "expected_output": " uno \n"}]}},
+        2: {"validation_type": "simple_print", "validation_rules": {}},
+    }
+    assert precompute_expected_outputs(exercises) == 1
+    rules = exercises[1]["validation_rules"]
+    assert rules[PRECOMPUTED_KEY] == {"test_cases": ["uno"]}
+    assert expected_case_outputs(rules) == ["uno"]
+    assert PRECOMPUTED_KEY not in exercises[2]["validation_rules"]
+
+
+def test_unprepared_rules_fall_back_to_normalizing():
+    assert expected_script_output({"expected_script_output": " a \n b "}) == "a\nb"
+    assert expected_script_output({}) is None
+
+
+def test_dynamic_cases_from_reference_solution():
+    rules = {"input_constraints": {"type": "int", "min": 1, "max": 3}, "num_cases": 3, "reference_solution": "..."}
+    runner = _runner({f"{n}\n": f"{n * 2}\n" for n in range(1, 4)})
+    cases = build_case_set(7, rules, runner)
+    assert [case["normalized_expected"] for case in cases] == [str(int(case["input"]) * 2) for case in cases]
+
+
+def test_exam_uses_output_from_a_real_reference_solution():
+    rules = {"functions": [], "reference_solution": "for i in range(3):\n    print('  fila', i)\n"}
+    precompute_expected_outputs({1: {"validation_type": "exam", "validation_rules": rules}}, run_reference_solution)
+    assert rules[PRECOMPUTED_KEY]["script_output"] == "fila 0\nfila 1\nfila 2"
+    result = validate_exam_exercise("for i in range(3): print('fila', i)", rules)
+    assert result.passed, result.message
@@ -0,0 +1,85 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from static_feedback import analyze_code_quality  # noqa: E402
+
+
+def _rules(result):
+    return {issue["rule"] for issue in result["issues"]}
+
+
+def test_clean_code_has_no_issues():
+    code = "def saludar(nombre):\n    return f'Hola {nombre}'\n\n\nprint(saludar('Ana'))\n"
+    result = analyze_code_quality(code)
+    assert result["issues"] == []
+    assert result["trivial_only"] is False
+    assert result["facts"]["functions"] == ["saludar"]
+
+
+def test_syntax_error_is_reported_with_its_line():
+    result = analyze_code_quality("x = 1\ndef f(:\n    pass\n")
+    assert _rules(result) == {"syntax-error"}
+    assert result["issues"][0]["lines"] == [2]
+    assert result["trivial_only"] is True
+
+
+def test_pep8_basics():
+    code = (
+        "import os, sys\n"
+        "def CalcularTotal(x):  \n"
+        "\tif x == None:\n"
+        "\t\treturn 0\n"
+        "\treturn x\n"
+        "class mi_clase:\n"
+        "    pass\n"
+        "valor = CalcularTotal(1) == True\n"
+        "print('" + "a" * 90 + "')\n"
+    )
+    rules = _rules(analyze_code_quality(code, "intermediate"))
+    assert {"E401", "N802", "W291", "W191", "E711", "E712", "N801", "E501"} <= rules
+
+
+def test_unused_locals_are_reported_but_not_module_variables():
+    code = (
+        "resultado = 10\n"
+        "def calcular(a, b):\n"
+        "    temporal = a * 2\n"
+        "    total = a + b\n"
+        "    for i in range(3):\n"
+        "        pass\n"
+        "    return total\n"
+    )
+    issues = [i for i in analyze_code_quality(code)["issues"] if i["rule"] == "F841"]
+    assert len(issues) == 1
+    assert "`temporal`" in issues[0]["message"]
+    assert "resultado" not in issues[0]["message"]
+    assert "`i`" not in issues[0]["message"]
+    assert issues[0]["lines"] == [3]
+
+
+def test_open_without_with_and_bare_except_are_not_trivial():
+    code = (
+        "def leer():\n"
+        "    try:\n"
+        "        f = open('datos.txt')\n"
+        "        return f.read()\n"
+        "    except:\n"
+        "        return ''\n"
+        "def leer_bien():\n"
+        "    with open('datos.txt') as f:\n"
+        "        return f.read()\n"
+    )
+    result = analyze_code_quality(code)
+    assert {"open-without-with", "E722"} <= _rules(result)
+    open_issue = next(i for i in result["issues"] if i["rule"] == "open-without-with")
+    assert open_issue["lines"] == [3]
+    assert result["trivial_only"] is False
+
+
+def test_structure_suggestions_depend_on_level():
+    script = "\n".join(f"print({i})" for i in range(12))
+    assert {"missing-functions", "long-script"} <= _rules(analyze_code_quality(script, "beginner"))
+    assert "missing-functions" not in _rules(analyze_code_quality(script, "advanced"))
+    long_script = "\n".join(f"print({i})" for i in range(25))
+    assert "missing-classes" in _rules(analyze_code_quality(long_script, "advanced"))
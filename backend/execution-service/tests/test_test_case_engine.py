@@ -0,0 +1,87 @@
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from test_case_engine import (  # noqa: E402
+    build_case_set,
+    expected_output_for,
+    generate_inputs,
+    get_case_set,
+    precompute_case_sets,
+    rules_version,
+)
+
+SEED_EXERCISES = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "..", "shared", "seed_data", "seed_exercises.json")
+)
+
+CELSIUS_RULES = {
+    "input_constraints": {"type": "float", "min": -100, "max": 100},
+    "transform_for_template": "(float(value) * 9/5) + 32",
+    "output_format_template": "{var}\n",
+    "num_cases": 4,
+}
+
+
+def test_case_sets_are_reproducible_per_exercise_and_rules_version():
+    assert build_case_set(11, CELSIUS_RULES) == build_case_set(11, CELSIUS_RULES)
+    assert build_case_set(11, CELSIUS_RULES) != build_case_set(12, CELSIUS_RULES)
+    changed = dict(CELSIUS_RULES, num_cases=6)
+    assert rules_version(changed) != rules_version(CELSIUS_RULES)
+    assert len(build_case_set(11, changed)) == 6
+
+
+def test_boundary_values_come_first():
+    inputs = generate_inputs({"type": "int", "min": -5, "max": 5}, 5, random.Random(0))
+    assert inputs[:3] == ["-5", "5", "0"]
+    assert len(inputs) == 5
+    assert all(-5 <= int(value) <= 5 for value in inputs)
+
+
+def test_at_least_one_random_case_is_kept():
+    inputs = generate_inputs({"type": "int", "min": 1, "max": 100}, 2, random.Random(0))
+    assert inputs[0] == "1"
+    assert len(inputs) == 2
+
+
+def test_string_and_list_generation():
+    strings = generate_inputs({"type": "string", "min_length": 2, "max_length": 4, "charset": "numeric"}, 4, random.Random(1))
+    assert all(2 <= len(value) <= 4 and value.isdigit() for value in strings)
+
+    lists = generate_inputs({"type": "list", "element": {"type": "int", "min": 0, "max": 9}, "min_length": 0, "max_length": 3}, 4, random.Random(1))
+    assert lists[0] == ""
+    assert all(len(value.split()) <= 3 for value in lists)
+
+
+def test_expected_output_uses_transform_and_template():
+    assert expected_output_for("0.0", CELSIUS_RULES) == "32.0\n"
+    rules = {
+        "input_constraints": {"type": "list", "element": {"type": "int"}},
+        "transform_for_template": "sum(value)",
+        "output_format_template": "Total: {var}\n",
+    }
+    assert expected_output_for("1 2 3", rules) == "Total: 6\n"
+
+
+def test_broken_transform_is_a_config_error():
+    rules = dict(CELSIUS_RULES, transform_for_template="value +")
+    try:
+        build_case_set(11, rules)
+    except ValueError as e:
+        assert "Validation config error" in str(e)
+    else:
+        raise AssertionError("expected a ValueError")
+
+
+def test_seed_exercises_are_precomputed():
+    with open(SEED_EXERCISES, encoding="utf-8") as f:
+        exercises = {int(exercise["id"]): exercise for exercise in json.load(f)}
+    dynamic = {eid: ex for eid, ex in exercises.items() if ex.get("validation_type") == "dynamic_output"}
+    assert precompute_case_sets(exercises) == len(dynamic)
+    for eid, exercise in dynamic.items():
+        rules = exercise["validation_rules"]
+        cases = get_case_set(eid, rules)
+        assert len(cases) == rules.get("num_cases", 5)
+        assert get_case_set(eid, rules) is cases
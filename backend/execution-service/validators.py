@@ -10,7 +10,18 @@ import json
 import asyncio
 import inspect
 import logging
-from typing import Dict, Optional, List, Any, Tuple, Set
+import threading
+from typing import Callable, Dict, Optional, List, Any, Tuple, Set
+
+from expected_outputs import (
+    expected_case_outputs,
+    expected_exact_output,
+    expected_script_output,
+    normalize_output,
+    normalize_script_output,
+)
+from differential_grading import DIFFERENTIAL_GRADING_BUDGET_SECONDS, OutputMatcher, fingerprint_output, get_fingerprints, grading_cases
+from test_case_engine import expected_output_for, generate_inputs, get_case_set
 
 # Set up logger for this module
 logger = logging.getLogger(__name__)
@@ -116,6 +127,89 @@ def run_user_code_sandboxed(
             try: os.unlink(tmp_file_path)
             except Exception: pass
     return user_stdout, stderr, timed_out, exit_code, captured_metadata
+
+def _kill_process_group(process: subprocess.Popen) -> None:
+    if hasattr(os, 'killpg') and hasattr(os, 'getpgid'):
+        try:
+            os.killpg(os.getpgid(process.pid), signal.SIGTERM)
+        except ProcessLookupError: pass
+    else: process.kill()
+
+def run_user_code_streaming(
+    code_string: str,
+    input_data: Optional[str],
+    on_line: Callable[[str], bool],
+    timeout: int = 5
+) -> Tuple[str, str, bool, int, bool]:
+    """
+    Runs user code like run_user_code_sandboxed, but hands every stdout line to on_line as soon
+    as it is printed. If on_line returns False the process is killed right away.
+    Returns: (stdout_read, stderr, timed_out, exit_code, stopped_early)
+    """
+    code_to_run = code_string.replace('\r\n', '\n')
+    stdout_lines: List[str] = []
+    stderr, timed_out, exit_code, stopped_early = "", False, -1, False
+    tmp_file_path = None
+
+    try:
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".py", delete=False, newline='\n', encoding='utf-8') as tmp_file:
+            tmp_file_path = tmp_file.name
+            tmp_file.write(code_to_run)
+
+        # stderr goes to a file so a chatty program cannot block on a full pipe while we read stdout
+        with tempfile.TemporaryFile(mode="w+", encoding='utf-8') as stderr_file:
+            process = subprocess.Popen(
+                ["python", tmp_file_path], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=stderr_file,
+                text=True, encoding='utf-8', errors='replace', env={**os.environ, "PYTHONUNBUFFERED": "1"},
+                preexec_fn=os.setsid if hasattr(os, 'setsid') else None
+            )
+            expired = threading.Event()
+
+            def on_timeout():
+                expired.set()
+                _kill_process_group(process)
+
+            watchdog = threading.Timer(timeout, on_timeout)
+            watchdog.start()
+            try:
+                try:
+                    process.stdin.write(input_data or "")
+                    process.stdin.close()
+                except BrokenPipeError: pass
+                for line in process.stdout:
+                    stdout_lines.append(line)
+                    if not on_line(line):
+                        stopped_early = True
+                        _kill_process_group(process)
+                        break
+                process.stdout.close()
+                exit_code = process.wait()
+            finally:
+                watchdog.cancel()
+            stderr_file.seek(0)
+            stderr = stderr_file.read()
+            if expired.is_set() and not stopped_early:
+                stderr += "\nExecution timed out."
+                timed_out = True
+                exit_code = -9
+    except Exception as e:
+        stderr += f"\nError during sandboxed execution: {e}"
+        exit_code = -1
+    finally:
+        if tmp_file_path and os.path.exists(tmp_file_path):
+            try: os.unlink(tmp_file_path)
+            except Exception: pass
+    return "".join(stdout_lines), stderr, timed_out, exit_code, stopped_early
+
+def run_reference_solution(code: str, input_data: Optional[str] = None, timeout: int = 10) -> str:
+    """Stdout of an exercise's reference solution; raises ValueError if it does not run cleanly."""
+    stdout, stderr, timed_out, exit_code, _ = run_user_code_sandboxed(code, input_data, timeout)
+    if timed_out:
+        raise ValueError("reference solution timed out")
+    if exit_code != 0:
+        raise ValueError(f"reference solution failed: {stderr.strip()}")
+    return stdout
+
 def general_security_check(user_code: str) -> DynamicValidationResult:
     """
     Performs basic security checks on the user's code using AST.
@@ -692,10 +786,9 @@ def validate_simple_print_exercise(user_code: str, rules: Dict[str, Any], **kwar
                 
 
     # Check exact output content
-    expected_output = rules.get("expected_exact_output")
-    if expected_output is not None:
+    normalized_expected = expected_exact_output(rules)
+    if normalized_expected is not None:
         normalized_stdout = stdout.replace('\r\n', '\n')
-        normalized_expected = expected_output.replace('\r\n', '\n')
         if normalized_stdout != normalized_expected:
             passed = False
             feedback_key = "wrong_output"
@@ -746,26 +839,27 @@ def validate_dynamic_output_exercise(user_code: str, rules: Dict[str, Any], **kw
     # Ensure test_cases is always a list. If a single string is passed, wrap it in a list.
     if isinstance(test_cases, str):
         test_cases = [test_cases]
-    elif test_cases is None:
-        # Generate test cases if not provided
-        constraints = rules.get("input_constraints", {"type": "int", "min": 0, "max": 100})
-        num_cases = rules.get("num_cases", 5)
-        test_cases = generate_dynamic_test_cases(constraints, num_cases)
+    if test_cases is None:
+        # Precomputed, seeded cases for this exercise and rules version (built at load time)
+        try:
+            cases = get_case_set(kwargs.get("exercise_id"), rules, run_reference_solution)
+        except ValueError as e:
+            return DynamicValidationResult(False, str(e))
+    else:
+        cases = []
+        for case_input in test_cases:
+            try:
+                cases.append({"input": case_input, "normalized_expected": normalize_output(expected_output_for(case_input, rules))})
+            except Exception as e:
+                return DynamicValidationResult(False, f"Validation config error on case '{case_input}': {e}")
     # --- END: FIX for test case handling ---
 
     all_cases_passed = True
     feedback = []
     last_stdout = "" # Store the stdout of the last run case
 
-    for i, case_input in enumerate(test_cases):
-        try:
-            transform_expr = rules.get("transform_for_template", "value")
-            input_type = rules.get("input_constraints", {}).get("type", "str")
-            actual_case_value = {"int": int, "str": str, "string": str, "bool": bool, "float": float}[input_type](case_input)
-            expected_transformed = eval(transform_expr, {"value": actual_case_value})
-            expected_output = rules.get("output_format_template", "{var}\n").replace("{var}", str(expected_transformed))
-        except Exception as e:
-            return DynamicValidationResult(False, f"Validation config error on case '{case_input}': {e}")
+    for case in cases:
+        case_input, normalized_expected = case["input"], case["normalized_expected"]
 
         # --- START: FIX for input handling ---
         # The input() function reads a line, so we must append a newline
@@ -796,11 +890,10 @@ def validate_dynamic_output_exercise(user_code: str, rules: Dict[str, Any], **kw
                     return DynamicValidationResult(False, message, actual_output=stdout)
 
         # --- START: IMPROVED VALIDATION LOGIC ---
-        # Normalize both outputs by replacing Windows newlines and stripping whitespace.
+        # Normalize the output by replacing Windows newlines and stripping whitespace.
         # This makes the validation robust against trailing newlines from print()
-        # and other minor whitespace differences.
-        normalized_stdout = stdout.replace('\r\n', '\n').strip()
-        normalized_expected = expected_output.replace('\r\n', '\n').strip()
+        # and other minor whitespace differences. Expected outputs are stored normalized.
+        normalized_stdout = normalize_output(stdout)
 
         if timed_out or exit_code != 0 or normalized_stdout != normalized_expected:
             all_cases_passed = False
@@ -815,14 +908,9 @@ def validate_dynamic_output_exercise(user_code: str, rules: Dict[str, Any], **kw
     else:
         # --- FIX: Pass the actual_output on failure ---
         return DynamicValidationResult(False, "One or more dynamic test cases failed. " + " ".join(feedback), actual_output=last_stdout)
-def generate_dynamic_test_cases(constraints: Dict[str, Any], num_cases: int) -> List[str]:
-    t = constraints.get("type", "int")
-    if t == "int":
-        return [str(random.randint(constraints.get("min", 0), constraints.get("max", 100))) for _ in range(num_cases)]
-    elif t in ["str", "string"]:
-        charset = constraints.get("charset", "abcdefghijklmnopqrstuvwxyz")
-        return [''.join(random.choices(charset, k=random.randint(constraints.get("min_length", 3), constraints.get("max_length", 10)))) for _ in range(num_cases)]
-    return []
+def generate_dynamic_test_cases(constraints: Dict[str, Any], num_cases: int, seed: Optional[int] = None) -> List[str]:
+    """Inputs for the given constraints; see test_case_engine for the supported types."""
+    return generate_inputs(constraints, num_cases, random.Random(seed))
 
 def validate_function_exercise(user_code: str, rules: Dict[str, Any], scenario_config: Dict[str, Any], **kwargs) -> DynamicValidationResult:
     func_name = rules.get("function_name")
@@ -1016,13 +1104,12 @@ def validate_exam_exercise(user_code: str, rules: Dict[str, Any], **kwargs) -> D
                 feedback["Requisitos Estructurales"].append(f"Decorador '@{deco}' en '{func}': FAILED. El decorador no fue aplicado a la función correcta.")
 
     # --- 4. Validar Salida Completa del Script ---
-    expected_output = rules.get("expected_script_output")
-    if expected_output:
+    normalized_expected = expected_script_output(rules)
+    if normalized_expected:
         total_checks += 1
         stdout, stderr, timed_out, exit_code, _ = run_user_code_sandboxed(user_code)
         if exit_code == 0 and not timed_out:
-            normalized_stdout = "\n".join(line.strip() for line in stdout.strip().splitlines())
-            normalized_expected = "\n".join(line.strip() for line in expected_output.strip().splitlines())
+            normalized_stdout = normalize_script_output(stdout)
             if normalized_stdout == normalized_expected:
                 passed_checks += 1
                 feedback["Salida del Script"].append("Salida del Script: PASSED.")
@@ -1100,10 +1187,9 @@ def validate_conditional_print_exercise(user_code: str, rules: Dict[str, Any], *
         test_cases = rules.get("test_cases", [])
         if test_cases:
             # NEW FORMAT: Use predefined test cases with input/expected_output pairs
-            for case in test_cases:
+            for case, normalized_expected in zip(test_cases, expected_case_outputs(rules)):
                 case_input = case.get("input")
-                expected_output = case.get("expected_output")
-                if case_input is not None and expected_output is not None:
+                if case_input is not None and normalized_expected is not None:
                     input_with_newline = f'{case_input}\n'
                     stdout, stderr, timed_out, exit_code, _ = run_user_code_sandboxed(
                         user_code, input_with_newline, kwargs.get("timeout", 5)
@@ -1115,8 +1201,7 @@ def validate_conditional_print_exercise(user_code: str, rules: Dict[str, Any], *
                         return DynamicValidationResult(False, f"Runtime error on input '{case_input}': {stderr.strip()}", actual_output=stdout)
 
                     # Compare the actual output with the expected output
-                    normalized_stdout = stdout.replace('\r\n', '\n').strip()
-                    normalized_expected = expected_output.replace('\r\n', '\n').strip()
+                    normalized_stdout = normalize_output(stdout)
 
                     if normalized_stdout != normalized_expected:
                         feedback_key = "wrong_output"
@@ -1269,6 +1354,62 @@ def validate_class_exercise(user_code: str, rules: Dict[str, Any], **kwargs) ->
 
     return DynamicValidationResult(True, "All class checks passed!")
 
+def validate_differential_exercise(user_code: str, rules: Dict[str, Any], **kwargs) -> DynamicValidationResult:
+    """
+    Grades against the exercise's reference_solution instead of written expected outputs. The
+    student's output on each seeded input is matched line by line against fingerprints of the
+    reference output, stopping the run at the first line that differs.
+    """
+    analyzer = CodeAnalyzer(user_code)
+    if analyzer.syntax_error:
+        return DynamicValidationResult(False, f"Your code has a syntax error: {analyzer.syntax_error}")
+
+    static_failures = analyzer.check_static_requirements(rules)
+    if static_failures:
+        return DynamicValidationResult(False, "Static analysis failed: " + " ".join(static_failures))
+
+    direct_input = kwargs.get("input_data")
+    try:
+        if direct_input is not None:
+            # Arbitrary input from the "run" box: one reference run, nothing to precompute
+            if not rules.get("reference_solution"):
+                raise ValueError("Validation config error: differential_output requires 'reference_solution'")
+            cases = [{"input": direct_input, "lines": fingerprint_output(run_reference_solution(rules["reference_solution"], f"{direct_input}\n"))}]
+        else:
+            cases = get_fingerprints(kwargs.get("exercise_id"), rules, run_reference_solution)
+    except ValueError as e:
+        return DynamicValidationResult(False, str(e))
+
+    cases = grading_cases(cases, user_code)
+    deadline = time.monotonic() + DIFFERENTIAL_GRADING_BUDGET_SECONDS
+    last_stdout = ""
+    for case in cases:
+        case_input = case["input"]
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return DynamicValidationResult(False, f"Execution timed out: grading exceeded {DIFFERENTIAL_GRADING_BUDGET_SECONDS:g} seconds before input '{case_input}'.", actual_output=last_stdout)
+        matcher = OutputMatcher(case["lines"])
+        stdout, stderr, timed_out, exit_code, stopped_early = run_user_code_streaming(
+            user_code, f"{case_input}\n", matcher.feed, min(kwargs.get("timeout", 5), remaining)
+        )
+        last_stdout = stdout
+
+        if not stopped_early:
+            if timed_out:
+                return DynamicValidationResult(False, f"Execution timed out on input '{case_input}'.", actual_output=stdout)
+            if exit_code != 0:
+                return DynamicValidationResult(False, f"Runtime error on input '{case_input}': {stderr.strip()}", actual_output=stdout)
+        if stopped_early or not matcher.finish():
+            mismatch = matcher.mismatch
+            if mismatch["actual"] is None:
+                default_msg = f"Failed on input '{case_input}': your output ends at line {mismatch['line'] - 1}, but the expected output has {len(case['lines'])} lines."
+            else:
+                default_msg = f"Failed on input '{case_input}': line {mismatch['line']} of your output differs from the expected output. Got: '{mismatch['actual']}'."
+            message = rules.get("custom_feedback", {}).get("wrong_output", default_msg)
+            return DynamicValidationResult(False, message, actual_output=stdout)
+
+    return DynamicValidationResult(True, f"All {len(cases)} test cases passed!", actual_output=last_stdout)
+
 VALIDATOR_MAP = {
     "simple_print": validate_simple_print_exercise,
     "dynamic_output": validate_dynamic_output_exercise,
@@ -1278,6 +1419,7 @@ VALIDATOR_MAP = {
     "saludo_personalizado": validate_saludo_personalizado, # <-- ADD THIS LINE
     "flexible_exercise": validate_flexible_exercise,  # Add the new validator
     "class_exercise": validate_class_exercise,
+    "differential_output": validate_differential_exercise,
     # "function_and_output" is deprecated for simplicity.
     # "class_exercise" can be added back here if needed, following the new pattern.
 }
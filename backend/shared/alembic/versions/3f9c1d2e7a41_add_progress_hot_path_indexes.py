@@ -0,0 +1,62 @@
+"""add composite indexes for progress and navigation hot paths
+
+Revision ID: 3f9c1d2e7a41
+Revises: edf047a461e3
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9c1d2e7a41'
+down_revision: Union[str, None] = 'edf047a461e3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (name, table, columns, extra postgresql options)
+INDEXES = [
+    # "Has this user solved this exercise?" is answered from the index alone
+    ('ix_user_exercise_submissions_user_exercise', 'user_exercise_submissions', ['user_id', 'exercise_id'],
+     {'postgresql_include': ['is_correct']}),
+    # Completion counts only ever look at correct submissions
+    ('ix_user_exercise_submissions_user_correct', 'user_exercise_submissions', ['user_id', 'exercise_id'],
+     {'postgresql_where': sa.text('is_correct = true')}),
+    ('ix_user_course_enrollments_user_course_active', 'user_course_enrollments', ['user_id', 'course_id', 'is_active'], {}),
+    ('ix_lessons_module_order', 'lessons', ['module_id', 'order_index'], {}),
+    ('ix_modules_course_order', 'modules', ['course_id', 'order_index'], {}),
+    ('ix_exercises_lesson_order', 'exercises', ['lesson_id', 'order_index'], {}),
+    ('ix_user_exam_attempts_user_course_active', 'user_exam_attempts', ['user_id', 'course_id', 'is_active'], {}),
+]
+
+
+def _existing_indexes(inspector, table):
+    return {index['name'] for index in inspector.get_indexes(table)}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = inspect(op.get_bind())
+    # CONCURRENTLY cannot run inside a transaction; building without it would block writes
+    # to the progress tables for the duration of the build.
+    with op.get_context().autocommit_block():
+        for name, table, columns, options in INDEXES:
+            # Crear índice solo si no existe
+            if name in _existing_indexes(inspector, table):
+                continue
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True, **options)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    inspector = inspect(op.get_bind())
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            # Eliminar índice solo si existe
+            if name in _existing_indexes(inspector, table):
+                op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,37 @@
+"""add is_active to exercises for soft delete
+
+Revision ID: 8b2e4f6a9c13
+Revises: 3f9c1d2e7a41
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b2e4f6a9c13'
+down_revision: Union[str, None] = '3f9c1d2e7a41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _column_exists(bind, table_name: str, column_name: str) -> bool:
+    return any(column['name'] == column_name for column in inspect(bind).get_columns(table_name))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    if not _column_exists(bind, 'exercises', 'is_active'):
+        op.add_column('exercises', sa.Column('is_active', sa.Boolean(), nullable=False, server_default=sa.true()))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    if _column_exists(bind, 'exercises', 'is_active'):
+        op.drop_column('exercises', 'is_active')
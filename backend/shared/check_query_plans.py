@@ -0,0 +1,114 @@
+"""
+EXPLAIN-based regression check for the progress and navigation hot paths.
+
+Runs EXPLAIN (FORMAT JSON) for the queries user-service and content-service issue on
+every completion check / navigation request and fails if any of them stops using its
+index. Sequential scans are disabled for the session so the check also works on a small
+development database, where the planner would otherwise prefer scanning the whole table.
+
+Usage (inside the user-service or content-service container, after `alembic upgrade head`):
+    python /app/shared/check_query_plans.py
+Exits with status 1 if any query does not use its expected index.
+"""
+import json
+import logging
+import os
+import sys
+from typing import Iterator, List, Tuple
+
+from sqlalchemy import create_engine, text
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+INDEX_NODE_TYPES = {"Index Scan", "Index Only Scan", "Bitmap Index Scan"}
+
+# (description, SQL, accepted index names)
+HOT_QUERIES: List[Tuple[str, str, set]] = [
+    (
+        "exercise solved by user",
+        "SELECT 1 FROM user_exercise_submissions WHERE user_id = 1 AND exercise_id = 1 AND is_correct = true LIMIT 1",
+        {"ix_user_exercise_submissions_user_correct", "ix_user_exercise_submissions_user_exercise"},
+    ),
+    (
+        "completed exercises count",
+        "SELECT count(DISTINCT exercise_id) FROM user_exercise_submissions WHERE user_id = 1 AND is_correct = true",
+        {"ix_user_exercise_submissions_user_correct"},
+    ),
+    (
+        "submissions of a user for an exercise",
+        "SELECT id, is_correct FROM user_exercise_submissions WHERE user_id = 1 AND exercise_id = 1",
+        {"ix_user_exercise_submissions_user_exercise"},
+    ),
+    (
+        "active enrollment",
+        "SELECT id FROM user_course_enrollments WHERE user_id = 1 AND course_id = 1 AND is_active = true",
+        {"ix_user_course_enrollments_user_course_active"},
+    ),
+    (
+        "lessons of a module in order",
+        "SELECT id, title FROM lessons WHERE module_id = 1 ORDER BY order_index",
+        {"ix_lessons_module_order"},
+    ),
+    (
+        "modules of a course in order",
+        "SELECT id, title FROM modules WHERE course_id = 1 ORDER BY order_index",
+        {"ix_modules_course_order"},
+    ),
+    (
+        "exercises of a lesson in order",
+        "SELECT id, title FROM exercises WHERE lesson_id = 1 ORDER BY order_index",
+        {"ix_exercises_lesson_order"},
+    ),
+    (
+        "active exam attempt",
+        "SELECT id, exercise_id FROM user_exam_attempts WHERE user_id = 1 AND course_id = 1 AND is_active = true",
+        {"ix_user_exam_attempts_user_course_active"},
+    ),
+]
+
+
+def iter_plan_nodes(node: dict) -> Iterator[dict]:
+    yield node
+    for child in node.get("Plans", []):
+        yield from iter_plan_nodes(child)
+
+
+def indexes_used(plan: dict) -> set:
+    return {
+        node["Index Name"]
+        for node in iter_plan_nodes(plan["Plan"])
+        if node.get("Node Type") in INDEX_NODE_TYPES and "Index Name" in node
+    }
+
+
+def main() -> int:
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        logger.error("DATABASE_URL is not set")
+        return 1
+
+    engine = create_engine(database_url)
+    failures = 0
+    with engine.connect() as conn:
+        conn.execute(text("SET enable_seqscan = off"))
+        for description, sql, expected in HOT_QUERIES:
+            raw = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+            plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]
+            used = indexes_used(plan)
+            if used & expected:
+                logger.info(f"OK   {description}: {', '.join(sorted(used & expected))}")
+            else:
+                failures += 1
+                logger.error(f"FAIL {description}: expected one of {sorted(expected)}, plan used {sorted(used) or 'no index'}")
+                logger.error(json.dumps(plan["Plan"], indent=2))
+
+    if failures:
+        logger.error(f"{failures} of {len(HOT_QUERIES)} hot queries do not use their index")
+        return 1
+    logger.info(f"All {len(HOT_QUERIES)} hot queries use their index")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""
+Signed service-to-service credentials.
+
+A service that has already authenticated the end user (e.g. content-service) can call
+internal endpoints of another service (e.g. user-service) on that user's behalf by
+signing the request with the shared INTERNAL_SERVICE_SECRET instead of forwarding the
+user's bearer token. The receiving service verifies the HMAC and trusts the user_id
+without running its own user lookup.
+
+The receiving service does not check token revocation for signed calls either: the
+caller must confirm the user's bearer token is still the stored session token
+(`token:{generation}:{username}` in Redis) before signing on the user's behalf.
+
+The api-gateway strips every `x-internal-*` header from external traffic, so these
+headers can only come from inside the service network.
+"""
+import hashlib
+import hmac
+import os
+import time
+from typing import Mapping, Optional
+
+INTERNAL_SERVICE_SECRET = os.getenv("INTERNAL_SERVICE_SECRET", "")
+INTERNAL_SIGNATURE_MAX_AGE_SECONDS = int(os.getenv("INTERNAL_SIGNATURE_MAX_AGE_SECONDS", 30))
+
+INTERNAL_HEADER_PREFIX = "x-internal-"
+SERVICE_HEADER = "X-Internal-Service"
+USER_ID_HEADER = "X-Internal-User-Id"
+TIMESTAMP_HEADER = "X-Internal-Timestamp"
+SIGNATURE_HEADER = "X-Internal-Signature"
+
+
+class InternalAuthError(Exception):
+    """Raised when internal headers are present but invalid."""
+
+
+def internal_auth_enabled() -> bool:
+    return bool(INTERNAL_SERVICE_SECRET)
+
+
+def _signature(service: str, user_id: int, timestamp: str, method: str, path: str) -> str:
+    message = "\n".join([service, str(user_id), timestamp, method.upper(), path])
+    return hmac.new(INTERNAL_SERVICE_SECRET.encode(), message.encode(), hashlib.sha256).hexdigest()
+
+
+def sign_internal_request(service: str, user_id: int, method: str, path: str) -> dict:
+    """Headers asserting that `service` calls `method path` for the already verified `user_id`."""
+    if not internal_auth_enabled():
+        return {}
+    timestamp = str(int(time.time()))
+    return {
+        SERVICE_HEADER: service,
+        USER_ID_HEADER: str(user_id),
+        TIMESTAMP_HEADER: timestamp,
+        SIGNATURE_HEADER: _signature(service, user_id, timestamp, method, path),
+    }
+
+
+def verify_internal_request(headers: Mapping[str, str], method: str, path: str) -> Optional[int]:
+    """
+    Returns the signed user_id, or None if the request carries no internal signature.
+    Raises InternalAuthError if a signature is present but invalid or expired.
+    """
+    signature = headers.get(SIGNATURE_HEADER)
+    if signature is None:
+        return None
+    if not internal_auth_enabled():
+        raise InternalAuthError("Internal authentication is not configured")
+
+    service = headers.get(SERVICE_HEADER, "")
+    timestamp = headers.get(TIMESTAMP_HEADER, "")
+    try:
+        user_id = int(headers.get(USER_ID_HEADER, ""))
+        age = abs(time.time() - int(timestamp))
+    except ValueError:
+        raise InternalAuthError("Malformed internal authentication headers")
+    if age > INTERNAL_SIGNATURE_MAX_AGE_SECONDS:
+        raise InternalAuthError("Internal signature expired")
+    if not hmac.compare_digest(signature, _signature(service, user_id, timestamp, method, path)):
+        raise InternalAuthError("Invalid internal signature")
+    return user_id
@@ -1,12 +1,17 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, Float, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, Float, UniqueConstraint, Index
 from sqlalchemy.sql import func
 from typing import Optional, List, Dict, Any, Union, Tuple, Callable
-from sqlalchemy.orm import relationship, Mapped, mapped_column
+from sqlalchemy.orm import relationship, Mapped, mapped_column, deferred
 from sqlalchemy.dialects.postgresql import JSONB
 from datetime import datetime
 
 from . import Base
 
+# Deferred column groups: large text/JSON bodies are only loaded when a query asks for
+# them with undefer_group(...), so navigation and progress queries never fetch them.
+LESSON_BODY = "lesson_body"
+EXERCISE_BODY = "exercise_body"
+
 class Course(Base):
     __tablename__ = "courses"
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -31,6 +36,9 @@ class Course(Base):
 
 class Module(Base):  # <-- Change from Modules to Module
     __tablename__ = "modules"
+    __table_args__ = (
+        Index("ix_modules_course_order", "course_id", "order_index"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     course_id = Column(Integer, ForeignKey("courses.id"), nullable=False)
     title = Column(String, nullable=False)
@@ -45,10 +53,13 @@ class Module(Base):  # <-- Change from Modules to Module
 
 class Lesson(Base):
     __tablename__ = "lessons"
+    __table_args__ = (
+        Index("ix_lessons_module_order", "module_id", "order_index"),
+    )
     id: Mapped[int] = mapped_column(primary_key=True)
     module_id: Mapped[int] = mapped_column(ForeignKey("modules.id"))
     title = Column(String, nullable=False)
-    content = Column(Text, nullable=False)
+    content = deferred(Column(Text, nullable=False), group=LESSON_BODY)
     order_index = Column(Integer, nullable=False)
     duration_minutes = Column(Integer)
     is_active = Column(Boolean, default=True)  # New field for soft delete
@@ -59,22 +70,26 @@ class Lesson(Base):
 
 class Exercise(Base):
     __tablename__ = "exercises"
+    __table_args__ = (
+        Index("ix_exercises_lesson_order", "lesson_id", "order_index"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     course_id = Column(Integer, ForeignKey("courses.id"), nullable=True)  # Optional: If exercises can be linked to a course directly
     module_id = Column(Integer, ForeignKey("modules.id"), nullable=True)
     lesson_id = Column(Integer, ForeignKey("lessons.id"), nullable=True)
     order_index = Column(Integer, nullable=False, default=1)
     title = Column(String, nullable=False)
-    description = Column(Text, nullable=False)
-    instructions = Column(Text)
-    explanation = Column(Text, nullable=True)
-    starter_code = Column(Text)
+    description = deferred(Column(Text, nullable=False), group=EXERCISE_BODY)
+    instructions = deferred(Column(Text), group=EXERCISE_BODY)
+    explanation = deferred(Column(Text, nullable=True), group=EXERCISE_BODY)
+    starter_code = deferred(Column(Text), group=EXERCISE_BODY)
     validation_type = Column(String, nullable=True)
-    validation_rules = Column(JSONB, nullable=True)
-    hints = Column(Text)
+    validation_rules = deferred(Column(JSONB, nullable=True), group=EXERCISE_BODY)
+    hints = deferred(Column(Text), group=EXERCISE_BODY)
     difficulty = Column(String, nullable=True)
     estimated_time_minutes = Column(Integer, nullable=True)  # Optional: Add difficulty and estimated time
     tags = Column(JSONB, nullable=True)  # Optional: Tags for categorization
+    is_active = Column(Boolean, default=True, nullable=False, server_default="true")  # Soft delete: removed from the seed
     # You might also want to add estimated_time_minutes and tags if they are part of your seed data
     # estimated_time_minutes = Column(Integer, nullable=True)
     # tags = Column(JSONB, nullable=True) # Or use a separate Tags table and a many-to-many relationship
@@ -85,6 +100,9 @@ class Exercise(Base):
 
 class UserCourseEnrollment(Base): # This will serve as UserCourseProgress
     __tablename__ = "user_course_enrollments"
+    __table_args__ = (
+        Index("ix_user_course_enrollments_user_course_active", "user_id", "course_id", "is_active"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, nullable=False)
     course_id = Column(Integer, ForeignKey("courses.id"), nullable=False)
@@ -205,6 +223,9 @@ class ExamQuestion(Base):
 
 class UserExamAttempt(Base):
     __tablename__ = "user_exam_attempts"
+    __table_args__ = (
+        Index("ix_user_exam_attempts_user_course_active", "user_id", "course_id", "is_active"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, nullable=False)
     course_id = Column(Integer, ForeignKey("courses.id"), nullable=False)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Float, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Float, ForeignKey, UniqueConstraint, Index, text
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -43,6 +43,10 @@ class Progress(Base):
 
 class UserExerciseSubmission(Base):
     __tablename__ = "user_exercise_submissions"
+    __table_args__ = (
+        Index("ix_user_exercise_submissions_user_exercise", "user_id", "exercise_id", postgresql_include=["is_correct"]),
+        Index("ix_user_exercise_submissions_user_correct", "user_id", "exercise_id", postgresql_where=text("is_correct = true")),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False) # ADDED ForeignKey
     exercise_id = Column(Integer, ForeignKey("exercises.id"), nullable=False)
@@ -1,7 +1,14 @@
 import json
 import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Dict, List, Set, Tuple
 from sqlalchemy.orm import Session as SQLAlchemySession # Renamed to avoid conflict
-from sqlalchemy import create_engine, inspect, text # ADDED text
+from sqlalchemy import create_engine, inspect, text, select, update, Float, Integer # ADDED text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import sessionmaker
 from passlib.context import CryptContext
 import logging
@@ -13,6 +20,13 @@ from models import (
     UserExerciseSubmission, ExamQuestion, CourseExam, UserExamAttempt
 )
 
+# The seeder runs inside the content-service container, so its content cache is importable.
+# Bumping the content version after seeding invalidates every cached module/lesson/exercise.
+try:
+    from cache import bump_content_version
+except ImportError:
+    bump_content_version = None
+
 # Database connection
 DATABASE_URL = os.getenv("DATABASE_URL")
 engine = create_engine(DATABASE_URL)
@@ -253,61 +267,252 @@ def reset_sequences_for_level(session: SQLAlchemySession, highest_level_changed:
     session.commit()
     logger.info(f"PostgreSQL sequences reset for level '{highest_level_changed}'.")
 
-def seed_courses(session: SQLAlchemySession):
-    logger.info("Seeding courses...")
-    with open(os.path.join(os.path.dirname(__file__), "seed_data/seed_courses.json"), encoding="utf-8") as f:
-        courses_data = json.load(f)
-        for course_item_data in courses_data:
-            course_item_data.pop("total_modules", None)
-            if not session.query(Course).filter_by(id=course_item_data["id"]).first():
-                session.add(Course(**course_item_data))
+# --- Bulk seeding helpers ---
+STAGE_TIMINGS: List[Tuple[str, float, int]] = []  # (stage, seconds, rows)
+
+@contextmanager
+def timed_stage(stage_name: str):
+    """Times a seeding stage. The body may set stats["rows"] to report how many rows it wrote."""
+    stats = {"rows": 0}
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_TIMINGS.append((stage_name, elapsed, stats["rows"]))
+        logger.info(f"Stage '{stage_name}' finished in {elapsed:.2f}s ({stats['rows']} rows).")
+
+def log_timing_report():
+    if not STAGE_TIMINGS:
+        return
+    total = sum(seconds for _, seconds, _ in STAGE_TIMINGS)
+    lines = [f"  {name:<28} {seconds:>8.2f}s {rows:>8} rows" for name, seconds, rows in STAGE_TIMINGS]
+    logger.info("Seeding timing report:\n" + "\n".join(lines) + f"\n  {'total':<28} {total:>8.2f}s")
+
+def load_seed_file(filename: str) -> list:
+    with open(os.path.join(SEED_DATA_DIR, filename), encoding="utf-8") as f:
+        return json.load(f)
+
+def _table_rows(model, rows: List[dict]) -> List[dict]:
+    """Keeps only keys that are real columns of the model's table."""
+    columns = set(model.__table__.columns.keys())
+    unknown = {key for row in rows for key in row} - columns
+    if unknown:
+        logger.warning(f"Ignoring unknown {model.__tablename__} fields in seed data: {sorted(unknown)}")
+    return [{key: value for key, value in row.items() if key in columns} for row in rows]
+
+def _group_by_keys(rows: List[dict]) -> Dict[Tuple[str, ...], List[dict]]:
+    # executemany needs every row in a batch to have the same keys; grouping avoids
+    # padding missing keys with NULL, which would override column defaults.
+    groups: Dict[Tuple[str, ...], List[dict]] = defaultdict(list)
+    for row in rows:
+        groups[tuple(sorted(row))].append(row)
+    return groups
+
+# Columns seeded on insert but owned by the application afterwards (counters, aggregates, timestamps).
+# They are never overwritten by a reseed and are ignored when diffing.
+INSERT_ONLY_COLUMNS = {"created_at", "updated_at", "students_count", "rating"}
+
+def bulk_upsert(session: SQLAlchemySession, model, rows: List[dict], conflict_columns=("id",)) -> int:
+    """INSERT ... ON CONFLICT DO UPDATE for all rows. Only columns present in the seed data are updated."""
+    rows = _table_rows(model, rows)
+    for keys, group in _group_by_keys(rows).items():
+        stmt = pg_insert(model.__table__)
+        update_columns = {
+            key: stmt.excluded[key] for key in keys
+            if key not in conflict_columns and key not in INSERT_ONLY_COLUMNS
+        }
+        if update_columns:
+            stmt = stmt.on_conflict_do_update(index_elements=list(conflict_columns), set_=update_columns)
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=list(conflict_columns))
+        session.execute(stmt, group)
+    return len(rows)
+
+def bulk_insert(session: SQLAlchemySession, model, rows: List[dict]) -> int:
+    rows = _table_rows(model, rows)
+    for group in _group_by_keys(rows).values():
+        session.execute(model.__table__.insert(), group)
+    return len(rows)
+
+def sync_id_sequence(session: SQLAlchemySession, model):
+    """Moves the table's id sequence past the explicit ids written by the seeder."""
+    table_name = model.__tablename__
+    session.execute(text(
+        f"SELECT setval(pg_get_serial_sequence('{table_name}', 'id'), "
+        f"COALESCE((SELECT MAX(id) FROM {table_name}), 0) + 1, false)"
+    ))
+
+def existing_ids(session: SQLAlchemySession, model) -> Set[int]:
+    return set(session.execute(select(model.id)).scalars().all())
+
+def filter_valid_references(rows: List[dict], references: Dict[str, Set[int]], label: str) -> List[dict]:
+    """Drops rows whose non-null foreign keys point at ids missing from the preloaded id sets."""
+    valid_rows = []
+    for row in rows:
+        missing = [
+            f"{column}={row[column]}" for column, valid_ids in references.items()
+            if row.get(column) is not None and row[column] not in valid_ids
+        ]
+        if missing:
+            logger.warning(f"Skipping {label} {row.get('id', row.get('title'))}: unknown {', '.join(missing)}.")
+            continue
+        valid_rows.append(row)
+    return valid_rows
+
+def _hash_password(password: str) -> str:
+    # Module-level so it can be pickled into the process pool
+    return CryptContext(schemes=["bcrypt"], deprecated="auto").hash(password)
+
+def hash_passwords(passwords: List[str]) -> List[str]:
+    """bcrypt is CPU bound and deliberately slow, so spread it across processes."""
+    if len(passwords) <= 1:
+        return [_hash_password(p) for p in passwords]
+    workers = min(len(passwords), os.cpu_count() or 1)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(_hash_password, passwords))
+    except (OSError, BrokenProcessPool) as e:
+        logger.warning(f"Process pool unavailable ({e}); hashing passwords sequentially.")
+        return [_hash_password(p) for p in passwords]
+
+# --- Diff-based content sync ---
+class SeedDiff:
+    """What a content sync changed for one table, by id."""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.inserted: List[int] = []
+        self.updated: List[int] = []
+        self.deactivated: List[int] = []
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.inserted or self.updated or self.deactivated)
+
+    def summary(self) -> str:
+        parts = [
+            f"{name}={ids}" for name, ids in (
+                ("inserted", self.inserted), ("updated", self.updated),
+                ("deactivated", self.deactivated),
+            ) if ids
+        ]
+        return f"{self.label}: " + (", ".join(parts) if parts else "no changes")
+
+def _normalize_value(column, value):
+    # Make JSON values and DB values hash the same way (e.g. 4 vs 4.0 for Float columns)
+    if value is None:
+        return None
+    if isinstance(column.type, Float):
+        return float(value)
+    if isinstance(column.type, Integer) and not isinstance(value, bool):
+        return int(value)
+    return value
+
+def record_hash(model, values: dict) -> str:
+    columns = model.__table__.columns
+    normalized = {key: _normalize_value(columns[key], value) for key, value in values.items()}
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True, default=str).encode()).hexdigest()
+
+def sync_seed_records(session: SQLAlchemySession, model, records: List[dict], label: str) -> SeedDiff:
+    """
+    Applies only the differences between the seed records and the table:
+    new ids are inserted, rows whose content hash differs are updated, and rows missing from
+    the seed are soft-deleted (is_active=False), so submissions and progress that point at
+    them stay valid. User progress is never touched.
+    """
+    diff = SeedDiff(label)
+    table = model.__table__
+    records = _table_rows(model, [r for r in records if r.get("id") is not None])
+    for record in records:
+        record.setdefault("is_active", True)  # Reappearing records are reactivated
+
+    db_rows = {row.id: row._mapping for row in session.execute(select(table))}
+    inserts, updates = [], []
+    for record in records:
+        current = db_rows.get(record["id"])
+        if current is None:
+            inserts.append(record)
+            continue
+        compared = {key: value for key, value in record.items() if key not in INSERT_ONLY_COLUMNS}
+        if record_hash(model, compared) != record_hash(model, {key: current[key] for key in compared}):
+            updates.append(compared)
+
+    bulk_upsert(session, model, inserts + updates)
+    diff.inserted = sorted(r["id"] for r in inserts)
+    diff.updated = sorted(r["id"] for r in updates)
+
+    removed_ids = set(db_rows) - {record["id"] for record in records}
+    diff.deactivated = sorted(i for i in removed_ids if db_rows[i]["is_active"] is not False)
+    if diff.deactivated:
+        session.execute(update(table).where(table.c.id.in_(diff.deactivated)).values(is_active=False))
+
+    if diff.inserted:
+        sync_id_sequence(session, model)
+    logger.info(diff.summary())
+    return diff
+
+def seed_courses(session: SQLAlchemySession) -> SeedDiff:
+    with timed_stage("courses") as stats:
+        diff = sync_seed_records(session, Course, load_seed_file("seed_courses.json"), "courses")
         session.commit()
-    logger.info("Courses seeded.")
-
-def seed_modules(session: SQLAlchemySession):
-    logger.info("Seeding modules...")
-    with open(os.path.join(os.path.dirname(__file__), "seed_data/seed_modules.json"), encoding="utf-8") as f:
-        modules_data = json.load(f)
-        for module_item_data in modules_data:
-            if not session.query(Module).filter_by(id=module_item_data["id"]).first():
-                session.add(Module(**module_item_data))
+        stats["rows"] = len(diff.inserted) + len(diff.updated)
+    return diff
+
+def seed_modules(session: SQLAlchemySession) -> SeedDiff:
+    with timed_stage("modules") as stats:
+        modules_data = filter_valid_references(
+            load_seed_file("seed_modules.json"),
+            {"course_id": existing_ids(session, Course)},
+            "module",
+        )
+        diff = sync_seed_records(session, Module, modules_data, "modules")
         session.commit()
-    logger.info("Modules seeded.")
-
-def seed_lessons(session: SQLAlchemySession):
-    logger.info("Seeding lessons...")
-    with open(os.path.join(os.path.dirname(__file__), "seed_data/seed_lessons.json"), encoding="utf-8") as f:
-        lessons_data = json.load(f)
-        for lesson_item_data in lessons_data:
-            if not session.query(Lesson).filter_by(id=lesson_item_data["id"]).first():
-                session.add(Lesson(**lesson_item_data))
+        stats["rows"] = len(diff.inserted) + len(diff.updated)
+    return diff
+
+def seed_lessons(session: SQLAlchemySession) -> SeedDiff:
+    with timed_stage("lessons") as stats:
+        lessons_data = filter_valid_references(
+            load_seed_file("seed_lessons.json"),
+            {"module_id": existing_ids(session, Module)},
+            "lesson",
+        )
+        diff = sync_seed_records(session, Lesson, lessons_data, "lessons")
         session.commit()
-    logger.info("Lessons seeded.")
-
-def seed_exercises(session: SQLAlchemySession):
-    logger.info("Seeding exercises...")
-    with open(os.path.join(os.path.dirname(__file__), "seed_data/seed_exercises.json"), encoding="utf-8") as f:
-        exercises_data = json.load(f)
-        for exercise_item_data in exercises_data:
-            exercise_id = exercise_item_data.get("id")
-            exists = session.query(Exercise).filter_by(id=exercise_id).first() if exercise_id is not None else None
-
-            if "module_id" in exercise_item_data and exercise_item_data["module_id"] is not None:
-                if not session.query(Module).filter_by(id=exercise_item_data["module_id"]).first():
-                    logger.warning(f"Module with id {exercise_item_data['module_id']} not found for exercise {exercise_item_data.get('title', exercise_id)}. Skipping.")
-                    continue
-            if "lesson_id" in exercise_item_data and exercise_item_data["lesson_id"] is not None:
-                if not session.query(Lesson).filter_by(id=exercise_item_data["lesson_id"]).first():
-                    logger.warning(f"Lesson with id {exercise_item_data['lesson_id']} not found for exercise {exercise_item_data.get('title', exercise_id)}. Skipping.")
-                    continue
-            if "course_id" in exercise_item_data and exercise_item_data["course_id"] is not None: # Check for course_id if exercise is linked directly
-                if not session.query(Course).filter_by(id=exercise_item_data["course_id"]).first():
-                    logger.warning(f"Course with id {exercise_item_data['course_id']} not found for exercise {exercise_item_data.get('title', exercise_id)}. Skipping.")
-                    continue
-            if not exists:
-                session.add(Exercise(**exercise_item_data))
+        stats["rows"] = len(diff.inserted) + len(diff.updated)
+    return diff
+
+def seed_exercises(session: SQLAlchemySession) -> SeedDiff:
+    with timed_stage("exercises") as stats:
+        exercises_data = filter_valid_references(
+            load_seed_file("seed_exercises.json"),
+            {
+                "module_id": existing_ids(session, Module),
+                "lesson_id": existing_ids(session, Lesson),
+                "course_id": existing_ids(session, Course),
+            },
+            "exercise",
+        )
+        without_ids = [row for row in exercises_data if row.get("id") is None]
+        if without_ids:
+            logger.warning(f"Skipping {len(without_ids)} exercise(s) without an id; they cannot be diffed.")
+        diff = sync_seed_records(session, Exercise, exercises_data, "exercises")
         session.commit()
-    logger.info("Exercises seeded.")
+        stats["rows"] = len(diff.inserted) + len(diff.updated)
+    return diff
+
+def sync_content(session: SQLAlchemySession) -> List[SeedDiff]:
+    """Brings content tables in line with the seed JSON files, parents first."""
+    diffs = [seed_courses(session), seed_modules(session), seed_lessons(session)]
+    seed_course_exams(session)
+    diffs.append(seed_exercises(session))
+    changed = [d for d in diffs if d.changed]
+    if changed:
+        logger.info("Content changes applied:\n" + "\n".join(f"  {d.summary()}" for d in changed))
+    else:
+        logger.info("Content already matches the seed files. No changes applied.")
+    return diffs
 
 def seed_users(session: SQLAlchemySession):
     logger.info("Seeding users...")
@@ -358,58 +563,51 @@ def reset_postgres_sequences(session):
     logger.info("PostgreSQL sequences reset to 1.")
 
 def seed_course_exams(session: SQLAlchemySession):
-    logger.info("Seeding course exams from exam exercises...")
     exercises_path = os.path.join(SEED_DATA_DIR, "seed_exercises.json")
     if not os.path.exists(exercises_path):
         logger.warning("seed_exercises.json not found, skipping course exam seeding.")
         return
 
-    with open(exercises_path, encoding="utf-8") as f:
-        exercises_data = json.load(f)
-        # Filter only exam exercises
+    with timed_stage("course_exams") as stats:
+        # Only exam exercises (course-level, no module/lesson) become CourseExams
         exam_exercises = [
-            ex for ex in exercises_data
+            ex for ex in load_seed_file("seed_exercises.json")
             if ex.get("course_id") is not None
             and ex.get("module_id") is None
             and ex.get("lesson_id") is None
             and ex.get("validation_type") == "exam"
         ]
-        # Sort by order_index
         exam_exercises.sort(key=lambda ex: ex.get("order_index", 0))
 
+        course_ids = existing_ids(session, Course)
+        existing_exams = set(session.execute(select(CourseExam.course_id, CourseExam.title)).all())
+        new_exams = []
         for exercise in exam_exercises:
             course_id = exercise["course_id"]
             title = exercise.get("title", f"Examen Final {exercise.get('id')}")
-            order_index = exercise.get("order_index", 1)
-
-            course_exists = session.query(Course).filter_by(id=course_id).first()
-            if not course_exists:
+            if course_id not in course_ids:
                 logger.warning(f"Course with id {course_id} not found for exam '{title}'. Skipping CourseExam creation.")
                 continue
-
-            existing = session.query(CourseExam).filter_by(
-                course_id=course_id,
-                title=title
-            ).first()
-
-            if not existing:
-                course_exam = CourseExam(
-                    course_id=course_id,
-                    title=title,
-                    description=exercise.get("description", ""),
-                    order_index=order_index,  # <-- THIS LINE seeds order_index
-                    pass_threshold_percentage=70.0
-                )
-                session.add(course_exam)
-                logger.info(f"Staged CourseExam '{title}' for course {course_id} with order_index {order_index}.")
-    session.commit()
-    logger.info("Course exams seeded.")
+            if (course_id, title) in existing_exams:
+                continue
+            existing_exams.add((course_id, title))
+            new_exams.append({
+                "course_id": course_id,
+                "title": title,
+                "description": exercise.get("description", ""),
+                "order_index": exercise.get("order_index", 1),
+                "pass_threshold_percentage": 70.0,
+            })
+        stats["rows"] = bulk_insert(session, CourseExam, new_exams)
+        session.commit()
 
 # --- START: ADD NEW FUNCTION TO SEED TEST USERS AND THEIR PROGRESS ---
 def seed_users_and_progress(session: SQLAlchemySession):
     """
     Seeds users and their detailed progress from seed_users.json.
     This function is destructive and will delete existing data for the users defined in the JSON file.
+    All users are replaced in a single transaction; progress rows that reference unknown
+    content are skipped instead of failing the whole batch.
     """
     logger.info("Starting to seed test users and their progress...")
     users_seed_path = os.path.join(SEED_DATA_DIR, "seed_users.json")
@@ -418,67 +616,63 @@ def seed_users_and_progress(session: SQLAlchemySession):
         logger.warning(f"{users_seed_path} not found. Skipping test user seeding.")
         return
 
-    with open(users_seed_path, 'r', encoding='utf-8') as f:
-        users_data = json.load(f)
-
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-    for user_profile in users_data:
-        user_info = user_profile.get("user_info", {})
-        user_id = user_info.get("id")
-
-        if not user_id:
-            logger.warning("Skipping user profile with no ID.")
-            continue
-
-        logger.info(f"Processing user ID: {user_id} ({user_info.get('username')})")
+    users_data = load_seed_file("seed_users.json")
+    profiles = [p for p in users_data if p.get("user_info", {}).get("id")]
+    if len(profiles) != len(users_data):
+        logger.warning(f"Skipping {len(users_data) - len(profiles)} user profile(s) with no ID.")
+    if not profiles:
+        return
+    user_ids = [p["user_info"]["id"] for p in profiles]
 
-        # --- Clear existing data for this specific user to ensure a clean slate ---
-        session.query(UserExerciseSubmission).filter_by(user_id=user_id).delete(synchronize_session=False)
-        session.query(UserLessonProgress).filter_by(user_id=user_id).delete(synchronize_session=False)
-        session.query(UserModuleProgress).filter_by(user_id=user_id).delete(synchronize_session=False)
-        session.query(UserCourseEnrollment).filter_by(user_id=user_id).delete(synchronize_session=False)
-        session.query(User).filter_by(id=user_id).delete(synchronize_session=False)
+    with timed_stage("users: hash passwords") as stats:
+        hashed_passwords = hash_passwords([p["user_info"].get("password", "default_password") for p in profiles])
+        stats["rows"] = len(hashed_passwords)
 
-        # --- FIX: Commit the deletes to finalize them before adding new data ---
-        session.commit()
-
-        # --- Seed new user data in a new transaction block ---
-        try:
-            hashed_password = pwd_context.hash(user_info.get("password", "default_password"))
-            new_user = User(
-                id=user_id,
-                username=user_info.get("username"),
-                email=user_info.get("email"),
-                hashed_password=hashed_password,
-                first_name=user_info.get("first_name"),
-                last_name=user_info.get("last_name"),
-                is_active=True
+    try:
+        with timed_stage("users: clear existing") as stats:
+            for model in (UserExerciseSubmission, UserLessonProgress, UserModuleProgress, UserCourseEnrollment, User):
+                column = model.id if model is User else model.user_id
+                stats["rows"] += session.query(model).filter(column.in_(user_ids)).delete(synchronize_session=False)
+
+        with timed_stage("users: insert") as stats:
+            users = []
+            for profile, hashed_password in zip(profiles, hashed_passwords):
+                user_info = profile["user_info"]
+                users.append({
+                    "id": user_info["id"],
+                    "username": user_info.get("username"),
+                    "email": user_info.get("email"),
+                    "hashed_password": hashed_password,
+                    "first_name": user_info.get("first_name"),
+                    "last_name": user_info.get("last_name"),
+                    "is_active": True,
+                })
+            stats["rows"] = bulk_insert(session, User, users)
+            sync_id_sequence(session, User)
+
+        with timed_stage("users: progress") as stats:
+            known = {
+                "course_id": existing_ids(session, Course),
+                "module_id": existing_ids(session, Module),
+                "lesson_id": existing_ids(session, Lesson),
+                "exercise_id": existing_ids(session, Exercise),
+            }
+            progress_sections = (
+                ("enrollments", UserCourseEnrollment),
+                ("module_progress", UserModuleProgress),
+                ("lesson_progress", UserLessonProgress),
+                ("exercise_submissions", UserExerciseSubmission),
             )
-            session.add(new_user)
-
-            # --- FIX: Flush the session to make the new user available in the DB transaction ---
-            # This ensures that the user record exists before any progress records are added.
-            session.flush()
-
-            for enrollment_data in user_profile.get("enrollments", []):
-                session.add(UserCourseEnrollment(**enrollment_data))
-
-            for module_progress_data in user_profile.get("module_progress", []):
-                session.add(UserModuleProgress(**module_progress_data))
+            for section, model in progress_sections:
+                rows = [row for profile in profiles for row in profile.get(section, [])]
+                rows = filter_valid_references(rows, known, section)
+                stats["rows"] += bulk_insert(session, model, rows)
 
-            for lesson_progress_data in user_profile.get("lesson_progress", []):
-                session.add(UserLessonProgress(**lesson_progress_data))
-
-            for submission_data in user_profile.get("exercise_submissions", []):
-                session.add(UserExerciseSubmission(**submission_data))
-
-            # --- Commit the entire transaction for this user ---
-            session.commit()
-            logger.info(f"Successfully seeded user {user_id} and their progress.")
-        except Exception as e:
-            logger.error(f"Failed to seed user {user_id}: {e}", exc_info=True)
-            session.rollback() # Rollback the transaction for this specific user on error
+        session.commit()
+        logger.info(f"Successfully seeded {len(users)} users and their progress.")
+    except Exception as e:
+        logger.error(f"Failed to seed test users: {e}", exc_info=True)
+        session.rollback()
 
     logger.info("Test user seeding process complete.")
 # --- END: ADD NEW FUNCTION ---
@@ -497,69 +691,23 @@ if __name__ == "__main__":
 
         current_seed_files_hashes = get_current_seed_file_hashes()
         last_seed_files_hashes = load_last_seed_file_hashes()
-        logger.info(f"Current seed file hashes: {current_seed_files_hashes}")
-        logger.info(f"Last seed file hashes: {last_seed_files_hashes}")
-
-        reseed_level = None # Will store the highest level that needs reseeding ("courses", "modules", etc.)
+        changed_files = [key for key, value in current_seed_files_hashes.items() if value != last_seed_files_hashes.get(key)]
+        logger.info(f"Seed files changed since last run: {changed_files or 'none'}")
 
         if current_migration_hash != last_seeded_migration_hash:
-            logger.warning("Migration change detected. Full reseed required.")
-            reseed_level = "courses" # Highest level, triggers full clear and reseed
+            # Schema changes are applied by alembic; the diff below adapts the content to them.
+            logger.info("Migration change detected since last seed.")
             set_last_seeded_migration_hash(current_migration_hash)
-        else:
-            # Check seed file changes in hierarchical order
-            if current_seed_files_hashes.get("courses") != last_seed_files_hashes.get("courses"):
-                logger.info("Change detected in seed_courses.json.")
-                reseed_level = "courses"
-            elif current_seed_files_hashes.get("modules") != last_seed_files_hashes.get("modules"):
-                logger.info("Change detected in seed_modules.json.")
-                reseed_level = "modules"
-            elif current_seed_files_hashes.get("lessons") != last_seed_files_hashes.get("lessons"):
-                logger.info("Change detected in seed_lessons.json.")
-                reseed_level = "lessons"
-            elif current_seed_files_hashes.get("exercises") != last_seed_files_hashes.get("exercises"):
-                logger.info("Change detected in seed_exercises.json.")
-                reseed_level = "exercises"
-
-        if reseed_level:
-            logger.warning(f"Reseeding data from level '{reseed_level}' due to changes.")
-            clear_data_from_level(session, reseed_level)
-            reset_sequences_for_level(session, reseed_level)
-
-            # --- START: CORRECTED RESEEDING LOGIC ---
-            if reseed_level == "courses":
-                logger.info("Executing full reseed: courses -> modules -> lessons -> exams -> exercises")
-                seed_courses(session)
-                seed_modules(session)
-                seed_lessons(session)
-                seed_course_exams(session)
-                seed_exercises(session)
-            elif reseed_level == "modules":
-                logger.info("Executing partial reseed: modules -> lessons -> exams -> exercises")
-                seed_modules(session)
-                seed_lessons(session)
-                seed_course_exams(session)
-                seed_exercises(session)
-            elif reseed_level == "lessons":
-                logger.info("Executing partial reseed: lessons -> exams -> exercises")
-                seed_lessons(session)
-                seed_course_exams(session)
-                seed_exercises(session)
-            elif reseed_level == "exercises":
-                logger.info("Executing partial reseed: exercises only")
-                seed_exercises(session)
-                seed_course_exams(session)
-            # --- END: CORRECTED RESEEDING LOGIC ---
-
-            save_seed_file_hashes(current_seed_files_hashes)
-            logger.info(f"Reseeding from level '{reseed_level}' complete.")
-        else:
-            logger.info("No migration or seed file changes detected that require a targeted reseed. Running idempotent seeders for consistency.")
-            seed_courses(session)
-            seed_modules(session)
-            seed_lessons(session)
-            seed_course_exams(session)       # <-- ADD THIS LINE
-            seed_exercises(session)
+
+        # Destructive reset (wipes user progress) is only done on explicit request.
+        full_reset = os.getenv("SEED_FULL_RESET", "false").lower() == "true"
+        if full_reset:
+            logger.warning("SEED_FULL_RESET is true. Clearing all content and user progress before seeding.")
+            clear_data_from_level(session, "courses")
+            reset_sequences_for_level(session, "courses")
+
+        content_changed = any(diff.changed for diff in sync_content(session)) or full_reset
+        save_seed_file_hashes(current_seed_files_hashes)
 
         # --- START: ADD LOGIC TO RUN THE NEW USER SEEDER BASED ON ENV VAR ---
         if os.getenv("SEED_TEST_USERS", "false").lower() == "true":
@@ -571,10 +719,17 @@ if __name__ == "__main__":
             seed_users(session)
         # --- END: ADD LOGIC TO RUN THE NEW USER SEEDER ---
 
+        if content_changed and bump_content_version is not None:
+            new_version = bump_content_version()
+            logger.info(f"Content cache version bumped to {new_version}.")
+        elif content_changed:
+            logger.warning("Content cache module not available. Cached content was not invalidated.")
+
     except Exception as e:
         logger.error(f"CRITICAL ERROR during seeding process: {e}", exc_info=True)
         session.rollback()
         logger.error("Seeding process failed and transaction was rolled back.")
     finally:
         session.close()
+        log_timing_report()
         logger.info("Database session closed.")
@@ -1,15 +1,247 @@
-from fastapi import Depends, HTTPException, status
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Set, Tuple
+
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from sqlalchemy.orm import Session
 
-from utils import SECRET_KEY, ALGORITHM, redis_client
-from services import get_user_by_username
+from utils import SECRET_KEY, ALGORITHM, redis_client, access_token_key, bump_token_generation, forget_token_generation
+from services import get_user, get_user_by_username
 from database import get_db
+from models import User
+from schemas import UserResponse
+from shared.internal_auth import InternalAuthError, verify_internal_request
+
+logger = logging.getLogger(__name__)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/users/token")
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="/api/v1/users/token", auto_error=False)
+
+# --- Validated token cache ---
+# Validated tokens are cached in-process as (token hash -> user snapshot) for a short TTL,
+# so most authenticated requests skip both the Redis token lookup and the user query.
+# Logout, refresh and credential changes publish the username on AUTH_REVOCATION_CHANNEL;
+# every worker drops that user's entries when the message arrives. If the subscriber is
+# not connected the cache is bypassed, so a revoked token is never served from cache.
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", 30))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", 10000))
+AUTH_REVOCATION_CHANNEL = "auth:revocations"
+REVOKE_ALL_MESSAGE = "*"  # Published after the token generation is bumped
+
+
+class TokenCache:
+    def __init__(self, ttl_seconds: float = AUTH_CACHE_TTL_SECONDS, max_entries: int = AUTH_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, UserResponse]]" = OrderedDict()
+        self._by_username: Dict[str, Set[str]] = {}
+        self._revoked_at: Dict[str, float] = {}  # username -> last revocation time
+        self._lock = threading.Lock()
+        self.subscribed = False  # Set by the revocation listener once it is connected
+
+    @staticmethod
+    def token_key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> Optional[UserResponse]:
+        if not self.subscribed:
+            return None
+        key = self.token_key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if expires_at < time.time():
+                self._remove(key, user.username)
+                return None
+            self._entries.move_to_end(key)
+            return user
+
+    def put(self, token: str, user: UserResponse, token_exp: Optional[float], validated_at: float) -> None:
+        if not self.subscribed:
+            return
+        expires_at = time.time() + self.ttl_seconds
+        if token_exp is not None:
+            expires_at = min(expires_at, token_exp)
+        key = self.token_key(token)
+        with self._lock:
+            # A revocation that arrived while this token was being validated wins
+            if self._revoked_at.get(user.username, 0.0) >= validated_at:
+                return
+            self._entries[key] = (expires_at, user)
+            self._entries.move_to_end(key)
+            self._by_username.setdefault(user.username, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                old_key, (_, old_user) = self._entries.popitem(last=False)
+                self._discard_index(old_key, old_user.username)
+
+    def invalidate_user(self, username: str) -> None:
+        now = time.time()
+        with self._lock:
+            for key in self._by_username.pop(username, set()):
+                self._entries.pop(key, None)
+            self._revoked_at[username] = now
+            # Only revocations newer than an in-flight validation matter
+            for name in [n for n, at in self._revoked_at.items() if at < now - self.ttl_seconds]:
+                del self._revoked_at[name]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_username.clear()
+
+    def _remove(self, key: str, username: str) -> None:
+        self._entries.pop(key, None)
+        self._discard_index(key, username)
+
+    def _discard_index(self, key: str, username: str) -> None:
+        keys = self._by_username.get(username)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_username[username]
+
+
+token_cache = TokenCache()
+
+
+def _listen_for_revocations() -> None:
+    """Background thread: applies revocations published by any user-service worker."""
+    while True:
+        pubsub = None
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(AUTH_REVOCATION_CHANNEL)
+            # Anything cached before (re)subscribing may have missed a revocation
+            token_cache.clear()
+            token_cache.subscribed = True
+            while True:
+                # Polling with a short timeout instead of listen(): a blocking read would
+                # hit the pool's socket_timeout on a quiet channel and drop the subscription.
+                message = pubsub.get_message(timeout=1.0)
+                if message is None or message.get("type") != "message":
+                    continue
+                if message["data"] == REVOKE_ALL_MESSAGE:
+                    forget_token_generation()
+                    token_cache.clear()
+                else:
+                    token_cache.invalidate_user(message["data"])
+        except Exception as e:
+            logger.warning(f"Auth revocation listener disconnected: {e}. Token cache disabled until it reconnects.")
+        finally:
+            token_cache.subscribed = False
+            token_cache.clear()
+            if pubsub is not None:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+        time.sleep(5)
+
+
+def start_revocation_listener() -> None:
+    if not hasattr(redis_client, "pubsub"):
+        # In-memory MockRedis: single process, revocations are applied locally
+        token_cache.subscribed = True
+        return
+    threading.Thread(target=_listen_for_revocations, name="auth-revocations", daemon=True).start()
+
+
+def revoke_user_tokens(username: str) -> None:
+    """Drops cached tokens for `username` in this worker and tells every other worker to do the same."""
+    token_cache.invalidate_user(username)
+    try:
+        if hasattr(redis_client, "publish"):
+            redis_client.publish(AUTH_REVOCATION_CHANNEL, username)
+    except Exception as e:
+        logger.error(f"Could not publish token revocation for {username}: {e}")
+
+
+def revoke_all_tokens() -> None:
+    """Logs every user out by moving to a new token generation."""
+    generation = bump_token_generation()
+    token_cache.clear()
+    try:
+        if hasattr(redis_client, "publish"):
+            redis_client.publish(AUTH_REVOCATION_CHANNEL, REVOKE_ALL_MESSAGE)
+    except Exception as e:
+        logger.error(f"Could not publish token generation bump: {e}")
+    logger.info(f"All tokens revoked; token generation is now {generation}")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+
+# --- Login rate limiting ---
+# Failed logins are counted per username in fixed Redis windows. Once a username reaches
+# LOGIN_MAX_FAILED_ATTEMPTS in the current window, further attempts are rejected before any
+# bcrypt work is done, until the window rolls over.
+LOGIN_MAX_FAILED_ATTEMPTS = int(os.getenv("LOGIN_MAX_FAILED_ATTEMPTS", 5))
+LOGIN_WINDOW_SECONDS = int(os.getenv("LOGIN_WINDOW_SECONDS", 300))
+
+
+class LoginRateLimiter:
+    def __init__(self, max_failures: int = LOGIN_MAX_FAILED_ATTEMPTS, window_seconds: int = LOGIN_WINDOW_SECONDS):
+        self.max_failures = max_failures
+        self.window_seconds = window_seconds
+
+    def _window(self) -> Tuple[str, int]:
+        """(window id, seconds until the window ends)"""
+        now = int(time.time())
+        window = now // self.window_seconds
+        return str(window), (window + 1) * self.window_seconds - now
+
+    def _key(self, username: str, window: str) -> str:
+        return f"login_failures:{username}:{window}"
+
+    def retry_after(self, username: str) -> int:
+        """Seconds the caller must wait before trying again, 0 if allowed."""
+        window, remaining = self._window()
+        try:
+            failures = redis_client.get(self._key(username, window))
+        except Exception as e:
+            logger.warning(f"Login rate limiter unavailable, allowing attempt for {username}: {e}")
+            return 0
+        if failures is not None and int(failures) >= self.max_failures:
+            return max(remaining, 1)
+        return 0
+
+    def record_failure(self, username: str) -> None:
+        window, _ = self._window()
+        key = self._key(username, window)
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.incr(key)
+            pipe.expire(key, self.window_seconds)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Could not record failed login for {username}: {e}")
+
+    def reset(self, username: str) -> None:
+        window, _ = self._window()
+        try:
+            redis_client.delete(self._key(username, window))
+        except Exception as e:
+            logger.warning(f"Could not reset failed logins for {username}: {e}")
+
+
+login_rate_limiter = LoginRateLimiter()
+
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> UserResponse:
+    """
+    Returns a read-only snapshot of the authenticated user. Use get_current_db_user
+    when the route needs to modify the user row.
+    """
+    cached_user = token_cache.get(token)
+    if cached_user is not None:
+        return cached_user
+
+    validated_at = time.time()
     credentials_exc = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -24,11 +256,62 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         raise credentials_exc
 
     # Verify token is in Redis (not revoked)
-    stored_token = redis_client.get(f"token:{username}")
+    stored_token = redis_client.get(access_token_key(username))
     if stored_token is None or stored_token != token:
         raise credentials_exc
 
     user = get_user_by_username(db, username)
     if user is None:
         raise credentials_exc
+
+    user_snapshot = UserResponse.model_validate(user)
+    token_cache.put(token, user_snapshot, payload.get("exp"), validated_at)
+    return user_snapshot
+
+
+def get_current_db_user(
+    current_user: UserResponse = Depends(get_current_user),
+    db: Session = Depends(get_db),
+) -> User:
+    """The authenticated user as a session-bound ORM object, for routes that update the user."""
+    user = get_user(db, current_user.id)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
+
+
+# --- Service-to-service callers ---
+class InternalPrincipal(NamedTuple):
+    """A user_id asserted by another service through a signed internal request."""
+    id: int
+    service: str
+
+
+def get_current_user_or_internal(
+    request: Request,
+    token: Optional[str] = Depends(oauth2_scheme_optional),
+    db: Session = Depends(get_db),
+):
+    """
+    For internal endpoints: accepts a signed internal request (see shared/internal_auth.py)
+    without any user lookup, otherwise falls back to the full bearer-token check.
+    """
+    try:
+        user_id = verify_internal_request(request.headers, request.method, request.url.path)
+    except InternalAuthError as e:
+        logger.warning(f"Rejected internal request to {request.url.path}: {e}")
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid internal credentials")
+    if user_id is not None:
+        return InternalPrincipal(id=user_id, service=request.headers.get("X-Internal-Service", ""))
+
+    if token is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return get_current_user(token, db)
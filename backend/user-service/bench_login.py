@@ -0,0 +1,65 @@
+"""
+Benchmark for password verification under concurrent logins.
+
+Simulates a burst of logins (e.g. the start of a class) hitting the threadpool that
+FastAPI uses for sync routes, and compares verifying bcrypt inline in those threads
+(the old path) with the dedicated PasswordHasher process pool.
+
+Usage (inside the user-service container):
+    python bench_login.py [--logins 200] [--concurrency 40]
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from passwords import BCRYPT_ROUNDS, PasswordHasher, pwd_context
+
+PASSWORD = "benchmark-password"
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_burst(label: str, verify, hashed_password: str, logins: int, concurrency: int) -> list:
+    def one_login(_):
+        start = time.perf_counter()
+        assert verify(PASSWORD, hashed_password)
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        timings = list(pool.map(one_login, range(logins)))
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label:<10} p50={statistics.median(timings):8.1f} ms  "
+        f"p99={percentile(timings, 99):8.1f} ms  max={max(timings):8.1f} ms  "
+        f"throughput={logins / elapsed:6.1f} logins/s"
+    )
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark login password verification under load")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=40, help="Concurrent request threads (FastAPI default is 40)")
+    args = parser.parse_args()
+
+    hashed_password = pwd_context.hash(PASSWORD)
+    print(f"{args.logins} logins, {args.concurrency} concurrent, bcrypt cost {BCRYPT_ROUNDS}\n")
+
+    before = run_burst("inline", pwd_context.verify, hashed_password, args.logins, args.concurrency)
+
+    hasher = PasswordHasher(max_pending=args.logins)
+    hasher.warm_up()
+    hasher.verify(PASSWORD, hashed_password)  # Make sure every worker has started
+    after = run_burst("pool", hasher.verify, hashed_password, args.logins, args.concurrency)
+
+    print(f"\np99 improvement: {percentile(before, 99) / percentile(after, 99):.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Benchmark for progress report rendering.
+
+Compares the old per-request path (template looked up on every call, CSS parsed from an
+inline <style> block and fonts discovered for each PDF) with a warmed ReportRenderer.
+
+Usage (inside the user-service container):
+    python bench_report_render.py [--iterations 20] [--courses 3]
+"""
+import argparse
+import io
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from reports import REPORT_STYLESHEET, REPORT_TEMPLATE, TEMPLATES_PATH, ReportRenderer
+
+
+def build_sample_report(courses: int = 3, modules: int = 4, lessons: int = 3, exercises: int = 2) -> dict:
+    now = datetime.utcnow()
+    return {
+        "user_id": 1,
+        "username": "benchmark_user",
+        "email": "benchmark@pycher.com",
+        "first_name": "Bench",
+        "last_name": "Mark",
+        "report_generated_at": now,
+        "courses": [
+            {
+                "title": f"Curso {c + 1}",
+                "enrollment_date": now - timedelta(days=30),
+                "is_completed": c == 0,
+                "progress_percentage": 100.0 if c == 0 else 45.5,
+                "modules": [
+                    {
+                        "title": f"Módulo {m + 1}",
+                        "is_completed": m < 2,
+                        "started_at": now - timedelta(days=20),
+                        "completed_at": now - timedelta(days=10) if m < 2 else None,
+                        "lessons": [
+                            {
+                                "title": f"Lección {l + 1}",
+                                "is_completed": l < 2,
+                                "started_at": now - timedelta(days=15),
+                                "completed_at": now - timedelta(days=12) if l < 2 else None,
+                                "exercises": [
+                                    {
+                                        "title": f"Ejercicio {e + 1}",
+                                        "is_correct": e % 2 == 0,
+                                        "attempts": e + 1,
+                                        "score": None,
+                                        "submitted_at": now - timedelta(days=11),
+                                    }
+                                    for e in range(exercises)
+                                ],
+                            }
+                            for l in range(lessons)
+                        ],
+                    }
+                    for m in range(modules)
+                ],
+                "exams": [{"title": "Examen Final", "score": None, "passed": True, "completed_at": now}],
+            }
+            for c in range(courses)
+        ],
+    }
+
+
+def render_per_request(report_data: dict) -> bytes:
+    """The previous behaviour: nothing is reused between reports."""
+    from weasyprint import HTML
+
+    env = Environment(loader=FileSystemLoader(TEMPLATES_PATH), autoescape=select_autoescape(['html', 'xml']))
+    html_content = env.get_template(REPORT_TEMPLATE).render(report_data=report_data)
+    with open(os.path.join(TEMPLATES_PATH, REPORT_STYLESHEET), encoding="utf-8") as f:
+        html_content = html_content.replace("</head>", f"<style>{f.read()}</style></head>", 1)
+    buffer = io.BytesIO()
+    HTML(string=html_content).write_pdf(buffer)
+    return buffer.getvalue()
+
+
+def render_warm(renderer: ReportRenderer, report_data: dict) -> bytes:
+    buffer = io.BytesIO()
+    renderer.render_pdf(report_data, buffer)
+    return buffer.getvalue()
+
+
+def time_runs(label: str, fn, iterations: int) -> list:
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    print(
+        f"{label:<14} mean={statistics.mean(timings):8.1f} ms  "
+        f"median={statistics.median(timings):8.1f} ms  "
+        f"min={min(timings):8.1f} ms  max={max(timings):8.1f} ms"
+    )
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark progress report PDF rendering")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--courses", type=int, default=3)
+    args = parser.parse_args()
+
+    report_data = build_sample_report(courses=args.courses)
+    print(f"Rendering {args.iterations} reports with {args.courses} course(s) each\n")
+
+    before = time_runs("per-request", lambda: render_per_request(report_data), args.iterations)
+
+    start = time.perf_counter()
+    renderer = ReportRenderer().warm()
+    print(f"{'warm-up':<14} {(time.perf_counter() - start) * 1000:8.1f} ms (once per worker)")
+    after = time_runs("warm renderer", lambda: render_warm(renderer, report_data), args.iterations)
+
+    print(f"\nSpeed-up (median): {statistics.median(before) / statistics.median(after):.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,12 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-import os
+from fastapi.responses import JSONResponse
 from routes import router as user_router
+from reports import report_jobs
+from passwords import password_hasher, PasswordHashingBusy
+from auth import start_revocation_listener, revoke_all_tokens
 from models import Base, engine
 
-from redis import Redis
-
-redis_host = os.getenv("REDIS_HOST", "localhost")
-redis_port = int(os.getenv("REDIS_PORT", 6379))
-redis_user = os.getenv("REDIS_USER")
-redis_password = os.getenv("REDIS_PASSWORD")
-
-redis_client = Redis(
-    host=redis_host,
-    port=redis_port,
-    username=redis_user,
-    password=redis_password,
-    db=0,
-    decode_responses=True
-)
-
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
@@ -27,12 +14,41 @@ app = FastAPI(title="Python Learning Platform - User Service")
 
 @app.on_event("startup")
 def clear_tokens_on_startup():
-    # Remove all access and refresh tokens on server restart
-    for key in redis_client.scan_iter("token:*"):
-        redis_client.delete(key)
-    for key in redis_client.scan_iter("refresh_token:*"):
-        redis_client.delete(key)
-    print("All tokens cleared on startup.")
+    # Invalidate all access and refresh tokens on server restart by moving to a new
+    # token generation; the old keys expire on their own TTL.
+    try:
+        revoke_all_tokens()
+        print("All tokens cleared on startup.")
+    except Exception as e:
+        print(f"⚠️  Could not clear tokens on startup: {e}")
+
+@app.on_event("startup")
+def start_auth_revocation_listener():
+    start_revocation_listener()
+
+@app.on_event("startup")
+def warm_password_hashers_on_startup():
+    try:
+        password_hasher.warm_up()
+    except Exception as e:
+        print(f"⚠️  Could not start password hashing workers: {e}")
+
+@app.exception_handler(PasswordHashingBusy)
+async def password_hashing_busy_handler(request: Request, exc: PasswordHashingBusy):
+    # Every hashing worker is busy and the queue is full; ask the client to retry shortly
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Servicio ocupado, intenta de nuevo en unos segundos"},
+        headers={"Retry-After": "1"},
+    )
+
+@app.on_event("startup")
+def warm_report_renderers_on_startup():
+    # Spawns the PDF render workers; each compiles the template and loads fonts once
+    try:
+        report_jobs.warm_up()
+    except Exception as e:
+        print(f"⚠️  Could not warm report renderers: {e}")
 
 app.add_middleware(
     CORSMiddleware,
@@ -0,0 +1,133 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+logger = logging.getLogger(__name__)
+
+# --- Password hashing settings ---
+# Changing BCRYPT_ROUNDS makes every stored hash with a different cost "need update";
+# it is rehashed transparently the next time that user logs in.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 64))
+PASSWORD_HASH_TIMEOUT_SECONDS = float(os.getenv("PASSWORD_HASH_TIMEOUT_SECONDS", 10))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+
+class PasswordHashingBusy(Exception):
+    """Raised when too many hash/verify jobs are already waiting for a worker, or the pool cannot answer in time."""
+
+
+# --- Worker process side (kept free of DB/Redis imports so spawn is cheap) ---
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+def _verify_and_update(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(password, hashed_password)
+
+def _worker_ready() -> int:
+    return os.getpid()
+
+
+# --- API process side ---
+class PasswordHasher:
+    """
+    Runs bcrypt on a dedicated process pool so a burst of logins does not serialize
+    request threads behind the GIL. At most PASSWORD_HASH_MAX_PENDING jobs may be queued
+    or running; beyond that callers get PasswordHashingBusy instead of waiting forever.
+    """
+
+    def __init__(self, max_workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self.max_workers = max_workers
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    try:
+                        # spawn: the API process has threads and DB connections that must not be forked
+                        self._executor = ProcessPoolExecutor(
+                            max_workers=self.max_workers,
+                            mp_context=multiprocessing.get_context("spawn"),
+                        )
+                    except (OSError, NotImplementedError) as e:
+                        logger.warning(f"Password hashing pool unavailable, hashing inline: {e}")
+                        return None
+        return self._executor
+
+    def warm_up(self) -> None:
+        """Starts every worker now so the first logins do not pay the process start-up."""
+        executor = self._get_executor()
+        if executor is not None:
+            for _ in range(self.max_workers):
+                executor.submit(_worker_ready)
+
+    def _reset_executor(self, broken: ProcessPoolExecutor) -> None:
+        """Drops a pool whose worker died so the next job starts a fresh one."""
+        with self._executor_lock:
+            if self._executor is broken:
+                self._executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHashingBusy()
+        executor, future = None, None
+        try:
+            executor = self._get_executor()
+            if executor is None:
+                return fn(*args)
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool as e:
+            self._restart_broken_pool(executor, e)
+        finally:
+            if future is None:
+                self._slots.release()
+        # The slot is held until the job really finishes, even if this caller stops waiting
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=PASSWORD_HASH_TIMEOUT_SECONDS)
+        except FutureTimeoutError as e:
+            future.cancel()
+            logger.warning(f"Password hashing did not finish within {PASSWORD_HASH_TIMEOUT_SECONDS}s")
+            raise PasswordHashingBusy() from e
+        except BrokenProcessPool as e:
+            self._restart_broken_pool(executor, e)
+
+    def _restart_broken_pool(self, broken: ProcessPoolExecutor, error: BrokenProcessPool) -> None:
+        """A worker died: drop the pool so the next job starts a fresh one, and answer this job with a 503."""
+        logger.error(f"Password hashing pool is broken, restarting it: {error}")
+        with self._executor_lock:
+            if self._executor is broken:
+                self._executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+        raise PasswordHashingBusy() from error
+
+    def hash(self, password: str) -> str:
+        return self._run(_hash, password)
+
+    def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Returns (is_valid, new_hash); new_hash is set when the stored hash uses an outdated cost."""
+        return self._run(_verify_and_update, password, hashed_password)
+
+    def verify(self, password: str, hashed_password: str) -> bool:
+        return self.verify_and_update(password, hashed_password)[0]
+
+
+password_hasher = PasswordHasher()
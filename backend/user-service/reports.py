@@ -0,0 +1,212 @@
+import glob
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template, select_autoescape
+
+logger = logging.getLogger(__name__)
+
+# --- Report settings ---
+REPORTS_DIR = os.getenv("REPORTS_DIR", "/tmp/pycher_reports")
+REPORT_MAX_CONCURRENT_RENDERS = int(os.getenv("REPORT_MAX_CONCURRENT_RENDERS", 2))
+REPORT_TEMPLATE = "progress_report.html"
+REPORT_STYLESHEET = "progress_report.css"
+JINJA_BYTECODE_CACHE_DIR = os.path.join(REPORTS_DIR, "jinja_bytecode")
+
+# Report statuses returned to the frontend
+REPORT_STATUS_NOT_STARTED = "not_started"
+REPORT_STATUS_PENDING = "pending"
+REPORT_STATUS_READY = "ready"
+REPORT_STATUS_FAILED = "failed"
+
+
+# --- Jinja2 Environment Setup ---
+def _resolve_templates_path() -> str:
+    # 'templates' lives next to this file inside user-service (/app/templates in Docker)
+    templates_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+    if not os.path.isdir(templates_path) and os.path.isdir("/app/templates"):
+        templates_path = "/app/templates"
+    elif not os.path.isdir(templates_path):
+        # If still not found, default to "templates" relative to CWD (less robust)
+        templates_path = "templates"
+        logger.warning(f"Jinja2 templates path fell back to relative 'templates'. Resolved to: {os.path.abspath(templates_path)}")
+    return templates_path
+
+TEMPLATES_PATH = _resolve_templates_path()
+
+def templates_available() -> bool:
+    return os.path.isfile(os.path.join(TEMPLATES_PATH, REPORT_TEMPLATE))
+
+
+# --- Renderer ---
+class ReportRenderer:
+    """
+    Holds everything that is expensive to set up once per process: the compiled template
+    (backed by an on-disk bytecode cache shared by all workers), a shared WeasyPrint
+    FontConfiguration and the pre-parsed report stylesheet. Call warm() before the first render.
+    """
+
+    def __init__(self, templates_path: str = TEMPLATES_PATH, bytecode_cache_dir: str = JINJA_BYTECODE_CACHE_DIR):
+        self.templates_path = templates_path
+        self.bytecode_cache_dir = bytecode_cache_dir
+        self.template: Optional[Template] = None
+        self.font_config = None
+        self.stylesheets: list = []
+
+    def warm(self) -> "ReportRenderer":
+        from weasyprint import CSS, HTML  # Imported lazily so only render workers pay for it
+        from weasyprint.text.fonts import FontConfiguration
+
+        os.makedirs(self.bytecode_cache_dir, exist_ok=True)
+        env = Environment(
+            loader=FileSystemLoader(self.templates_path),
+            autoescape=select_autoescape(['html', 'xml']),
+            bytecode_cache=FileSystemBytecodeCache(self.bytecode_cache_dir),
+            auto_reload=False,
+        )
+        self.template = env.get_template(REPORT_TEMPLATE)
+        self.font_config = FontConfiguration()
+        self.stylesheets = [
+            CSS(filename=os.path.join(self.templates_path, REPORT_STYLESHEET), font_config=self.font_config)
+        ]
+        # A tiny render fills fontconfig/pango caches so the first real report is not the slow one
+        HTML(string="<p>Pycher</p>").write_pdf(stylesheets=self.stylesheets, font_config=self.font_config)
+        return self
+
+    def render_html(self, report_data: dict) -> str:
+        if self.template is None:
+            self.warm()
+        return self.template.render(report_data=report_data)
+
+    def render_pdf(self, report_data: dict, target) -> None:
+        """Writes the PDF to `target` (a path or a binary file object)."""
+        from weasyprint import HTML
+
+        html_content = self.render_html(report_data)
+        HTML(string=html_content).write_pdf(target, stylesheets=self.stylesheets, font_config=self.font_config)
+
+
+# --- Worker process side ---
+_worker_renderer: Optional[ReportRenderer] = None
+
+def _init_render_worker() -> None:
+    """ProcessPoolExecutor initializer: warms the renderer once per worker process."""
+    global _worker_renderer
+    try:
+        _worker_renderer = ReportRenderer().warm()
+    except Exception as e:
+        # Rendering will retry the warm-up and surface the error on the job
+        logger.error(f"Could not warm report renderer in worker {os.getpid()}: {e}")
+
+def _get_worker_renderer() -> ReportRenderer:
+    global _worker_renderer
+    if _worker_renderer is None or _worker_renderer.template is None:
+        _worker_renderer = ReportRenderer().warm()
+    return _worker_renderer
+
+def _worker_ready() -> int:
+    return os.getpid()
+
+def render_report_pdf(report_data: dict, output_path: str) -> str:
+    """Renders the progress report to `output_path`. Runs inside a worker process."""
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    _get_worker_renderer().render_pdf(report_data, tmp_path)
+    os.replace(tmp_path, output_path)  # Readers never see a half-written file
+    return output_path
+
+
+# --- API process side ---
+class ReportJobs:
+    """
+    Tracks PDF renders per (user_id, progress_version).
+
+    Renders run in a small process pool, so the event loop is never blocked and at most
+    REPORT_MAX_CONCURRENT_RENDERS PDFs are rendered at once. Finished reports stay on disk
+    until the user's progress version changes, so repeat downloads are served directly.
+    """
+
+    def __init__(self, reports_dir: str = REPORTS_DIR, max_workers: int = REPORT_MAX_CONCURRENT_RENDERS):
+        self.reports_dir = reports_dir
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._jobs: Dict[Tuple[int, int], Future] = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: the API process has threads and DB connections that must not be forked
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_render_worker,
+            )
+        return self._executor
+
+    def warm_up(self) -> None:
+        """Starts every render worker now so their renderers are warm before the first request."""
+        os.makedirs(self.reports_dir, exist_ok=True)
+        executor = self._get_executor()
+        for _ in range(self.max_workers):
+            executor.submit(_worker_ready)
+
+    def report_path(self, user_id: int, version: int) -> str:
+        return os.path.join(self.reports_dir, f"progress_report_u{user_id}_v{version}.pdf")
+
+    def get_job(self, user_id: int, version: int) -> Optional[Future]:
+        with self._lock:
+            return self._jobs.get((user_id, version))
+
+    def status(self, user_id: int, version: int) -> dict:
+        result = {"status": REPORT_STATUS_NOT_STARTED, "version": version, "error": None}
+        if os.path.exists(self.report_path(user_id, version)):
+            result["status"] = REPORT_STATUS_READY
+            return result
+        job = self.get_job(user_id, version)
+        if job is None:
+            return result
+        if not job.done():
+            result["status"] = REPORT_STATUS_PENDING
+        else:
+            result["status"] = REPORT_STATUS_FAILED
+            error = job.exception()
+            result["error"] = str(error) if error else "Report file is missing"
+        return result
+
+    def submit(self, user_id: int, version: int, report_data: dict) -> Future:
+        """Starts a render unless one is already running or the file already exists."""
+        key = (user_id, version)
+        output_path = self.report_path(user_id, version)
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and (not job.done() or os.path.exists(output_path)):
+                return job
+            os.makedirs(self.reports_dir, exist_ok=True)
+            logger.info(f"Queueing progress report render for user_id: {user_id} (v{version})")
+            job = self._get_executor().submit(render_report_pdf, report_data, output_path)
+            self._jobs[key] = job
+        job.add_done_callback(lambda done: self._on_done(user_id, version, done))
+        return job
+
+    def _on_done(self, user_id: int, version: int, job: Future) -> None:
+        if job.exception() is not None:
+            logger.error(f"Progress report render failed for user_id: {user_id} (v{version}): {job.exception()}")
+            return
+        logger.info(f"Progress report rendered for user_id: {user_id} (v{version})")
+        # Older versions of this user's report are stale now
+        current_path = self.report_path(user_id, version)
+        for path in glob.glob(os.path.join(self.reports_dir, f"progress_report_u{user_id}_v*.pdf")):
+            if path != current_path:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.warning(f"Could not remove stale report {path}: {e}")
+        with self._lock:
+            for key in [k for k in self._jobs if k[0] == user_id and k[1] != version]:
+                del self._jobs[key]
+
+
+report_jobs = ReportJobs()
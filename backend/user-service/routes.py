@@ -4,9 +4,10 @@ from typing import Dict, List, Optional, Union
 from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status, Body
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi.responses import StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
+import asyncio
 from sqlalchemy.orm import Session
-import io
 import httpx
 import os # For path manipulation
 from datetime import datetime as dt # Alias for clari
@@ -33,7 +34,9 @@ from schemas import (
     CourseExamSchema,
     LessonProgressDetailResponse, # Add this import
     ModuleIdsRequest, LessonIdsRequest,
-    BatchModuleProgressResponse, BatchLessonProgressResponse, ChangePasswordRequest, ChangeUsernameRequest
+    BatchModuleProgressResponse, BatchLessonProgressResponse, ChangePasswordRequest, ChangeUsernameRequest,
+    CourseProgressSnapshotRequest, CourseProgressSnapshotResponse,
+    ReportStatusResponse
 )
 
 from services import (
@@ -43,6 +46,7 @@ from services import (
     get_user_lesson_progress_detail, get_user_progress_report_data,
     get_batch_module_progress_details, change_user_password, change_user_username,
     get_batch_lesson_progress_details,
+    get_course_progress_snapshot,
     update_last_accessed,
     start_module,
     get_user_module_progress,
@@ -50,13 +54,16 @@ from services import (
     start_exam_attempt,
     submit_exam_attempt,
     get_or_create_current_exam_exercise,
-    get_user_exam_attempts
+    get_user_exam_attempts,
+    _mark_progress_changed
     # --- END ADDED IMPORTS ---
 )
 
-from auth import get_current_user # Ensure this is correctly imported from your auth module
+from auth import get_current_user, get_current_db_user, get_current_user_or_internal, revoke_user_tokens, login_rate_limiter # Ensure this is correctly imported from your auth module
+from reports import report_jobs, templates_available, TEMPLATES_PATH, REPORT_STATUS_NOT_STARTED, REPORT_STATUS_FAILED, REPORT_STATUS_READY
+from utils import get_progress_version
 
-from utils import create_access_token, redis_client, SECRET_KEY, ALGORITHM
+from utils import create_access_token, redis_client, SECRET_KEY, ALGORITHM, refresh_token_key, store_session_tokens, delete_session_tokens
 
 router = APIRouter()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -109,14 +116,25 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db:
     # Log the login attempt (omit password)
     logger.info(f"Login attempt - Username: {form_data.username}")
 
+    retry_after = login_rate_limiter.retry_after(username)
+    if retry_after:
+        logger.warning(f"Login rate limited - Username: {username}, retry after {retry_after}s")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Demasiados intentos de inicio de sesión. Intenta de nuevo más tarde.",
+            headers={"Retry-After": str(retry_after)},
+        )
+
     user = authenticate_user(db, form_data.username, form_data.password)
     if not user:
+        login_rate_limiter.record_failure(username)
         logger.warning(f"Login failed: Invalid credentials - Username: {form_data.username}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Usuario o contraseña incorrectos",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    login_rate_limiter.reset(username)
 
     # Log successful login
     logger.info(f"Login successful - Username: {form_data.username}, User ID: {user.id}")
@@ -136,19 +154,12 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db:
 
     # Store tokens in Redis
     try:
-        redis_client.setex(
-            f"token:{user.username}",
-            int(access_token_expires.total_seconds()),
-            access_token
-        )
-        redis_client.setex(
-            f"refresh_token:{user.username}",
-            int(refresh_token_expires.total_seconds()),
-            refresh_token
-        )
+        store_session_tokens(user.username, access_token, access_token_expires, refresh_token, refresh_token_expires)
         logger.info(f"Stored tokens in Redis for user: {form_data.username}")
     except Exception as e:
         logger.warning(f"Failed to store tokens in Redis: {e}")
+    # The previous access token is no longer the stored one; drop it from every worker's cache
+    revoke_user_tokens(user.username)
 
     return {
         "access_token": access_token,
@@ -159,8 +170,8 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db:
 @router.post("/logout")
 def logout_user(current_user: User = Depends(get_current_user)):
     # Remove token from Redis
-    redis_client.delete(f"token:{current_user.username}")
-    redis_client.delete(f"refresh_token:{current_user.username}")
+    delete_session_tokens(current_user.username)
+    revoke_user_tokens(current_user.username)
     logger.info(f"Logout for user: {current_user.username}")
     return {"detail": "Desconectado correctamente"}
 
@@ -185,8 +196,8 @@ def refresh_access_token(refresh_token_body: Dict[str, str] = Body(...), db: Ses
         raise credentials_exception
 
     # Verify refresh token is in Redis
-    stored_refresh_token = redis_client.get(f"refresh_token:{username}")
-    if stored_refresh_token is None or stored_refresh_token.decode() != refresh_token:
+    stored_refresh_token = redis_client.get(refresh_token_key(username))
+    if stored_refresh_token is None or stored_refresh_token != refresh_token:
         raise credentials_exception
 
     # Create new access token
@@ -200,11 +211,9 @@ def refresh_access_token(refresh_token_body: Dict[str, str] = Body(...), db: Ses
     )
 
     # Update access token in Redis
-    redis_client.setex(
-        f"token:{username}",
-        int(access_token_expires.total_seconds()),
-        new_access_token
-    )
+    store_session_tokens(username, new_access_token, access_token_expires)
+    # The previous access token is no longer the stored one; drop it from every worker's cache
+    revoke_user_tokens(username)
 
     return {
         "access_token": new_access_token,
@@ -434,62 +443,52 @@ def get_user_exam_attempts_route(
     return get_user_exam_attempts(db, current_user.id, exam_id)
 
 # --- Report Routes ---
+# PDFs are rendered in a process pool (see reports.py) and cached on disk per progress version.
+REPORT_WAIT_TIMEOUT_SECONDS = float(os.getenv("REPORT_WAIT_TIMEOUT_SECONDS", 60))
 
-# Jinja2 and WeasyPrint
-from jinja2 import Environment, FileSystemLoader, select_autoescape
-from weasyprint import HTML
-from weasyprint.text.fonts import FontConfiguration # For potential font configuration
-
-# Logger setup (use your existing logger or a standard one)
-logger = logging.getLogger(__name__) # This will use the logger defined at the top of the file or create a new one for this module
-if not logger.hasHandlers(): # Basic config if no handlers are set
-    logging.basicConfig(level=logging.INFO)
-
-
-# --- Jinja2 Environment Setup ---
-# Construct the path to the templates directory relative to this file's location.
-# This assumes routes.py is directly inside 'user-service' or a subdirectory of it,
-# and 'templates' is a sibling to 'user-service's root or directly inside 'user-service'.
-
-# Path to the directory containing this 'routes.py' file
-_current_file_dir = os.path.dirname(os.path.abspath(__file__))
-
-# Path to the 'user-service' directory (assuming routes.py is inside user-service or a subfolder)
-# This might need adjustment based on your exact structure.
-# If routes.py is at c:\Users\dev1mig\Documents\GitHub\pycher\backend\user-service\routes.py
-# then _user_service_root_dir would be c:\Users\dev1mig\Documents\GitHub\pycher\backend\user-service\
-_user_service_root_dir = os.path.dirname(_current_file_dir) # if routes.py is in a direct subfolder of user-service
-if os.path.basename(_current_file_dir) == "user-service": # if routes.py is directly in user-service
-    _user_service_root_dir = _current_file_dir
-
-_templates_path = os.path.join(_user_service_root_dir, "templates")
-
-# Fallback for common Docker structure where WORKDIR is /app and user-service code is in /app
-if not os.path.isdir(_templates_path) and os.path.isdir("/app/templates"):
-    _templates_path = "/app/templates"
-elif not os.path.isdir(_templates_path):
-    # If still not found, default to "templates" relative to CWD (less robust)
-    _templates_path = "templates"
-    logger.warning(f"Jinja2 templates path fell back to relative 'templates'. Resolved to: {os.path.abspath(_templates_path)}")
-
-
-jinja_env = None
-try:
-    if os.path.isdir(_templates_path):
-        logger.info(f"Initializing Jinja2 Environment with template path: {_templates_path}")
-        jinja_env = Environment(
-            loader=FileSystemLoader(_templates_path),
-            autoescape=select_autoescape(['html', 'xml'])
-        )
-    else:
-        logger.error(f"Jinja2 templates directory not found at expected path: {_templates_path}. PDF report generation will fail.")
-except Exception as e:
-    logger.error(f"Failed to initialize Jinja2 Environment from path '{_templates_path}': {e}. PDF report generation will fail.", exc_info=True)
-    jinja_env = None # Ensure it's None if setup fails
+def _report_status_response(user_id: int, version: int) -> ReportStatusResponse:
+    report_status = report_jobs.status(user_id, version)
+    download_url = "/api/v1/users/me/progress/report/pdf" if report_status["status"] == REPORT_STATUS_READY else None
+    return ReportStatusResponse(**report_status, download_url=download_url)
+
+def _queue_progress_report(db: Session, user_id: int, version: int):
+    report_data = get_user_progress_report_data(db, user_id).model_dump(mode='python')
+    return report_jobs.submit(user_id, version, report_data)
+
+def _ensure_templates_available(user_id: int):
+    if not templates_available():
+        logger.error(f"Report template not found in {TEMPLATES_PATH}. Cannot generate PDF report for user {user_id}.")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Server template engine not configured. Cannot generate report.")
+
+@router.post(
+    "/me/progress/report",
+    response_model=ReportStatusResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Start generating the user's progress report PDF",
+    tags=["users", "reports"]
+)
+def request_my_progress_report_route(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    _ensure_templates_available(current_user.id)
+    version = get_progress_version(current_user.id)
+    if report_jobs.status(current_user.id, version)["status"] in (REPORT_STATUS_NOT_STARTED, REPORT_STATUS_FAILED):
+        _queue_progress_report(db, current_user.id, version)
+    return _report_status_response(current_user.id, version)
+
+@router.get(
+    "/me/progress/report/status",
+    response_model=ReportStatusResponse,
+    summary="Poll the status of the user's progress report PDF",
+    tags=["users", "reports"]
+)
+def get_my_progress_report_status_route(current_user: User = Depends(get_current_user)):
+    return _report_status_response(current_user.id, get_progress_version(current_user.id))
 
 @router.get(
     "/me/progress/report/pdf",
-    response_class=StreamingResponse,
+    response_class=FileResponse,
     summary="Download User Progress Report as PDF",
     tags=["users", "reports"]
 )
@@ -497,58 +496,43 @@ async def get_my_progress_report_pdf_route(
     db: Session = Depends(get_db), # Ensure get_db is correctly imported/defined
     current_user: UserResponse = Depends(get_current_user) # Ensure get_current_user and UserResponse are correct
 ):
-    if jinja_env is None:
-        logger.error(f"Jinja2 environment not initialized. Cannot generate PDF report for user {current_user.id if current_user else 'unknown'}.")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Server template engine not configured. Cannot generate report.")
-
     if not current_user or not hasattr(current_user, 'id'):
         logger.error("Could not identify current user for PDF report generation.")
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not identify user.")
 
-    try:
-        logger.info(f"Generating progress report PDF for user_id: {current_user.id}")
-
-        # 1. Get data from the service
-        report_data_obj = get_user_progress_report_data(db, current_user.id)
-
-        # 2. Convert Pydantic model to dict for Jinja2. `model_dump` is for Pydantic V2.
-        report_data_dict = report_data_obj.model_dump(mode='python') # mode='python' keeps datetime objects as datetime
-
-        # 3. Render HTML template
-        template = jinja_env.get_template("progress_report.html")
-        html_content = template.render(report_data=report_data_dict)
-        logger.debug(f"HTML content for PDF generated for user_id: {current_user.id}")
-
-        # 4. Convert HTML to PDF using WeasyPrint
-        pdf_file_stream = io.BytesIO()
-
-        # Optional: Configure fonts if needed, e.g., for non-Latin characters or custom fonts
-        # font_config = FontConfiguration()
-        # HTML(string=html_content, font_config=font_config).write_pdf(pdf_file_stream)
-
-        HTML(string=html_content).write_pdf(pdf_file_stream)
-        pdf_file_stream.seek(0) # Reset stream position to the beginning
-
-        logger.info(f"PDF generated successfully for user_id: {current_user.id}")
-
-        # 5. Return StreamingResponse
-        username_for_file = "".join(c if c.isalnum() else "_" for c in current_user.username) # Sanitize username
-        filename_date = dt.utcnow().strftime("%Y%m%d")
-        filename = f"Pycher_Progress_Report_{username_for_file}_{filename_date}.pdf"
-
-        headers = {
-            'Content-Disposition': f'attachment; filename="{filename}"'
-        }
-        return StreamingResponse(pdf_file_stream, media_type="application/pdf", headers=headers)
-
-    except HTTPException as e:
-        # Re-raise HTTPExceptions that might come from the service layer (e.g., User Not Found)
-        logger.error(f"HTTPException while generating PDF report for user {current_user.id}: {e.detail}", exc_info=True)
-        raise e
-    except Exception as e:
-        logger.error(f"Unexpected error generating PDF report for user {current_user.id}: {str(e)}", exc_info=True)
-        # Log the full traceback for unexpected errors
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Could not generate PDF report due to an internal server error.")
+    _ensure_templates_available(current_user.id)
+    version = get_progress_version(current_user.id)
+    report_path = report_jobs.report_path(current_user.id, version)
+
+    if not os.path.exists(report_path):
+        try:
+            job = report_jobs.get_job(current_user.id, version)
+            if job is None or (job.done() and job.exception() is not None):
+                # Report queries are synchronous; keep them off the event loop
+                job = await run_in_threadpool(_queue_progress_report, db, current_user.id, version)
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(job)), timeout=REPORT_WAIT_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            # Still rendering: tell the client to poll the status endpoint
+            logger.info(f"PDF report for user {current_user.id} still rendering after {REPORT_WAIT_TIMEOUT_SECONDS}s.")
+            return JSONResponse(
+                status_code=status.HTTP_202_ACCEPTED,
+                content=_report_status_response(current_user.id, version).model_dump(),
+                headers={"Retry-After": "5"},
+            )
+        except HTTPException as e:
+            # Re-raise HTTPExceptions that might come from the service layer (e.g., User Not Found)
+            logger.error(f"HTTPException while generating PDF report for user {current_user.id}: {e.detail}", exc_info=True)
+            raise e
+        except Exception as e:
+            logger.error(f"Unexpected error generating PDF report for user {current_user.id}: {str(e)}", exc_info=True)
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Could not generate PDF report due to an internal server error.")
+
+    username_for_file = "".join(c if c.isalnum() else "_" for c in current_user.username) # Sanitize username
+    filename_date = dt.utcnow().strftime("%Y%m%d")
+    filename = f"Pycher_Progress_Report_{username_for_file}_{filename_date}.pdf"
+
+    # FileResponse streams the cached file from disk in chunks
+    return FileResponse(report_path, media_type="application/pdf", filename=filename)
 
 # --- Batch Progress Endpoints ---
 
@@ -556,7 +540,7 @@ async def get_my_progress_report_pdf_route(
 def get_batch_module_progress_route(
     request_data: ModuleIdsRequest,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user = Depends(get_current_user_or_internal) # Also callable by content-service
 ):
     """
     Fetches completion status for a batch of module IDs for the current user.
@@ -574,7 +558,7 @@ def get_batch_module_progress_route(
 def get_batch_lesson_progress_route(
     request_data: LessonIdsRequest,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user = Depends(get_current_user_or_internal) # Also callable by content-service
 ):
     """
     Fetches completion status for a batch of lesson IDs for the current user.
@@ -587,8 +571,25 @@ def get_batch_lesson_progress_route(
     logger.info(f"Batch lesson progress check for U{current_user.id}, L_IDs {request_data.lesson_ids}. Result from service: {progress_map}")
     return BatchLessonProgressResponse(progress=progress_map)
 
+@router.post("/progress/snapshot", response_model=CourseProgressSnapshotResponse)
+def get_course_progress_snapshot_route(
+    request_data: CourseProgressSnapshotRequest,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user_or_internal) # Also callable by content-service
+):
+    """
+    Fetches module and lesson completion for a whole course tree in one call.
+    Used by content-service to resolve lock status without one request per module.
+    """
+    if not request_data.module_ids and not request_data.lesson_ids:
+        return CourseProgressSnapshotResponse()
+
+    snapshot = get_course_progress_snapshot(db, current_user.id, request_data.module_ids, request_data.lesson_ids)
+    logger.info(f"Progress snapshot for U{current_user.id}: {len(request_data.module_ids)} modules, {len(request_data.lesson_ids)} lessons.")
+    return CourseProgressSnapshotResponse(**snapshot)
+
 @router.post("/change-password")
-def change_password(request: ChangePasswordRequest, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def change_password(request: ChangePasswordRequest, current_user: User = Depends(get_current_db_user), db: Session = Depends(get_db)):
     """
     Changes the user's password.
     """
@@ -605,11 +606,16 @@ def change_password(request: ChangePasswordRequest, current_user: User = Depends
 
     # Change the password
     change_user_password(db, current_user, request.current_password, request.new_password)
+    revoke_user_tokens(current_user.username)
     logger.info(f"Password changed successfully for user: {current_user.username}")
     return {"detail": "Contraseña cambiada correctamente"}
 @router.post("/change-username")
-def change_username(request: ChangeUsernameRequest, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    return change_user_username(db, current_user, request.new_username)
+def change_username(request: ChangeUsernameRequest, current_user: User = Depends(get_current_db_user), db: Session = Depends(get_db)):
+    old_username = current_user.username
+    result = change_user_username(db, current_user, request.new_username)
+    # Cached snapshots still carry the old username
+    revoke_user_tokens(old_username)
+    return result
 
 @router.post("/exam-attempts", response_model=UserExamAttemptResponse)
 def submit_exam_attempt(attempt: UserExamAttemptBase, current_user=Depends(get_current_user), db: Session = Depends(get_db)):
@@ -706,6 +712,7 @@ async def submit_exercise(
         submission_record.error_message = error_message
         submission_record.execution_time = execution_time
         submission_record.submitted_at = dt.utcnow() # Update submission time
+        _mark_progress_changed(db, current_user.id)
         db.commit()
         db.refresh(submission_record)
         logger.info(f"Updated submission record for user {current_user.id}, exercise {submission.exercise_id}")
@@ -721,6 +728,7 @@ async def submit_exercise(
             submitted_at=dt.utcnow() # Set submission time
         )
         db.add(submission_record)
+        _mark_progress_changed(db, current_user.id)
         db.commit()
         db.refresh(submission_record)
         logger.info(f"Created new submission record for user {current_user.id}, exercise {submission.exercise_id}")
@@ -310,8 +310,8 @@ class UserEnrollmentWithProgressResponse(BaseModel):
     id: int
     user_id: int
     course_id: int
-    # course_title: str # Remove direct field
-    # course_description: Optional[str] = None # Remove direct field
+    course_title: str = "Unknown Course Title"
+    course_description: Optional[str] = None
     enrollment_date: datetime
     last_accessed: Optional[datetime] = None
     is_completed: bool = False
@@ -321,21 +321,11 @@ class UserEnrollmentWithProgressResponse(BaseModel):
     last_accessed_module_id: Optional[int] = None
     last_accessed_lesson_id: Optional[int] = None
     exam_unlocked: bool
-
-    # This assumes UserCourseEnrollment instance passed to it has 'course' eager loaded
-    @computed_field
-    @property
-    def course_title(self) -> str:
-        if hasattr(self, 'course') and self.course: # self here is the UserCourseEnrollment instance
-            return self.course.title
-        return "Unknown Course Title" # Or raise an error, or return Optional[str]
-
-    @computed_field
-    @property
-    def course_description(self) -> Optional[str]:
-        if hasattr(self, 'course') and self.course:
-            return self.course.description
-        return None
+    # Aggregated in SQL by get_user_enrollments_with_progress
+    total_modules: int = 0
+    total_lessons: int = 0
+    completed_modules: int = 0
+    completed_lessons: int = 0
 
     class Config:
         from_attributes = True
@@ -450,6 +440,12 @@ class UserProgressReportDataSchema(BaseModel):
     class Config:
         from_attributes = True
 
+class ReportStatusResponse(BaseModel):
+    status: str # not_started | pending | ready | failed
+    version: int # Progress version the report was (or will be) rendered for
+    download_url: Optional[str] = None
+    error: Optional[str] = None
+
 # --- Batch Progress Schemas ---
 
 class ModuleIdsRequest(BaseModel):
@@ -476,6 +472,16 @@ class BatchModuleProgressResponse(BaseModel):
 class BatchLessonProgressResponse(BaseModel):
     progress: Dict[int, bool] # lesson_id -> is_completed
 
+class CourseProgressSnapshotRequest(BaseModel):
+    module_ids: List[int] = []
+    lesson_ids: List[int] = []
+
+class CourseProgressSnapshotResponse(BaseModel):
+    # Completion flags for every requested id, so content-service can resolve
+    # the lock status of a whole course tree with a single call.
+    modules: Dict[int, bool] = {} # module_id -> is_completed
+    lessons: Dict[int, bool] = {} # lesson_id -> is_completed
+
 class ChangePasswordRequest(BaseModel):
     current_password: str = Field(..., min_length=8, max_length=64)
     new_password: str = Field(..., min_length=8, max_length=64)
@@ -1,16 +1,18 @@
-from sqlalchemy.orm import Session, joinedload, selectinload
-from sqlalchemy import func as sql_func
+from sqlalchemy.orm import Session, joinedload, selectinload, undefer_group
+from sqlalchemy import func as sql_func, event, select, and_
 from sqlalchemy.exc import IntegrityError
 import os
 import httpx
 import logging
 from fastapi import HTTPException, status
 # Assuming utils.py is in the same directory as services.py
-from utils import get_password_hash, verify_password, generate_input_from_constraints
+from utils import get_password_hash, verify_password, bump_progress_version
+from passwords import password_hasher
 from datetime import datetime as dt
 from typing import Optional, List, Dict, Any # Ensure all necessary types are imported
 
 from models import User, UserCourseEnrollment, UserModuleProgress, UserLessonProgress, UserExerciseSubmission, CourseExam, UserExamAttempt, Course, Module, Lesson, Exercise, ExamQuestion # Ensure Module is imported
+from shared.models import EXERCISE_BODY
 from schemas import ( # Adjusted if your schemas are structured differently
     UserProgressReportDataSchema, ReportCourseProgressSchema, ReportModuleProgressSchema,
     ReportLessonProgressSchema, ReportExerciseProgressSchema, ReportExamAttemptSchema,
@@ -27,6 +29,34 @@ EXECUTION_SERVICE_URL = os.getenv("EXECUTION_SERVICE_URL", "http://execution-ser
 CONTENT_SERVICE_URL = os.getenv("CONTENT_SERVICE_URL", "http://content-service:8002")
 
 
+# --- Progress change tracking ---
+# Progress writes only mark the user as changed on the session; the per-user progress
+# version is bumped after the transaction commits, so readers never cache data under
+# a new version before it is visible in the database.
+PROGRESS_CHANGED_USERS_KEY = "progress_changed_user_ids"
+
+def _mark_progress_changed(db: Session, user_id: int):
+    db.info.setdefault(PROGRESS_CHANGED_USERS_KEY, set()).add(user_id)
+
+@event.listens_for(Session, "after_commit")
+def _bump_progress_versions_after_commit(session: Session):
+    changed_user_ids = session.info.pop(PROGRESS_CHANGED_USERS_KEY, None)
+    for user_id in changed_user_ids or ():
+        bump_progress_version(user_id)
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_progress_changes_after_rollback(session: Session, previous_transaction):
+    session.info.pop(PROGRESS_CHANGED_USERS_KEY, None)
+
+
+# --- Active content ---
+# Content removed from the seed is soft-deleted (is_active=False). Students can no longer open
+# it, so completion and progress only count rows that are still active.
+ACTIVE_MODULE = Module.is_active.isnot(False)
+ACTIVE_LESSON = Lesson.is_active.isnot(False)
+ACTIVE_EXERCISE = Exercise.is_active.isnot(False)
+
+
 # --- Helper functions for cascading completion ---
 
 def _check_and_update_lesson_completion(db: Session, user_id: int, lesson_id: int):
@@ -56,7 +86,7 @@ def _check_and_update_lesson_completion(db: Session, user_id: int, lesson_id: in
         logger.info(f"User ID {user_id}, Lesson ID {lesson_id}: Lesson already marked as complete.")
         return
 
-    exercise_ids_in_lesson = [e.id for e in db.query(Exercise.id).filter(Exercise.lesson_id == lesson_id).all()]
+    exercise_ids_in_lesson = [e.id for e in db.query(Exercise.id).filter(Exercise.lesson_id == lesson_id, ACTIVE_EXERCISE).all()]
 
     all_exercises_correct = True
     if exercise_ids_in_lesson:
@@ -72,6 +102,7 @@ def _check_and_update_lesson_completion(db: Session, user_id: int, lesson_id: in
         lesson_progress.is_completed = True
         lesson_progress.completed_at = dt.utcnow()
         db.add(lesson_progress)
+        _mark_progress_changed(db, user_id)
         logger.info(f"User ID {user_id}, Lesson ID {lesson_id}: Conditions met. Marking lesson as completed.")
 
         # --- FIX: The update chain is now linear and correct. ---
@@ -103,7 +134,7 @@ def _check_and_update_module_completion(db: Session, user_id: int, module_id: in
         logger.error(f"CRITICAL: No UserModuleProgress found for User {user_id}, Module {module_id}.")
         return
 
-    lesson_ids_query = db.query(Lesson.id).filter(Lesson.module_id == module_id)
+    lesson_ids_query = db.query(Lesson.id).filter(Lesson.module_id == module_id, ACTIVE_LESSON)
     total_lessons_in_module = lesson_ids_query.count()
 
     if total_lessons_in_module == 0:
@@ -123,13 +154,15 @@ def _check_and_update_module_completion(db: Session, user_id: int, module_id: in
         module_progress.is_completed = True
         module_progress.completed_at = dt.utcnow()
         db.add(module_progress)
+        _mark_progress_changed(db, user_id)
         logger.info(f"User {user_id} has completed all lessons for Module {module_id}. Marking module as complete.")
 
         # --- START: LOGIC TO UNLOCK NEXT MODULE ---
         # Find the next module in the course based on order_index
         next_module = db.query(Module).filter(
             Module.course_id == course_id,
-            Module.order_index > module.order_index
+            Module.order_index > module.order_index,
+            ACTIVE_MODULE
         ).order_by(Module.order_index.asc()).first()
 
         if next_module:
@@ -179,12 +212,15 @@ def _check_and_update_course_completion(db: Session, user_id: int, course_id: in
         return
 
     # 1. Obtener los IDs de los primeros tres módulos del curso (ordenados por order_index)
-    first_three_modules_query = db.query(Module.id).filter(
+    first_three_modules_query = db.query(Module.id, Module.is_active).filter(
         Module.course_id == course_id,
         Module.order_index.in_([1, 2, 3])
     )
 
-    module_ids_to_check = [m.id for m in first_three_modules_query.all()]
+    first_three_modules = first_three_modules_query.all()
+    module_ids_to_check = [m.id for m in first_three_modules if m.is_active is not False]
+    # Soft-deleted modules among the first three can no longer be completed; they stop counting
+    required_modules = 3 - (len(first_three_modules) - len(module_ids_to_check))
 
     # Si el curso tiene menos de 3 módulos, no se puede cumplir esta regla.
     # Podrías agregar una lógica para manejar este caso, pero por ahora seguimos la regla "los primeros 3".
@@ -200,10 +236,10 @@ def _check_and_update_course_completion(db: Session, user_id: int, course_id: in
         UserModuleProgress.is_completed == True
     ).count()
 
-    logger.debug(f"User ID {user_id}, Course ID {course_id}: First 3 modules completed: {completed_modules_count}/3.")
+    logger.debug(f"User ID {user_id}, Course ID {course_id}: First 3 modules completed: {completed_modules_count}/{required_modules}.")
 
-    # 3. Si el usuario ha completado 3 o más de los módulos iniciales, desbloquear el examen
-    if completed_modules_count >= 3 and not enrollment.exam_unlocked:
+    # 3. Si el usuario ha completado los módulos iniciales activos, desbloquear el examen
+    if completed_modules_count >= required_modules and not enrollment.exam_unlocked:
         enrollment.exam_unlocked = True
         db.add(enrollment)
         logger.info(f"✅ EXAM UNLOCKED for User {user_id} in Course {course_id} after completing the first 3 modules.")
@@ -225,9 +261,9 @@ def get_user_by_email(db: Session, email: str):
 
 def create_user(db: Session, user: UserCreate):
     """Create a new user in the database"""
+    # Hashed before the try so PasswordHashingBusy surfaces as a 503, not a 500
+    hashed_password = get_password_hash(user.password)
     try:
-        hashed_password = get_password_hash(user.password)
-
         db_user = User(
             username=user.username,
             email=user.email,
@@ -255,8 +291,18 @@ def authenticate_user(db: Session, username: str, password: str):
     user = get_user_by_username(db, username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    is_valid, new_hash = password_hasher.verify_and_update(password, user.hashed_password)
+    if not is_valid:
         return False
+    if new_hash:
+        # Stored hash was made with a different bcrypt cost; upgrade it while we have the password
+        try:
+            user.hashed_password = new_hash
+            db.add(user)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Could not rehash password for user {username}: {e}")
     return user
 
 # --- Progress Tracking Service Functions ---
@@ -304,6 +350,9 @@ def enroll_user_in_course(db: Session, user_id: int, course_id: int):
         should_increment_count = True # Mark for incrementing on new enrollment
         logger.info(f"Created new enrollment for User ID {user_id} in Course ID {course_id}.")
 
+    if should_increment_count:
+        _mark_progress_changed(db, user_id)
+
     # Update students_count on the course if the enrollment was new or reactivated
     course_model = None
     if should_increment_count:
@@ -324,7 +373,7 @@ def enroll_user_in_course(db: Session, user_id: int, course_id: int):
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Could not process enrollment.")
 
     # --- Create UserModuleProgress entries for all modules in the course ---
-    course_modules = db.query(Module).filter(Module.course_id == course_id).order_by(Module.order_index.asc()).all()
+    course_modules = db.query(Module).filter(Module.course_id == course_id, ACTIVE_MODULE).order_by(Module.order_index.asc()).all()
 
     if not course_modules:
         logger.warning(f"Course ID {course_id} has no modules. No UserModuleProgress entries created for User ID {user_id}.")
@@ -455,6 +504,7 @@ def start_lesson(db: Session, user_id: int, lesson_id: int):
         try:
             progress = UserLessonProgress(user_id=user_id, lesson_id=lesson_id, started_at=dt.utcnow())
             db.add(progress)
+            _mark_progress_changed(db, user_id)
             # We flush here to ensure the record exists before we continue.
             # The commit will happen at the end of the function.
             db.flush()
@@ -677,6 +727,7 @@ def complete_exercise(db: Session, user_id: int, exercise_id: int, code_submitte
     submission_record.passed = all_system_tests_passed
 
     db.add(submission_record)
+    _mark_progress_changed(db, user_id)
 
     # Handle exam attempt state specifically
     if exercise.validation_type == "exam":
@@ -767,12 +818,12 @@ def get_batch_module_progress_details(db: Session, user_id: int, module_ids: lis
         record = next((r for r in progress_records if r.module_id == mid), None)
         if record:
             # Calculate progress percentage based on completed lessons
-            total_lessons = db.query(sql_func.count(Lesson.id)).filter(Lesson.module_id == mid).scalar() or 0
+            total_lessons = db.query(sql_func.count(Lesson.id)).filter(Lesson.module_id == mid, ACTIVE_LESSON).scalar() or 0
             completed_lessons = 0
             if total_lessons > 0:
                 completed_lessons = db.query(sql_func.count(UserLessonProgress.id)).filter(
                     UserLessonProgress.user_id == user_id,
-                    UserLessonProgress.lesson.has(Lesson.module_id == mid),
+                    UserLessonProgress.lesson.has(and_(Lesson.module_id == mid, ACTIVE_LESSON)),
                     UserLessonProgress.is_completed == True
                 ).scalar() or 0
             progress_percentage = (completed_lessons / total_lessons * 100) if total_lessons > 0 else 0.0
@@ -824,6 +875,33 @@ def get_batch_lesson_progress_details(db: Session, user_id: int, lesson_ids: lis
         progress_map[record.lesson_id] = bool(record.is_completed)
     return progress_map
 
+def get_course_progress_snapshot(db: Session, user_id: int, module_ids: list[int], lesson_ids: list[int]) -> dict:
+    """
+    Returns module and lesson completion flags for the given ids in one pass.
+    Only the (id, is_completed) columns are selected; ids without a progress
+    record are reported as not completed.
+    """
+    module_map = {mid: False for mid in module_ids}
+    lesson_map = {lid: False for lid in lesson_ids}
+
+    if module_ids:
+        module_rows = db.query(UserModuleProgress.module_id, UserModuleProgress.is_completed).filter(
+            UserModuleProgress.user_id == user_id,
+            UserModuleProgress.module_id.in_(module_ids)
+        ).all()
+        for module_id, is_completed in module_rows:
+            module_map[module_id] = bool(is_completed)
+
+    if lesson_ids:
+        lesson_rows = db.query(UserLessonProgress.lesson_id, UserLessonProgress.is_completed).filter(
+            UserLessonProgress.user_id == user_id,
+            UserLessonProgress.lesson_id.in_(lesson_ids)
+        ).all()
+        for lesson_id, is_completed in lesson_rows:
+            lesson_map[lesson_id] = bool(is_completed)
+
+    return {"modules": module_map, "lessons": lesson_map}
+
 def update_last_accessed(db: Session, user_id: int, course_id: int, module_id: int = None, lesson_id: int = None):
     enrollment = db.query(UserCourseEnrollment).filter(
         UserCourseEnrollment.user_id == user_id,
@@ -888,6 +966,7 @@ def start_module(db: Session, user_id: int, module_id: int):
     if module_progress.started_at is None: # Only set started_at if it's the first time
         module_progress.started_at = dt.utcnow()
         db.add(module_progress)
+        _mark_progress_changed(db, user_id)
 
     # Update last accessed on course enrollment
     module_db_instance = db.query(Module).filter(Module.id == module_id).first()
@@ -920,12 +999,12 @@ def start_module(db: Session, user_id: int, module_id: int):
     # This requires fetching course_id and calculating progress_percentage
     course_id_for_response = module_db_instance.course_id if module_db_instance else None
 
-    total_lessons_in_module = db.query(sql_func.count(Lesson.id)).filter(Lesson.module_id == module_id).scalar() or 0
+    total_lessons_in_module = db.query(sql_func.count(Lesson.id)).filter(Lesson.module_id == module_id, ACTIVE_LESSON).scalar() or 0
     completed_lessons_count = 0
     if total_lessons_in_module > 0:
         completed_lessons_count = db.query(sql_func.count(UserLessonProgress.id)).filter(
             UserLessonProgress.user_id == user_id,
-            UserLessonProgress.lesson.has(Lesson.module_id == module_id), # Ensure lesson belongs to this module
+            UserLessonProgress.lesson.has(and_(Lesson.module_id == module_id, ACTIVE_LESSON)), # Ensure lesson belongs to this module
             UserLessonProgress.is_completed == True
         ).scalar() or 0
 
@@ -977,14 +1056,14 @@ def get_user_module_progress(db: Session, user_id: int, module_id: int) -> Optio
     db.refresh(module_progress)  # Ensure Module is refreshed to get latest data
 
     # Calculate progress percentage
-    total_lessons_in_module = db.query(sql_func.count(Lesson.id)).filter(Lesson.module_id == module_id).scalar() or 0
+    total_lessons_in_module = db.query(sql_func.count(Lesson.id)).filter(Lesson.module_id == module_id, ACTIVE_LESSON).scalar() or 0
 
     completed_lessons_count = 0
     if total_lessons_in_module > 0:
         completed_lessons_count = db.query(sql_func.count(UserLessonProgress.id)).filter(
             UserLessonProgress.user_id == user_id,
             UserLessonProgress.lesson_id.in_(
-                db.query(Lesson.id).filter(Lesson.module_id == module_id)
+                db.query(Lesson.id).filter(Lesson.module_id == module_id, ACTIVE_LESSON)
             ),
             UserLessonProgress.is_completed == True
         ).scalar() or 0
@@ -1081,16 +1160,18 @@ def get_course_progress_summary(db: Session, user_id: int, course_id: int):
     if not enrollment:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not enrolled in this course")
 
-    total_lessons = db.query(Lesson).join(Module).filter(Module.course_id == course_id).count()
+    total_lessons = db.query(Lesson).join(Module).filter(Module.course_id == course_id, ACTIVE_MODULE, ACTIVE_LESSON).count()
     completed_lessons_count = db.query(UserLessonProgress).join(Lesson).join(Module).filter(
-        Module.course_id == course_id,
+        Module.course_id == course_id, ACTIVE_MODULE, ACTIVE_LESSON,
         UserLessonProgress.user_id == user_id,
         UserLessonProgress.is_completed == True
     ).count()
 
-    total_exercises = db.query(Exercise).join(Lesson).join(Module).filter(Module.course_id == course_id).count()
+    total_exercises = db.query(Exercise).join(Lesson).join(Module).filter(
+        Module.course_id == course_id, ACTIVE_MODULE, ACTIVE_LESSON, ACTIVE_EXERCISE
+    ).count()
     completed_exercises = db.query(UserExerciseSubmission).join(Exercise).join(Lesson).join(Module).filter(
-        Module.course_id == course_id,
+        Module.course_id == course_id, ACTIVE_MODULE, ACTIVE_LESSON, ACTIVE_EXERCISE,
         UserExerciseSubmission.user_id == user_id,
         UserExerciseSubmission.is_correct == True
     ).count()
@@ -1151,20 +1232,65 @@ def get_course_progress_summary(db: Session, user_id: int, course_id: int):
         "total_time_spent_minutes": enrollment.total_time_spent_minutes
     }
 
-def get_user_enrollments_with_progress(db: Session, user_id: int) -> list[UserCourseEnrollment]:
+def get_user_enrollments_with_progress(db: Session, user_id: int) -> List[Dict[str, Any]]:
     """
-    Retrieves all course enrollments for a given user (both active and inactive),
-    including their progress and related course information.
+    Retrieves all course enrollments for a given user (both active and inactive) for the
+    dashboard. One query: enrollment and course columns plus module/lesson totals and
+    completed counts aggregated in SQL. No course tree or lesson content is loaded.
     """
-    enrollments = db.query(UserCourseEnrollment).options(
-        selectinload(UserCourseEnrollment.course).selectinload(Course.modules).selectinload(Module.lessons).selectinload(Lesson.exercises),
-        selectinload(UserCourseEnrollment.course).selectinload(Course.exams)
-    ).filter(
-        UserCourseEnrollment.user_id == user_id
-    ).all()
-    logger.info(f"Fetched {len(enrollments)} total enrollments for User ID: {user_id}")
-    logger.info(f"Enrollments include active and inactive states. Active enrollments are those with is_active=True. {enrollments}")
-    return enrollments
+    enrollment = UserCourseEnrollment
+    active_module = Module.is_active.isnot(False)
+    active_lesson = Lesson.is_active.isnot(False)
+
+    total_modules = select(sql_func.count(Module.id)).where(
+        Module.course_id == enrollment.course_id, active_module
+    ).correlate(enrollment).scalar_subquery()
+    total_lessons = select(sql_func.count(Lesson.id)).join(Module, Lesson.module_id == Module.id).where(
+        Module.course_id == enrollment.course_id, active_module, active_lesson
+    ).correlate(enrollment).scalar_subquery()
+    completed_modules = select(sql_func.count(UserModuleProgress.id)).join(
+        Module, UserModuleProgress.module_id == Module.id
+    ).where(
+        UserModuleProgress.user_id == enrollment.user_id,
+        UserModuleProgress.is_completed.is_(True),
+        Module.course_id == enrollment.course_id,
+        active_module,
+    ).correlate(enrollment).scalar_subquery()
+    completed_lessons = select(sql_func.count(UserLessonProgress.id)).join(
+        Lesson, UserLessonProgress.lesson_id == Lesson.id
+    ).join(Module, Lesson.module_id == Module.id).where(
+        UserLessonProgress.user_id == enrollment.user_id,
+        UserLessonProgress.is_completed.is_(True),
+        Module.course_id == enrollment.course_id,
+        active_module,
+        active_lesson,
+    ).correlate(enrollment).scalar_subquery()
+
+    rows = db.query(
+        enrollment.id,
+        enrollment.user_id,
+        enrollment.course_id,
+        enrollment.enrollment_date,
+        enrollment.last_accessed,
+        enrollment.is_completed,
+        enrollment.progress_percentage,
+        enrollment.is_active_enrollment,
+        enrollment.total_time_spent_minutes,
+        enrollment.last_accessed_module_id,
+        enrollment.last_accessed_lesson_id,
+        enrollment.exam_unlocked,
+        Course.title.label("course_title"),
+        Course.description.label("course_description"),
+        total_modules.label("total_modules"),
+        total_lessons.label("total_lessons"),
+        completed_modules.label("completed_modules"),
+        completed_lessons.label("completed_lessons"),
+    ).join(Course, Course.id == enrollment.course_id).filter(
+        enrollment.user_id == user_id
+    ).order_by(enrollment.course_id).all()
+
+    logger.info(f"Fetched {len(rows)} total enrollments (active and inactive) for User ID: {user_id}")
+    return [dict(row._mapping) for row in rows]
 
 def unenroll_user_from_course(db: Session, user_id: int, course_id: int):
     """
@@ -1195,6 +1321,7 @@ def unenroll_user_from_course(db: Session, user_id: int, course_id: int):
         enrollment.last_accessed_module_id = None
         enrollment.last_accessed_lesson_id = None
         db.add(enrollment)
+        _mark_progress_changed(db, user_id)
 
         # Decrement the student count on the corresponding course
         course_model = db.query(Course).filter(Course.id == course_id).first()
@@ -1242,7 +1369,8 @@ def get_user_lesson_progress_detail(db: Session, user_id: int, lesson_id: int) -
     logger.debug(f"Step 1: Searching for next lesson in Module ID {current_lesson.module_id} with order_index > {current_lesson.order_index}")
     next_lesson_in_module = db.query(Lesson).filter(
         Lesson.module_id == current_lesson.module_id,
-        Lesson.order_index > current_lesson.order_index
+        Lesson.order_index > current_lesson.order_index,
+        ACTIVE_LESSON
     ).order_by(Lesson.order_index.asc()).first()
 
     if next_lesson_in_module:
@@ -1254,7 +1382,8 @@ def get_user_lesson_progress_detail(db: Session, user_id: int, lesson_id: int) -
         logger.debug(f"Step 2: Searching for next module in Course ID {current_lesson.module.course_id} with order_index > {current_lesson.module.order_index}")
         next_module = db.query(Module).filter(
             Module.course_id == current_lesson.module.course_id,
-            Module.order_index > current_lesson.module.order_index
+            Module.order_index > current_lesson.module.order_index,
+            ACTIVE_MODULE
         ).order_by(Module.order_index.asc()).first()
 
         if next_module:
@@ -1269,7 +1398,8 @@ def get_user_lesson_progress_detail(db: Session, user_id: int, lesson_id: int) -
             if next_module_progress:
                 logger.info(f"Next module (ID: {next_module.id}) is unlocked. Searching for its first lesson.")
                 first_lesson_in_next_module = db.query(Lesson).filter(
-                    Lesson.module_id == next_module.id
+                    Lesson.module_id == next_module.id,
+                    ACTIVE_LESSON
                 ).order_by(Lesson.order_index.asc()).first()
 
                 if first_lesson_in_next_module:
@@ -1295,7 +1425,7 @@ def get_user_lesson_progress_detail(db: Session, user_id: int, lesson_id: int) -
         )
 
     # Fetch exercises for the lesson
-    lesson_exercises = db.query(Exercise).filter(Exercise.lesson_id == lesson_id).order_by(Exercise.order_index).all()
+    lesson_exercises = db.query(Exercise).filter(Exercise.lesson_id == lesson_id, ACTIVE_EXERCISE).order_by(Exercise.order_index).all()
 
     exercises_progress_info_list: List[ExerciseProgressInfo] = []
     for exercise_entity in lesson_exercises:
@@ -1479,13 +1609,13 @@ def change_user_username(db: Session, user: User, new_username: str):
         )
     user.username = new_username
     db.add(user)
+    _mark_progress_changed(db, user.id) # The username is part of the cached progress report
     db.commit()
     db.refresh(user)
     return {"detail": "Nombre de usuario actualizado correctamente"}
 
 
 def change_user_password(db: Session, user: User, current_password: str, new_password: str):
-    from utils import verify_password, get_password_hash
     if not verify_password(current_password, user.hashed_password):
         raise HTTPException(status_code=400, detail="La contraseña actual es incorrecta")
     if verify_password(new_password, user.hashed_password):
@@ -1513,6 +1643,7 @@ def create_user_exam_attempt(db, user_id, exam_id, answers):
         passed=passed
     )
     db.add(attempt)
+    _mark_progress_changed(db, user_id)
     db.commit()
     db.refresh(attempt)
     return attempt
@@ -1552,9 +1683,9 @@ def recalculate_and_update_course_progress(db: Session, user_id: int, course_id:
         logger.warning(f"User ID {user_id}, Course ID {course_id}: No active enrollment found in recalculate_and_update_course_progress.")
         return
 
-    total_lessons = db.query(Lesson).join(Module).filter(Module.course_id == course_id).count()
+    total_lessons = db.query(Lesson).join(Module).filter(Module.course_id == course_id, ACTIVE_MODULE, ACTIVE_LESSON).count()
     completed_lessons_count = db.query(UserLessonProgress).join(Lesson).join(Module).filter(
-        Module.course_id == course_id,
+        Module.course_id == course_id, ACTIVE_MODULE, ACTIVE_LESSON,
         UserLessonProgress.user_id == user_id,
         UserLessonProgress.is_completed == True
     ).count()
@@ -1657,7 +1788,7 @@ def get_or_create_current_exam_exercise(db: Session, user_id: int, course_id: in
     if passed_attempt:
         logger.info(f"User {user_id} is re-entering a passed exam (Attempt ID: {passed_attempt.id}). Returning exercise {passed_attempt.exercise_id} for review.")
         # Return the specific exercise the user passed.
-        return db.query(Exercise).filter(Exercise.id == passed_attempt.exercise_id).first()
+        return db.query(Exercise).options(undefer_group(EXERCISE_BODY)).filter(Exercise.id == passed_attempt.exercise_id).first()
 
     # --- If no passed attempt, proceed with logic for taking the exam ---
 
@@ -1671,7 +1802,7 @@ def get_or_create_current_exam_exercise(db: Session, user_id: int, course_id: in
     # 3. If an attempt exists and is within the failure limit, return its exercise
     if active_attempt and active_attempt.failure_count < EXAM_FAILURE_LIMIT:
         logger.info(f"Returning existing active exam (Exercise ID: {active_attempt.exercise_id}) for User {user_id}.")
-        return db.query(Exercise).filter(Exercise.id == active_attempt.exercise_id).first()
+        return db.query(Exercise).options(undefer_group(EXERCISE_BODY)).filter(Exercise.id == active_attempt.exercise_id).first()
 
     # 4. If attempt exists but has too many failures, deactivate it
     if active_attempt:
@@ -1720,6 +1851,7 @@ def get_or_create_current_exam_exercise(db: Session, user_id: int, course_id: in
         failure_count=0
     )
     db.add(new_attempt)
+    _mark_progress_changed(db, user_id)
     db.commit() # Commit deactivation of old and creation of new
     db.refresh(new_attempt)
     logger.info(f"Created new exam attempt {new_attempt.id} (Exercise ID: {new_exam_exercise_id}) for User {user_id}.")
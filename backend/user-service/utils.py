@@ -1,14 +1,11 @@
-from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 import os
 import redis
 from typing import Optional
-import random
-import string
+import time
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from passwords import password_hasher
 
 # JWT Configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")
@@ -19,56 +16,204 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 525600
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
 REDIS_DB = int(os.getenv("REDIS_DB", "0"))
+REDIS_USER = os.getenv("REDIS_USER", None)
 REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", None)
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
 
-# Initialize Redis client
+
+class MockRedis:
+    """In-memory stand-in used when Redis is unreachable in development. Honours TTLs."""
+
+    def __init__(self):
+        self._store = {}
+        self._expires = {}  # key -> monotonic deadline
+
+    def _alive(self, key) -> bool:
+        deadline = self._expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self._store.pop(key, None)
+            del self._expires[key]
+        return key in self._store
+
+    def set(self, key, value, ex=None):
+        self._store[key] = value
+        self._expires.pop(key, None)
+        if ex is not None:
+            self.expire(key, ex)
+        return True
+
+    def setex(self, key, seconds, value):
+        return self.set(key, value, ex=seconds)
+
+    def get(self, key):
+        return self._store.get(key) if self._alive(key) else None
+
+    def delete(self, *keys):
+        deleted = 0
+        for key in keys:
+            if self._alive(key):
+                del self._store[key]
+                self._expires.pop(key, None)
+                deleted += 1
+        return deleted
+
+    def incr(self, key, amount=1):
+        value = int(self._store[key]) + amount if self._alive(key) else amount
+        self._store[key] = value
+        return value
+
+    def expire(self, key, seconds):
+        if not self._alive(key):
+            return False
+        self._expires[key] = time.monotonic() + int(seconds.total_seconds() if isinstance(seconds, timedelta) else seconds)
+        return True
+
+    def ttl(self, key):
+        if not self._alive(key):
+            return -2
+        deadline = self._expires.get(key)
+        return -1 if deadline is None else max(0, int(round(deadline - time.monotonic())))
+
+    def pipeline(self, transaction=True):
+        return MockPipeline(self)
+
+    def ping(self):
+        return True
+
+
+class MockPipeline:
+    """Queues MockRedis commands and runs them on execute(), like redis-py's Pipeline."""
+
+    def __init__(self, client: MockRedis):
+        self._client = client
+        self._commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+        def queue(*args, **kwargs):
+            self._commands.append((method, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        commands, self._commands = self._commands, []
+        return [method(*args, **kwargs) for method, args, kwargs in commands]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._commands = []
+
+
+# Initialize the Redis client. Every caller in this service (auth, sessions, progress
+# versions, rate limiting, pub/sub) shares this one connection pool.
 try:
-    redis_client = redis.Redis(
+    redis_pool = redis.ConnectionPool(
         host=REDIS_HOST,
         port=REDIS_PORT,
         db=REDIS_DB,
+        username=REDIS_USER,
         password=REDIS_PASSWORD,
         decode_responses=True,
         socket_connect_timeout=5,
         socket_timeout=5,
-        retry_on_timeout=True
+        retry_on_timeout=True,
+        max_connections=REDIS_MAX_CONNECTIONS,
     )
+    redis_client = redis.Redis(connection_pool=redis_pool)
     # Test connection
     redis_client.ping()
     print(f"✅ Redis connected successfully at {REDIS_HOST}:{REDIS_PORT}")
 except redis.ConnectionError as e:
     print(f"❌ Redis connection failed: {e}")
     print("⚠️  Falling back to memory-based session storage")
-    # Create a mock redis client for development
-    class MockRedis:
-        def __init__(self):
-            self._store = {}
-
-        def setex(self, key, seconds, value):
-            self._store[key] = value
-            return True
-
-        def get(self, key):
-            return self._store.get(key)
+    redis_client = MockRedis()
 
-        def delete(self, key):
-            if key in self._store:
-                del self._store[key]
-                return 1
-            return 0
+# --- Per-user progress version ---
+# Bumped whenever a user's progress changes so other services (content-service lock
+# status cache, progress reports) can cheaply tell whether cached data is still valid.
+PROGRESS_VERSION_KEY_PREFIX = "progress_version"
 
-        def ping(self):
-            return True
+def progress_version_key(user_id: int) -> str:
+    return f"{PROGRESS_VERSION_KEY_PREFIX}:{user_id}"
 
-    redis_client = MockRedis()
+def get_progress_version(user_id: int) -> int:
+    """Returns the current progress version for a user (0 if never bumped)."""
+    try:
+        value = redis_client.get(progress_version_key(user_id))
+        return int(value) if value else 0
+    except Exception as e:
+        print(f"⚠️  Could not read progress version for user {user_id}: {e}")
+        return 0
+
+def bump_progress_version(user_id: int) -> None:
+    """Increments the progress version for a user, invalidating progress-derived caches."""
+    try:
+        redis_client.incr(progress_version_key(user_id))
+    except Exception as e:
+        print(f"⚠️  Could not bump progress version for user {user_id}: {e}")
+
+# --- Token namespaces ---
+# Stored tokens live under "token:{generation}:{username}". Bumping the generation
+# (on restart or a mass logout) makes every existing key unreachable at once; the old
+# keys simply expire through their TTL, so nothing has to be scanned or deleted.
+TOKEN_GENERATION_KEY = "token_generation"
+TOKEN_GENERATION_REFRESH_SECONDS = 2.0
+
+_token_generation = {"value": None, "checked_at": 0.0}
+
+def get_token_generation() -> int:
+    """Current token generation, re-read from Redis at most every TOKEN_GENERATION_REFRESH_SECONDS."""
+    now = time.monotonic()
+    if _token_generation["value"] is None or now - _token_generation["checked_at"] >= TOKEN_GENERATION_REFRESH_SECONDS:
+        try:
+            value = redis_client.get(TOKEN_GENERATION_KEY)
+            _token_generation["value"] = int(value) if value else 0
+        except Exception as e:
+            print(f"⚠️  Could not read token generation: {e}")
+            if _token_generation["value"] is None:
+                _token_generation["value"] = 0
+        _token_generation["checked_at"] = now
+    return _token_generation["value"]
+
+def bump_token_generation() -> int:
+    """Invalidates every stored access and refresh token. O(1) regardless of session count."""
+    generation = int(redis_client.incr(TOKEN_GENERATION_KEY))
+    _token_generation["value"] = generation
+    _token_generation["checked_at"] = time.monotonic()
+    return generation
+
+def forget_token_generation() -> None:
+    """Forces the next get_token_generation() to read Redis (another worker bumped it)."""
+    _token_generation["value"] = None
+
+def access_token_key(username: str) -> str:
+    return f"token:{get_token_generation()}:{username}"
+
+def refresh_token_key(username: str) -> str:
+    return f"refresh_token:{get_token_generation()}:{username}"
+
+def store_session_tokens(username: str, access_token: str, access_ttl: timedelta,
+                         refresh_token: Optional[str] = None, refresh_ttl: Optional[timedelta] = None) -> None:
+    """Stores the access token (and optionally the refresh token) in a single round-trip."""
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.setex(access_token_key(username), int(access_ttl.total_seconds()), access_token)
+    if refresh_token is not None:
+        pipe.setex(refresh_token_key(username), int(refresh_ttl.total_seconds()), refresh_token)
+    pipe.execute()
+
+def delete_session_tokens(username: str) -> None:
+    """Removes both stored tokens of a user with one DEL."""
+    redis_client.delete(access_token_key(username), refresh_token_key(username))
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a plain password against a hashed password"""
-    return pwd_context.verify(plain_password, hashed_password)
+    """Verify a plain password against a hashed password (runs on the hashing pool)"""
+    return password_hasher.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    """Hash a password"""
-    return pwd_context.hash(password)
+    """Hash a password (runs on the hashing pool)"""
+    return password_hasher.hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a JWT access token"""
@@ -89,27 +234,3 @@ def decode_access_token(token: str) -> Optional[dict]:
         return payload
     except JWTError:
         return None
-
-def generate_input_from_constraints(constraints: dict) -> str:
-    input_type = constraints.get("type", "string")
-    if input_type == "string":
-        min_len = constraints.get("min_length", 1)
-        max_len = constraints.get("max_length", 10)
-        length = random.randint(min_len, max_len)
-        charset_type = constraints.get("charset", "alphanumeric")
-        char_pool = ""
-        if charset_type == "alpha":
-            char_pool = string.ascii_letters
-        elif charset_type == "alphanumeric":
-            char_pool = string.ascii_letters + string.digits
-        elif charset_type == "numeric":
-            char_pool = string.digits
-        else: # Default to alphanumeric if unknown
-            char_pool = string.ascii_letters + string.digits
-
-        if not char_pool: # Should not happen with defaults
-            return "test"
-        return ''.join(random.choice(char_pool) for _ in range(length))
-    # Extend for other types like "integer" if needed
-    logger.warning(f"Unsupported input generation type: {input_type}. Returning default.")
-    return "default_gen_input"
@@ -112,7 +112,7 @@ export default function ModuleLessonsPage() {
             >
               <div className="font-semibold hover:text-secondary text-xl text-white font-bold p-6">
                 {lesson.title}
-                <p className="text-gray-400 text-base mt-4">{lesson.content?.slice(0, 80)}...</p>
+                <p className="text-gray-400 text-base mt-4">{lesson.summary?.slice(0, 80)}...</p>
               </div>
             </Link>
           ))
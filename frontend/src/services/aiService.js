@@ -34,14 +34,16 @@ export const getCodeHint = async ({ code, error, instruction }) => {
  * @param {string} params.code - The user's code solution
  * @param {string} params.challenge_description - Description of the challenge
  * @param {string} params.level - Difficulty level of feedback (beginner, intermediate, advanced)
+ * @param {string} params.mode - 'full' (rule-based + AI) or 'local_only' (skip the AI for trivial issues)
  * @returns {Promise<Object>} - The AI feedback
  */
-export const getCodeFeedback = async ({ code, challenge_description, level = 'beginner' }) => {
+export const getCodeFeedback = async ({ code, challenge_description, level = 'beginner', mode = 'full' }) => {
   try {
     const response = await apiClient.post('/api/v1/ai/feedback', {
       code,
       challenge_description,
-      level
+      level,
+      mode
     });
     return response.data;
   } catch (error) {